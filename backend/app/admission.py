@@ -0,0 +1,219 @@
+# app/admission.py
+"""
+/api/rag/chat 的准入控制：限制同时在跑的对话数，按用户 / 租户限并发，超出的排队。
+
+- 全局最多 ADMISSION_MAX_ACTIVE 个对话同时执行 (LLM 连接、DB 连接池、沙箱 CPU 都按这个量级准备)
+- 每个用户最多 ADMISSION_PER_USER 个、每个租户最多 ADMISSION_PER_TENANT 个同时执行
+- 排不上的进 FIFO 队列；某个用户自己超限时不挡后面其他人 (不会队头阻塞)
+- 队列满 / 预计等待超过 ADMISSION_MAX_WAIT 秒：开流之前直接 429 (precheck，不占名额)
+- 流开始后才真正排队 (enqueue)，排队请求通过 SSE 推 queue 事件 (位置、预计等待)，
+  排不上 / 真等超时了推 code=429 的 error 事件
+所有状态都只在事件循环里读写，不需要锁；snapshot / gauges 也一样，/api/admission 和 /metrics 因此是 async 接口
+(放到线程池里跑会和 _dispatch / release 并发改 dict)。每个 uvicorn worker 各自一份。
+用户 / 租户标识由 main._identity 决定，默认是调用方自报的，见 TRUSTED_IDENTITY_HEADERS。
+"""
+import os
+import time
+import asyncio
+from collections import Counter as Tally
+from typing import AsyncGenerator, List, Optional
+from dotenv import load_dotenv
+from .telemetry import Counter, Histogram, register_metric, register_collector
+
+load_dotenv()
+
+ADMISSION_DECISIONS = register_metric(Counter("admission_decisions_total", "Admission outcomes by result / reason"))
+ADMISSION_WAIT = register_metric(Histogram("admission_wait_seconds", "Time spent queued before admission"))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class Ticket:
+    __slots__ = ("user", "tenant", "enqueued_at", "admitted_at", "future", "state")
+
+    def __init__(self, user: str, tenant: str):
+        self.user = user
+        self.tenant = tenant
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.future = asyncio.get_running_loop().create_future()
+        # queued -> active -> done (或 queued -> done)
+        self.state = "queued"
+
+
+class AdmissionController:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AdmissionController, cls).__new__(cls)
+            inst = cls._instance
+            inst.max_active = int(os.getenv("ADMISSION_MAX_ACTIVE", 16))
+            inst.max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+            inst.max_wait = float(os.getenv("ADMISSION_MAX_WAIT", 15))
+            inst.per_user = int(os.getenv("ADMISSION_PER_USER", 2))
+            inst.per_user_queued = int(os.getenv("ADMISSION_PER_USER_QUEUED", 4))
+            inst.per_tenant = int(os.getenv("ADMISSION_PER_TENANT", 8))
+            # 排队时多久推一次位置 (位置没变就不推)
+            inst.update_interval = float(os.getenv("ADMISSION_UPDATE_INTERVAL", 1.0))
+            # /metrics 里按租户的 gauge 最多输出多少个租户，其余合并成 tenant="other"，控制标签基数
+            inst.tenant_labels = int(os.getenv("ADMISSION_TENANT_LABELS", 20))
+            inst.active = 0
+            inst.active_by_user = Tally()
+            inst.active_by_tenant = Tally()
+            inst.waiters: List[Ticket] = []
+            # 单个对话平均占用时长 (EWMA)，用来估算排队时间
+            inst.avg_service = float(os.getenv("ADMISSION_EST_SECONDS", 8))
+        return cls._instance
+
+    # ---------------- 排队 / 放行 ----------------
+
+    def _eligible(self, t: Ticket) -> bool:
+        return (self.active < self.max_active
+                and self.active_by_user[t.user] < self.per_user
+                and self.active_by_tenant[t.tenant] < self.per_tenant)
+
+    def _dispatch(self):
+        for t in list(self.waiters):
+            if self.active >= self.max_active:
+                break
+            if self._eligible(t):
+                self.waiters.remove(t)
+                t.state, t.admitted_at = "active", time.monotonic()
+                self.active += 1
+                self.active_by_user[t.user] += 1
+                self.active_by_tenant[t.tenant] += 1
+                ADMISSION_WAIT.observe(t.admitted_at - t.enqueued_at)
+                if not t.future.done():
+                    t.future.set_result(True)
+
+    def estimated_wait(self, position: int) -> float:
+        """前面还有 position 个人时的预计等待秒数 (每 avg_service / max_active 秒平均空出一个名额)"""
+        return (position + 1) * self.avg_service / max(self.max_active, 1) if position >= 0 else 0.0
+
+    def _reject(self, reason: str, retry_after: float, message: str):
+        ADMISSION_DECISIONS.inc(result="rejected", reason=reason)
+        raise AdmissionRejected(reason, retry_after, message)
+
+    def _check_queue(self, user: str):
+        if len(self.waiters) >= self.max_queue:
+            self._reject("queue_full", self.estimated_wait(len(self.waiters)), "Server is busy, please retry later.")
+        if sum(t.user == user for t in self.waiters) >= self.per_user_queued:
+            self._reject("user_queue_full", self.avg_service, "Too many pending requests for this user.")
+
+    def precheck(self, user: str, tenant: str = "default"):
+        """
+        开流之前调用：只判断现在排不排得上，不占名额 (抛 AdmissionRejected -> HTTP 429)。
+        真正的 enqueue 在流开始之后做，响应体没跑起来时不会留下占着名额的 Ticket。
+        """
+        self._check_queue(user)
+        eligible = (self.active < self.max_active and self.active_by_user[user] < self.per_user
+                    and self.active_by_tenant[tenant] < self.per_tenant)
+        if not eligible:
+            wait = self.estimated_wait(len(self.waiters))
+            if wait > self.max_wait:
+                self._reject("wait_too_long", wait, f"Estimated wait {wait:.0f}s exceeds {self.max_wait:.0f}s.")
+
+    def enqueue(self, user: str, tenant: str = "default") -> Ticket:
+        """流开始后调用：能排上就返回 Ticket (可能已直接放行)，否则抛 AdmissionRejected"""
+        self._check_queue(user)
+
+        ticket = Ticket(user, tenant)
+        self.waiters.append(ticket)
+        self._dispatch()
+        if ticket.state == "queued":
+            wait = self.estimated_wait(self.position(ticket))
+            if wait > self.max_wait:
+                self.waiters.remove(ticket)
+                ticket.state = "done"
+                self._reject("wait_too_long", wait, f"Estimated wait {wait:.0f}s exceeds {self.max_wait:.0f}s.")
+        ADMISSION_DECISIONS.inc(result="accepted", reason="immediate" if ticket.state == "active" else "queued")
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        try:
+            return self.waiters.index(ticket)
+        except ValueError:
+            return -1
+
+    async def wait(self, ticket: Ticket) -> AsyncGenerator[dict, None]:
+        """排队期间产出位置更新，放行后结束；等待超过 max_wait 抛 AdmissionRejected"""
+        deadline = ticket.enqueued_at + self.max_wait
+        last = None
+        while ticket.state == "queued":
+            pos = self.position(ticket)
+            if pos != last:
+                last = pos
+                yield {"position": pos + 1, "queued": len(self.waiters),
+                       "estimated_wait_ms": round(self.estimated_wait(pos) * 1000)}
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.release(ticket)
+                self._reject("queue_timeout", self.avg_service, f"Waited more than {self.max_wait:.0f}s in queue.")
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), timeout=min(remaining, self.update_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket: Ticket):
+        """对话结束 / 客户端断开 / 排队超时都调用，可重复调用"""
+        if ticket.state == "queued":
+            if ticket in self.waiters:
+                self.waiters.remove(ticket)
+        elif ticket.state == "active":
+            self.active -= 1
+            self.active_by_user[ticket.user] -= 1
+            self.active_by_tenant[ticket.tenant] -= 1
+            if self.active_by_user[ticket.user] <= 0: del self.active_by_user[ticket.user]
+            if self.active_by_tenant[ticket.tenant] <= 0: del self.active_by_tenant[ticket.tenant]
+            held = time.monotonic() - ticket.admitted_at
+            self.avg_service = 0.9 * self.avg_service + 0.1 * held
+        ticket.state = "done"
+        self._dispatch()
+
+    # ---------------- 观测 ----------------
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "limits": {
+                "max_active": self.max_active, "max_queue": self.max_queue, "max_wait_s": self.max_wait,
+                "per_user": self.per_user, "per_tenant": self.per_tenant,
+            },
+            "avg_service_s": round(self.avg_service, 2),
+            "active_by_tenant": dict(self.active_by_tenant),
+            "queued_by_tenant": dict(Tally(t.tenant for t in self.waiters)),
+            "oldest_wait_s": round(time.monotonic() - self.waiters[0].enqueued_at, 2) if self.waiters else 0.0,
+        }
+
+    def gauges(self) -> list:
+        snap = self.snapshot()
+        samples = [
+            ("admission_active", "Conversations currently executing", {}, snap["active"]),
+            ("admission_queued", "Conversations waiting for a slot", {}, snap["queued"]),
+            ("admission_max_active", "Global concurrency limit", {}, self.max_active),
+            ("admission_max_queue", "Queue capacity", {}, self.max_queue),
+            ("admission_oldest_wait_seconds", "Wait time of the head of the queue", {}, snap["oldest_wait_s"]),
+        ]
+        for tenant, n in self._top_tenants(snap["active_by_tenant"]):
+            samples.append(("admission_tenant_active", "Executing conversations per tenant", {"tenant": tenant}, n))
+        for tenant, n in self._top_tenants(snap["queued_by_tenant"]):
+            samples.append(("admission_tenant_queued", "Queued conversations per tenant", {"tenant": tenant}, n))
+        return samples
+
+    def _top_tenants(self, counts: dict) -> list:
+        """占用最多的 tenant_labels 个租户单独输出，其余合并成 other"""
+        ranked = sorted(counts.items(), key=lambda kv: -kv[1])
+        top, rest = ranked[:self.tenant_labels], ranked[self.tenant_labels:]
+        if rest:
+            top.append(("other", sum(n for _, n in rest)))
+        return top
+
+
+register_collector(lambda: AdmissionController().gauges())
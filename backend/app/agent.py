@@ -1,19 +1,68 @@
+import os
 import json
-from typing import AsyncGenerator, List
+import asyncio
+import time
+from typing import AsyncGenerator, Dict, List, Optional
 from .llm import LLMService
 from .tools import ToolManager
-from .vector_store import VectorStore
-from .sandbox import PythonSandbox
 from .db_guard import SQLGuard
-from .prompt import PromptBuilder
+from .prompt import PromptBuilder, PrefixCache
+from .tool_stream import ToolCallAssembler
+from .vector_service import get_vector_store
+from .token_budget import PromptBudgeter
+from .harvester import SQLHarvester
+from .results import ResultRegistry
+from .session_data import SessionData
+from .intent import IntentRouter, CHAT, ANALYSIS, ANALYSIS_KEYWORDS
+from .telemetry import span, start_span, current_span, Counter, register_metric, LLM_TOKENS, TTFT_SECONDS
+from .cancel import current_scope, guard_stream, ClientDisconnected, CANCELLED_WORK
+from .serialize import RawJSON, dumps_str, prepare
+
+COST_GATE = register_metric(Counter("agent_cost_gate_total",
+                                    "EXPLAIN cost gate decisions (allowed / rejected / fail_open)"))
+
 
 class AgentEngine:
     def __init__(self):
         print("🚀 [Agent] 初始化：Keep Logic & Enable Streaming...")
         self.llm = LLMService()
         self.tools = ToolManager()
-        self.vector_store = VectorStore()
-        self.sandbox = PythonSandbox()
+        # 向量库 (torch/faiss) 和沙箱 (pandas) 首次使用时才加载，进程启动不等它们
+        self._vector_store = None
+        self._sandbox = None
+        self.prefix_cache = PrefixCache()
+        self.budgeter = PromptBudgeter()
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            self._vector_store = get_vector_store()
+        return self._vector_store
+
+    @property
+    def sandbox(self):
+        if self._sandbox is None:
+            from .sandbox import PythonSandbox
+            self._sandbox = PythonSandbox()
+        return self._sandbox
+
+    @staticmethod
+    def _session_key(session_id: Optional[str], user: Optional[str]) -> Optional[str]:
+        """
+        会话键 = 明确的用户标识 + 调用方给的 session_id；缺任何一个都返回 None，
+        不登记会话表、不复用 Prompt 前缀，也就不会跨请求共享。
+        (以前用第一条用户消息做指纹，开场白相同的不同用户会共用一个会话，互相看到对方的表；
+        只按 session_id 时，不同用户带了相同的 id 也会撞上)
+        """
+        if not session_id or not user:
+            return None
+        return f"{user}:{session_id}"
+
+    @staticmethod
+    def _add_usage(total: dict, usage) -> None:
+        for k, v in LLMService.parse_usage(usage).items():
+            total[k] = total.get(k, 0) + v
+            LLM_TOKENS.inc(v, kind=k.replace("_tokens", ""))
 
     # --- 保持你的逻辑不变 ---
     def _extract_previous_data(self, history: List[dict]):
@@ -26,118 +75,377 @@ class AgentEngine:
                 except: continue
         return None
 
-    # --- 保持你的逻辑不变 ---
+    async def _check_cost(self, sql: str):
+        """EXPLAIN 成本闸门，返回 None 表示放行，否则返回拒绝原因"""
+        if os.getenv("SQL_COST_GATE", "1") != "1":
+            return None
+        plan = await asyncio.to_thread(self.tools.explain, sql)
+        if not plan:
+            # EXPLAIN 不可用时放行 (真正执行时报错会进自动修复)，但要留下日志和计数
+            print(f"⚠️ [Cost Gate] EXPLAIN 不可用，未经成本检查放行: {sql[:100]}")
+            COST_GATE.inc(result="fail_open")
+            return None
+        ok, reason = SQLGuard.check_cost(plan, SQLGuard.row_limit(sql))
+        COST_GATE.inc(result="allowed" if ok else "rejected")
+        if not ok:
+            print(f"🛑 [Cost Gate] {reason}")
+        return None if ok else reason
+
+    async def _run_guarded(self, clean_sql: str):
+        """先过 EXPLAIN 成本闸门再执行，结果里带上实际执行的 SQL"""
+        reason = await self._check_cost(clean_sql)
+        if reason:
+            res = {"status": "error", "message": reason}
+        else:
+            # pymysql 是阻塞调用，放到线程池里才能和其它 SQL 并发
+            res = await asyncio.to_thread(self.tools.execute, "execute_sql", {"query": clean_sql})
+        res["sql"] = clean_sql
+        return res
+
     async def _execute_sql_with_retry(self, query: str):
         try:
             clean_sql = SQLGuard.validate(query)
         except ValueError as e:
-            return {"status": "error", "message": str(e)}
+            return {"status": "error", "message": str(e), "sql": query}
 
-        res = self.tools.execute("execute_sql", {"query": clean_sql})
+        # 太重的查询不上生产库，直接带着原因进入修复流程
+        res = await self._run_guarded(clean_sql)
         if res['status'] == 'success': return res
 
         # 失败重试逻辑 (内部调用不用流式，保持 stream=False)
         error_msg = res['message']
+        scope = current_scope()
+        if scope is not None and scope.cancelled:
+            # 客户端已断开 (查询多半是被 KILL 掉的)，不再为它调 LLM 修 SQL
+            CANCELLED_WORK.inc(kind="sql_fix")
+            return res
         print(f"⚠️ [SQL Fail] {error_msg} -> Auto-fixing...")
         
-        fix_prompt = f"SQL: {clean_sql}\nError: {error_msg}\nFix the SQL syntax. Output ONLY SQL."
-        try:
-            resp = await self.llm.chat_completion([
-                {"role": "system", "content": "Output ONLY SQL. No markdown."},
-                {"role": "user", "content": fix_prompt}
-            ], temperature=0.0, stream=False) # 内部修复不流式
-            
-            fixed_sql = resp.choices[0].message.content.strip().replace("```sql", "").replace("```", "")
-            clean_sql = SQLGuard.validate(fixed_sql)
-            return self.tools.execute("execute_sql", {"query": clean_sql})
-        except Exception as e:
-            return {"status": "error", "message": f"Auto-fix failed: {e}"}
+        fix_prompt = f"SQL: {clean_sql}\nError: {error_msg}\nFix the SQL so it runs correctly and efficiently. Output ONLY SQL."
+        with span("agent.sql_fix", error=error_msg[:200]) as sp:
+            try:
+                resp = await self.llm.chat_completion([
+                    {"role": "system", "content": "Output ONLY SQL. No markdown."},
+                    {"role": "user", "content": fix_prompt}
+                ], temperature=0.0, stream=False) # 内部修复不流式
+
+                fixed_sql = resp.choices[0].message.content.strip().replace("```sql", "").replace("```", "")
+                clean_sql = SQLGuard.validate(fixed_sql)
+                res = await self._run_guarded(clean_sql)
+                sp.set(fixed=res['status'] == 'success')
+                return res
+            except Exception as e:
+                sp.set(fixed=False)
+                return {"status": "error", "message": f"Auto-fix failed: {e}", "sql": clean_sql}
+
+    def _start_early(self, tool_calls: List[dict], idx: int, started: Dict[int, "asyncio.Task"],
+                     session_key: Optional[str] = None, record: bool = True):
+        """LLM 还在流式输出时，参数已完整的 execute_sql 先跑起来；图表/Python 依赖数据，留到流结束再调度"""
+        tool_call = tool_calls[idx]
+        if tool_call["function"]["name"] != "execute_sql":
+            return None
+        args = self.tools.parse_args(tool_call["function"]["arguments"])
+        if not args.get("query"):
+            return None
+        print(f"⚡ [Early] SQL #{idx} 参数已完整，提前执行")
+        started[idx] = asyncio.create_task(self._run_sql_tool(idx, args, session_key, record))
+        return {"type": "trace", "data": {"status": "executing", "tool": "execute_sql"}}
+
+    def _schedule_tools(self, tool_calls: List[dict], base_data,
+                        started: Optional[Dict[int, "asyncio.Task"]] = None,
+                        session_key: Optional[str] = None, record: bool = True) -> Dict[int, "asyncio.Task"]:
+        """
+        按依赖关系调度同一轮的工具调用：
+        - execute_sql 立即并发执行 (流式阶段已经启动的直接复用)
+        - query_session_data 等待排在它前面的 SQL (可能要查它们刚登记的表)，本身也算一个数据来源
+        - generate_chart / execute_python 等待排在它前面的 SQL 完成，使用其中最后一个成功的结果
+          (与原来顺序执行时 context_data_buffer 的语义一致)
+        """
+        started = started or {}
+        tasks = {}
+        sql_tasks = []
+        for idx, tool_call in enumerate(tool_calls):
+            func_name = tool_call["function"]["name"]
+            args = self.tools.parse_args(tool_call["function"]["arguments"])
+            if idx in started:
+                task = started[idx]
+                sql_tasks.append(task)
+            elif func_name == "execute_sql":
+                task = asyncio.create_task(self._run_sql_tool(idx, args, session_key, record))
+                sql_tasks.append(task)
+            elif func_name == "query_session_data":
+                task = asyncio.create_task(self._run_session_tool(idx, args, list(sql_tasks), session_key))
+                sql_tasks.append(task)
+            else:
+                task = asyncio.create_task(self._run_data_tool(idx, func_name, args, list(sql_tasks), base_data))
+            tasks[idx] = task
+        return tasks
+
+    async def _run_sql_tool(self, idx: int, args: dict, session_key: Optional[str] = None, record: bool = True):
+        """record=False (批量评测) 时不登记结果：没有 result_id，也不进会话表"""
+        events = []
+        start = time.perf_counter()
+        with span("agent.sql", tool_index=idx) as sp:
+            res = await self._execute_sql_with_retry(args.get("query"))
+            if res['status'] == 'success':
+                sp.set(rows=len(res['data']))
+            else:
+                sp.status = "error"
+                sp.set(error=res['message'][:200])
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        if res['status'] == 'success':
+            data = res['data']
+            summary = f"Query returned {len(data)} rows."
+            # 只推前 50 行预览，完整结果用 result_id 走 /api/results 分页 / 导出
+            result_id = ResultRegistry().register(data, res.get("sql")) if record else None
+            # 同时登记为本会话的表，追问时用 query_session_data 在本地查
+            table = SessionData().add(session_key, result_id, res.get("sql")) if record else None
+            events.append({
+                "type": "table", "data": data[:50], "summary": summary, "result_id": result_id,
+                "sql": res.get("sql"), "rows": len(data), "elapsed_ms": elapsed_ms, "session_table": table
+            })
+            if table:
+                summary += f" Saved as session table {table}."
+            return idx, events, {"status": "success", "message": summary,
+                                   "data": RawJSON(res["raw"]) if "raw" in res else data}, data
+        events.append({"type": "trace", "data": {
+            "status": "error", "tool": "execute_sql", "message": res['message'], "args": {"query": res.get("sql")}
+        }})
+        return idx, events, {"status": "error", "message": res['message']}, None
+
+    async def _run_session_tool(self, idx: int, args: dict, deps: list, session_key: Optional[str]):
+        """query_session_data：在本会话的结果表上跑本地 SQL，不碰生产库"""
+        for dep in deps:
+            await dep
+        with span("agent.session_query") as sp:
+            res = await asyncio.to_thread(SessionData().query, session_key, args.get("query", ""))
+            sp.set(engine=SessionData().engine)
+            if res["status"] != "success":
+                sp.status = "error"
+                return idx, [{"type": "trace", "data": {
+                    "status": "error", "tool": "query_session_data", "message": res["message"],
+                    "args": {"query": args.get("query")}
+                }}], {"status": "error", "message": res["message"]}, None
+            sp.set(rows=len(res["data"]))
+
+        data, raw = prepare(res["data"])
+        summary = f"Query returned {len(data)} rows" + (" (truncated)." if res["truncated"] else ".")
+        result_id = ResultRegistry().register(data, res["sql"])
+        table = SessionData().add(session_key, result_id, res["sql"])
+        if table:
+            summary += f" Saved as session table {table}."
+        events = [{
+            "type": "table", "data": data[:50], "summary": summary, "result_id": result_id, "source": "session",
+            "sql": res["sql"], "rows": len(data), "elapsed_ms": res["elapsed_ms"], "session_table": table
+        }]
+        return idx, events, {"status": "success", "message": summary, "data": RawJSON(raw)}, data
+
+    async def _run_data_tool(self, idx: int, func_name: str, args: dict, deps: list, base_data):
+        events = []
+        data = base_data
+        for dep in deps:
+            _, _, _, dep_data = await dep
+            if dep_data is not None:
+                data = dep_data
 
-    async def run(self, history: List[dict]) -> AsyncGenerator[dict, None]:
+        # 2. Chart (不执行，直接返回前端)
+        if func_name == "generate_chart":
+            if not data:
+                return idx, events, {"status": "error", "message": "No data available."}, None
+            events.append({
+                "type": "chart",
+                "data": data,
+                "config": {
+                    "type": args.get("chart_type", "bar"),
+                    "xKey": args.get("x_key"),
+                    "yKey": args.get("y_key"),
+                    "title": args.get("title", "Chart")
+                }
+            })
+            return idx, events, {"status": "success", "message": "Chart sent to frontend."}, None
+
+        # 3. Python
+        if func_name == "execute_python":
+            if not data:
+                return idx, events, {"status": "error", "message": "No data found."}, None
+            with span("agent.python", rows=len(data)):
+                # 放到线程里跑：不卡事件循环，客户端断开时也能被打断
+                py_res = await asyncio.to_thread(self.sandbox.execute, args.get("code"), data_context=data)
+            if not py_res['success']:
+                return idx, events, {"status": "error", "message": py_res['error']}, None
+            events.append({"type": "text", "content": f"```\n{py_res['stdout']}\n```"})
+            if py_res.get('chart_config'):
+                events.append({"type": "chart", "config": py_res['chart_config']})
+            return idx, events, {"status": "success", "output": py_res['stdout']}, None
+
+        return idx, events, {}, None
+
+    async def run(self, history: List[dict], session_id: Optional[str] = None,
+                  rag_results: Optional[dict] = None, intent: Optional[str] = None,
+                  databases: Optional[List[str]] = None, user: Optional[str] = None,
+                  record: bool = True) -> AsyncGenerator[dict, None]:
+        """
+        user: 明确的用户标识 (匿名请求不传)，会话表 / Prompt 前缀按 用户 + session_id 隔离
+        rag_results: 调用方已经检索好的上下文 (批处理时统一批量检索)，不传则现查
+        intent: 强制指定 DATA / CHAT，不传则由 IntentRouter 按问题向量判断 (CHAT / QUERY / ANALYSIS)
+        databases: 请求方有权访问的库，检索只在这些库的表里找；None 表示不限
+        record: 是否登记查询结果 (/api/results、会话表) 并把成功的 SQL 交给 SQLHarvester 收录；
+            批量评测传 False，评测题不混进 few-shot 示例库，也不占结果缓存
+        """
+        # 整个请求一个根 span；首 token 时间 (TTFT) 在这里统一量
+        with span("agent.run", session=session_id, turns=len(history)) as sp:
+            async for event in self._run(history, session_id, rag_results, intent, databases, user, record):
+                if event["type"] in ("thought", "text") and "ttft_ms" not in sp.attrs:
+                    sp.set(ttft_ms=round(sp.elapsed * 1000, 1))
+                    TTFT_SECONDS.observe(sp.elapsed, intent=sp.attrs.get("intent", ""))
+                elif event["type"] == "usage":
+                    sp.set(**event["data"])
+                yield event
+
+    async def _run(self, history: List[dict], session_id: Optional[str] = None,
+                   rag_results: Optional[dict] = None, intent: Optional[str] = None,
+                   databases: Optional[List[str]] = None, user: Optional[str] = None,
+                   record: bool = True) -> AsyncGenerator[dict, None]:
         last_msg = history[-1]['content']
-        intent = "DATA" if any(k in last_msg for k in ["查", "分析", "图", "数", "多少", "select", "排名"]) else "CHAT"
+        usage_total = {}
+        prev_data = self._extract_previous_data(history)
+        # 本会话之前查出来的结果表 (query_session_data 可以直接在本地查)
+        session_key = self._session_key(session_id, user)
+        session_tables = SessionData().tables(session_key)
+        # 路由时算出的问题向量，检索直接复用
+        q_emb = None
+        if intent is None:
+            with span("agent.route") as sp:
+                decision = IntentRouter().route(last_msg, self.vector_store,
+                                                has_data=bool(prev_data or session_tables))
+                sp.set(**{k: decision[k] for k in ("intent", "confidence", "method", "classify_ms")})
+            intent, q_emb = decision["intent"], decision["embedding"]
+        current_span().set(intent=intent)
 
         # ----------------------------------------------------
         # 场景 1：闲聊模式 (增加流式)
         # ----------------------------------------------------
-        if intent == "CHAT":
+        if intent == CHAT:
             yield {"type": "trace", "data": {"status": "info", "message": "闲聊模式"}}
             
             # 🔥 开启流式
-            stream = await self.llm.chat_completion(history, temperature=0.7, stream=True)
+            llm_span = start_span("agent.llm_stream", round=0)
+            stream = await self.llm.chat_completion(self.budgeter.fit_history(history), temperature=0.7, stream=True)
             
             full_content = ""
-            async for chunk in stream:
-                if chunk.choices:
-                    token = chunk.choices[0].delta.content
-                    if token:
-                        full_content += token
-                        # 🔥 实时吐字
-                        yield {"type": "text", "content": token}
+            try:
+                async with guard_stream(stream) as scope:
+                    async for chunk in stream:
+                        if scope is not None: scope.check()
+                        if getattr(chunk, "usage", None):
+                            self._add_usage(usage_total, chunk.usage)
+                        if chunk.choices:
+                            token = chunk.choices[0].delta.content
+                            if token:
+                                full_content += token
+                                # 🔥 实时吐字
+                                yield {"type": "text", "content": token}
+            finally:
+                llm_span.end()
+            if usage_total:
+                print(f"💰 [Usage] prompt={usage_total.get('prompt_tokens', 0)}, cache_hit={usage_total.get('cached_tokens', 0)}")
+                yield {"type": "usage", "data": usage_total}
             return
 
         # ----------------------------------------------------
         # 场景 2：数据模式 (RAG + 工具 + 流式)
         # ----------------------------------------------------
-        prev_data = self._extract_previous_data(history)
         context_data_buffer = prev_data if prev_data else []
-        tools = self.tools.get_definitions()
+        tools = self.tools.get_definitions(with_session_data=bool(session_tables))
+        window = self.budgeter.fit_history(history)
         
-        if context_data_buffer and any(k in last_msg for k in ["分析", "画", "图", "解释"]):
+        # 调用方强制 DATA 时，是否为分析仍按关键词判断
+        analysis = intent == ANALYSIS or (intent == "DATA" and any(k in last_msg for k in ANALYSIS_KEYWORDS))
+        if analysis and not context_data_buffer and session_tables:
+            # 前端没回传 tool 消息时，用本会话最近一张结果表当 df
+            context_data_buffer = await asyncio.to_thread(SessionData().latest_rows, session_key) or []
+        if context_data_buffer and analysis:
             print("🧠 [Mode] Analysis")
             prompt = PromptBuilder.build_analysis_prompt(json.dumps(context_data_buffer[:3], ensure_ascii=False), len(context_data_buffer))
             tools = [t for t in tools if t['function']['name'] != 'execute_sql']
         else:
             print("🧠 [Mode] RAG Query")
-            rag_results = self.vector_store.retrieve(last_msg, top_k=8)
-            prompt = PromptBuilder.build_system_prompt(rag_results)
+            if rag_results is None:
+                with span("agent.retrieve"):
+                    if q_emb is not None:
+                        rag_results = self.vector_store.retrieve_by_embedding(q_emb, top_k=8, databases=databases)
+                    else:
+                        rag_results = self.vector_store.retrieve(last_msg, top_k=8, databases=databases)
+            # 预算 = 静态前缀 + 工具定义 + 历史窗口，剩下的留给检索上下文
+            counter = self.budgeter.counter
+            reserved = (counter.count(PromptBuilder.STATIC_PREFIX) + counter.count(json.dumps(tools, ensure_ascii=False))
+                        + counter.count_messages(window))
+            rag_results = self.budgeter.fit_context(rag_results, reserved)
+            ddl_order = self.prefix_cache.order(
+                session_key, rag_results.get('ddl', []),
+                fits=lambda ddls: self.budgeter.fits(rag_results, ddls, reserved)
+            )
+            if databases is not None:
+                # 会话里沿用的旧表也要符合本次请求的库范围
+                allowed = {d.lower() for d in databases}
+                ddl_order = [d for d in ddl_order if PromptBuilder.ddl_key(d).split(".")[0] in allowed]
+            profiles = self.budgeter.fit_profiles(
+                rag_results.get('profiles'), ddl_order,
+                self.budgeter.budget - reserved - self.budgeter.context_tokens(rag_results, ddl_order)
+            )
+            prompt = PromptBuilder.build_system_prompt(rag_results, ddl_order=ddl_order, profiles=profiles)
+        prompt += PromptBuilder.build_session_tables(session_tables, SessionData().engine)
 
-        msgs = [{"role": "system", "content": prompt}] + history[-5:]
+        msgs = [{"role": "system", "content": prompt}] + window
 
         # 3轮交互 Loop
+        scope = current_scope()
         for i in range(3):
+            # 客户端已断开就不再发起新一轮 LLM 调用
+            if scope is not None: scope.check()
             yield {"type": "trace", "data": {"status": "thinking", "message": "思考中..."}}
             
-            # 🔥 开启流式
+            # 🔥 开启流式 (流式阶段跨 yield，手动结束 span)
+            llm_span = start_span("agent.llm_stream", round=i, messages=len(msgs))
             stream = await self.llm.chat_completion(msgs, tools=tools, temperature=0.0, stream=True)
             
             full_content = ""
-            tool_calls_buffer = []
-            current_tool_index = -1
-            
-            # 🔥 逐块接收并处理
-            async for chunk in stream:
-                if not chunk.choices: continue
-                delta = chunk.choices[0].delta
-
-                # A. 文本内容 -> 实时发给前端 (Thought)
-                if delta.content:
-                    token = delta.content
-                    full_content += token
-                    yield {"type": "thought", "content": token}
-
-                # B. 工具调用 -> 必须拼接碎片 (不能直接发)
-                if delta.tool_calls:
-                    for tool_delta in delta.tool_calls:
-                        index = tool_delta.index
-                        
-                        # 新工具开始
-                        if index > current_tool_index:
-                            tool_calls_buffer.append({
-                                "id": tool_delta.id,
-                                "type": "function",
-                                "function": {
-                                    "name": tool_delta.function.name,
-                                    "arguments": ""
-                                }
-                            })
-                            current_tool_index = index
-                        
-                        # 拼接参数
-                        if tool_delta.function.arguments:
-                            tool_calls_buffer[index]["function"]["arguments"] += tool_delta.function.arguments
-
-            # --- 流式接收完毕，开始执行逻辑 (和原来一样) ---
+            assembler = ToolCallAssembler()
+            tool_calls_buffer = assembler.calls
+            # 流式过程中已经提前启动的 SQL (下标 -> Task)
+            started = {}
+
+            try:
+                # 🔥 逐块接收并处理 (客户端断开时 guard_stream 关掉上游，不再为没人看的输出付费)
+                async with guard_stream(stream) as scope:
+                    async for chunk in stream:
+                        if scope is not None: scope.check()
+                        if getattr(chunk, "usage", None):
+                            self._add_usage(usage_total, chunk.usage)
+                        if not chunk.choices: continue
+                        delta = chunk.choices[0].delta
+
+                        # A. 文本内容 -> 实时发给前端 (Thought)
+                        if delta.content:
+                            token = delta.content
+                            full_content += token
+                            yield {"type": "thought", "content": token}
+
+                        # B. 工具调用 -> 拼接碎片，参数 JSON 一闭合就开跑 SQL (和 LLM 继续生成重叠)
+                        if delta.tool_calls:
+                            for idx in assembler.feed(delta.tool_calls):
+                                event = self._start_early(tool_calls_buffer, idx, started, session_key, record)
+                                if event: yield event
+                assembler.finish()
+            except BaseException as e:
+                for task in started.values():
+                    task.cancel()
+                llm_span.end(status="cancelled" if isinstance(e, (asyncio.CancelledError, ClientDisconnected)) else "error")
+                raise
+            llm_span.set(tool_calls=len(tool_calls_buffer), early_started=len(started))
+            llm_span.end()
+
+            # --- 流式接收完毕，执行剩下的工具 ---
             
             if not tool_calls_buffer:
                 if full_content:
@@ -151,59 +459,39 @@ class AgentEngine:
                 "tool_calls": tool_calls_buffer
             })
 
-            for tool_call in tool_calls_buffer:
-                func_name = tool_call["function"]["name"]
-                args = self.tools.parse_args(tool_call["function"]["arguments"])
-                
-                yield {"type": "trace", "data": {"status": "executing", "tool": func_name}}
-                
-                tool_result = {}
-
-                # 1. SQL
-                if func_name == "execute_sql":
-                    res = await self._execute_sql_with_retry(args.get("query"))
-                    if res['status'] == 'success':
-                        data = res['data']
-                        context_data_buffer = data
-                        summary = f"Query returned {len(data)} rows."
-                        yield {"type": "table", "data": data[:50], "summary": summary}
-                        tool_result = {"status": "success", "message": summary, "data": data}
-                    else:
-                        tool_result = {"status": "error", "message": res['message']}
-                
-                # 2. Chart (不执行，直接返回前端)
-                elif func_name == "generate_chart":
-                    if not context_data_buffer:
-                        tool_result = {"status": "error", "message": "No data available."}
-                    else:
-                        yield {
-                            "type": "chart",
-                            "data": context_data_buffer,
-                            "config": {
-                                "type": args.get("chart_type", "bar"),
-                                "xKey": args.get("x_key"),
-                                "yKey": args.get("y_key"),
-                                "title": args.get("title", "Chart")
-                            }
-                        }
-                        tool_result = {"status": "success", "message": "Chart sent to frontend."}
-
-                # 3. Python
-                elif func_name == "execute_python":
-                    if not context_data_buffer:
-                        tool_result = {"status": "error", "message": "No data found."}
-                    else:
-                        py_res = self.sandbox.execute(args.get("code"), data_context=context_data_buffer)
-                        if py_res['success']:
-                            tool_result = {"status": "success", "output": py_res['stdout']}
-                            yield {"type": "text", "content": f"```\n{py_res['stdout']}\n```"}
-                            if py_res.get('chart_config'):
-                                 yield {"type": "chart", "config": py_res['chart_config']}
-                        else:
-                            tool_result = {"status": "error", "message": py_res['error']}
+            # 🔥 并发执行：SQL 之间互不依赖，全部同时跑；图表/Python 只等排在它前面的 SQL
+            for idx, tool_call in enumerate(tool_calls_buffer):
+                if idx not in started:
+                    yield {"type": "trace", "data": {"status": "executing", "tool": tool_call["function"]["name"]}}
 
+            tasks = self._schedule_tools(tool_calls_buffer, context_data_buffer, started, session_key, record)
+            results = {}
+            tools_span = start_span("agent.tools", round=i, count=len(tasks))
+            try:
+                for fut in asyncio.as_completed(list(tasks.values())):
+                    idx, events, tool_result, data = await fut
+                    results[idx] = (tool_result, data)
+                    # 谁先完成谁先推给前端
+                    for event in events:
+                        if record and event["type"] == "table" and event.get("source") != "session":
+                            # 成功的 SQL 异步收录为 few-shot 示例 (只入队，不阻塞；本地会话查询不收录)
+                            SQLHarvester().submit(last_msg, event["sql"], True, event["elapsed_ms"], event["rows"])
+                        yield event
+            finally:
+                for task in tasks.values():
+                    if not task.done(): task.cancel()
+                tools_span.end()
+
+            for idx, tool_call in enumerate(tool_calls_buffer):
+                tool_result, data = results[idx]
+                if data is not None:
+                    context_data_buffer = data
                 msgs.append({
                     "role": "tool",
                     "tool_call_id": tool_call["id"],
-                    "content": json.dumps(tool_result, ensure_ascii=False)
-                })
\ No newline at end of file
+                    "content": dumps_str(tool_result)
+                })
+
+        if usage_total:
+            print(f"💰 [Usage] prompt={usage_total.get('prompt_tokens', 0)}, cache_hit={usage_total.get('cached_tokens', 0)}")
+            yield {"type": "usage", "data": usage_total}
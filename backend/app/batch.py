@@ -0,0 +1,190 @@
+# app/batch.py
+"""
+批量问答：离线评测准确率 / 用高频业务问题预热缓存。
+不走 SSE，直接在进程内消费 AgentEngine.run 的事件；检索按批统一 encode。
+
+命令行 (backend 目录下)：
+    python -m app.batch questions.jsonl results.jsonl --concurrency 8
+输入每行：{"id": "q1", "question": "上个月各车型销量排名"}  (id 可省略)
+输出每行：id、question、sql、status、rows、columns、latency_ms、ttft_ms、usage、answer、error
+缺 question / 不是合法 JSON 的行只输出一条 status=invalid 的记录，不影响其它问题
+
+通过 /api/rag/batch 调用时传 principal：每个问题和交互式对话一样先经 AdmissionController 拿名额，
+批量任务不会绕开全局 / 用户 / 租户并发上限；排不上 (429) 就按 retry_after 退避后重试。
+批量跑的结果不登记 /api/results、不交给 SQLHarvester 收录 (engine.run(record=False))。
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from .admission import AdmissionController, AdmissionRejected
+
+
+class BatchRunner:
+    # 一次批量检索的问题数 (encode 的 batch)
+    RETRIEVE_CHUNK = 256
+
+    def __init__(self, engine=None, concurrency: int = 8, databases: Optional[List[str]] = None,
+                 principal: Optional[Tuple[str, str]] = None):
+        if engine is None:
+            from .agent import AgentEngine
+            engine = AgentEngine()
+        self.engine = engine
+        self.concurrency = concurrency
+        # 只在这些库的表里检索 (None 不限)
+        self.databases = databases
+        # (user, tenant)：不为空时每个问题都走准入控制；命令行离线跑不传
+        self.principal = principal
+
+    @staticmethod
+    def _record(item: dict) -> dict:
+        return {
+            "id": item.get("id"), "question": item.get("question"), "sql": [], "status": "success",
+            "rows": None, "columns": [], "latency_ms": None, "ttft_ms": None,
+            "usage": {}, "answer": "", "error": None,
+        }
+
+    @staticmethod
+    def _invalid_reason(item) -> Optional[str]:
+        if not isinstance(item, dict):
+            return "item must be a JSON object"
+        if item.get("_invalid"):
+            return item["_invalid"]
+        question = item.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return "question must be a non-empty string"
+        return None
+
+    async def _run_one(self, item: dict, rag_results: dict) -> dict:
+        question = item["question"]
+        record = self._record(item)
+        start = time.perf_counter()
+        try:
+            history = [{"role": "user", "content": question}]
+            async for event in self.engine.run(history, rag_results=rag_results, intent="DATA",
+                                              databases=self.databases, record=False):
+                etype = event.get("type")
+                if etype in ("thought", "text") and record["ttft_ms"] is None:
+                    record["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                if etype == "table":
+                    record["sql"].append(event.get("sql"))
+                    record["rows"] = event.get("rows", len(event["data"]))
+                    record["columns"] = list(event["data"][0].keys()) if event.get("data") else []
+                elif etype == "trace" and event["data"].get("status") == "error":
+                    record["sql"].append((event["data"].get("args") or {}).get("query"))
+                    record["error"] = event["data"].get("message")
+                elif etype == "text":
+                    record["answer"] += event.get("content", "")
+                elif etype == "usage":
+                    record["usage"] = event["data"]
+            if record["rows"] is None:
+                record["status"] = "error" if record["error"] else "no_sql"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+        record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+
+    async def _admit(self):
+        """拿到一个准入名额才返回；队列满 / 预计等太久就按 retry_after 退避重试，不算这道题失败"""
+        admission = AdmissionController()
+        while True:
+            ticket = None
+            try:
+                ticket = admission.enqueue(*self.principal)
+                async for _ in admission.wait(ticket):
+                    pass
+                return ticket
+            except AdmissionRejected as e:
+                await asyncio.sleep(e.retry_after)
+            except BaseException:
+                if ticket is not None:
+                    admission.release(ticket)
+                raise
+
+    async def run(self, items: List[dict]) -> AsyncGenerator[dict, None]:
+        """按完成顺序产出每个问题的结果，并发数受 concurrency 控制"""
+        sem = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def worker(item, rag):
+            async with sem:
+                if self.principal is None:
+                    return await self._run_one(item, rag)
+                ticket = await self._admit()
+                try:
+                    return await self._run_one(item, rag)
+                finally:
+                    AdmissionController().release(ticket)
+
+        valid = []
+        for item in items:
+            reason = self._invalid_reason(item)
+            if reason is None:
+                valid.append(item)
+                continue
+            # 坏数据单独报一条，不让一个 KeyError 把整批打断
+            record = self._record(item if isinstance(item, dict) else {})
+            record.update(status="invalid", error=reason)
+            yield record
+
+        for offset in range(0, len(valid), self.RETRIEVE_CHUNK):
+            chunk = valid[offset:offset + self.RETRIEVE_CHUNK]
+            # 同一批问题一次 encode + 检索
+            rags = await loop.run_in_executor(
+                None, lambda: self.engine.vector_store.retrieve_batch(
+                    [i["question"] for i in chunk], 8, databases=self.databases)
+            )
+            tasks = [asyncio.create_task(worker(item, rag)) for item, rag in zip(chunk, rags)]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    yield await fut
+            finally:
+                # 客户端断开：没跑完的取消掉，占着的名额在 worker 的 finally 里归还
+                for task in tasks:
+                    if not task.done(): task.cancel()
+
+
+def load_questions(path: str) -> List[dict]:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line: continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                item = {"_invalid": f"invalid JSON on line {n + 1}: {e}"}
+            if not isinstance(item, dict):
+                item = {"_invalid": f"line {n + 1} is not a JSON object"}
+            item.setdefault("id", n)
+            items.append(item)
+    return items
+
+
+async def run_file(in_path: str, out_path: str, concurrency: int = 8):
+    items = load_questions(in_path)
+    print(f"📦 [Batch] {len(items)} questions, concurrency={concurrency}")
+    runner = BatchRunner(concurrency=concurrency)
+    done = ok = 0
+    start = time.perf_counter()
+    with open(out_path, "w", encoding="utf-8") as f:
+        async for record in runner.run(items):
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            done += 1
+            ok += record["status"] == "success"
+            if done % 20 == 0 or done == len(items):
+                print(f"  ...{done}/{len(items)} done ({ok} success)")
+    print(f"✅ [Batch] 完成，耗时 {time.perf_counter() - start:.1f}s -> {out_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch question-to-SQL runner")
+    parser.add_argument("input", help="JSONL, one {\"id\", \"question\"} per line")
+    parser.add_argument("output", help="JSONL results")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run_file(args.input, args.output, args.concurrency))
@@ -0,0 +1,144 @@
+# app/cancel.py
+"""
+请求级取消：SSE 客户端断开 (关标签页) 之后，把这个请求还在跑的活停掉，不再白白消耗 token / DB / CPU。
+
+asyncio 这一侧靠任务取消自然传播 (CancelledError / ClientDisconnected)，但有几类活协程取消停不掉：
+- LLM 流：不主动关，上游会一直生成到结束 -> 关掉 HTTP 响应
+- SQL：pymysql 在线程里阻塞等结果 -> 另开一条连接 KILL QUERY <thread_id>
+- Python 沙箱：exec 在线程里跑 -> 往该线程注入 SandboxCancelled
+这些活开工前把"怎么停"登记到当前请求的 CancelScope，干完注销；scope.cancel() 时逐个触发。
+CancelScope 放在 contextvar 里，asyncio.create_task / asyncio.to_thread 会自动带过去。
+"""
+import asyncio
+import contextvars
+import ctypes
+import threading
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+from .telemetry import Counter, register_metric
+
+CANCELLED_WORK = register_metric(Counter("agent_cancelled_work_total",
+                                         "Work stopped early because the client went away"))
+
+
+class ClientDisconnected(Exception):
+    """请求已被取消 (客户端断开)，Agent 各阶段据此提前退出"""
+
+
+class CancelScope:
+    def __init__(self):
+        self.cancelled = False
+        self.reason = None
+        self._callbacks = {}
+        self._seq = 0
+        # 回调在锁内执行：unregister 返回之后，对应的回调要么已经跑完，要么永远不会再跑
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, fn: Callable[[], None]) -> Optional[int]:
+        """登记一个停止动作 (kind 用作指标标签)；已经取消时返回 None，调用方不应再开工"""
+        with self._lock:
+            if self.cancelled:
+                return None
+            self._seq += 1
+            self._callbacks[self._seq] = (kind, fn)
+            return self._seq
+
+    def unregister(self, key: Optional[int]) -> bool:
+        """活干完了注销；返回 False 表示停止动作已经被触发过 (或从未登记)"""
+        if key is None:
+            return False
+        with self._lock:
+            return self._callbacks.pop(key, None) is not None
+
+    def cancel(self, reason: str = "client_disconnected") -> bool:
+        """触发所有停止动作，可重复调用；回调必须很快返回 (会在事件循环里执行)"""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancelled, self.reason = True, reason
+            pending = list(self._callbacks.values())
+            self._callbacks.clear()
+            for kind, fn in pending:
+                try:
+                    fn()
+                    CANCELLED_WORK.inc(kind=kind)
+                except Exception as e:
+                    print(f"⚠️ [Cancel] 停止 {kind} 失败: {e}")
+        CANCELLED_WORK.inc(kind="request")
+        print(f"🛑 [Cancel] {reason}: 停止了 {len(pending)} 项执行中的工作")
+        return True
+
+    def check(self):
+        if self.cancelled:
+            raise ClientDisconnected(self.reason)
+
+
+_current = contextvars.ContextVar("cancel_scope", default=None)
+
+
+def current_scope() -> Optional[CancelScope]:
+    return _current.get()
+
+
+def bind_scope(scope: CancelScope):
+    return _current.set(scope)
+
+
+def unbind_scope(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # 异步生成器可能在别的上下文里被回收
+        pass
+
+
+def interrupt_thread(ident: int, exc_type: type) -> bool:
+    """在线程 ident 下一次执行 Python 字节码时抛出 exc_type (阻塞在 C 代码里时要等它返回)"""
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(exc_type)) == 1
+
+
+async def _aclose(stream):
+    try:
+        # 外层可能已经处于取消状态，shield 保证关闭动作本身能做完
+        await asyncio.shield(asyncio.ensure_future(stream.close()))
+    except BaseException:
+        pass
+
+
+@asynccontextmanager
+async def guard_stream(stream):
+    """
+    包住一次 LLM 流的消费：
+    - 客户端断开 (scope.cancel) 时立即关掉上游连接，正在读的循环随之结束并抛 ClientDisconnected
+    - 消费方因取消 / 异常提前退出时同样关掉上游，否则要等 GC 才断开，期间 token 照算
+    """
+    scope = current_scope()
+    if scope is not None:
+        scope.check()
+    key = scope.register("llm_stream", lambda: asyncio.ensure_future(stream.close())) if scope else None
+    try:
+        yield scope
+    except BaseException as e:
+        cancelled = isinstance(e, (asyncio.CancelledError, GeneratorExit, ClientDisconnected)) or \
+            (scope is not None and scope.cancelled)
+        # unregister 成功说明停止回调没跑过，这里自己关
+        if key is None or scope.unregister(key):
+            if cancelled:
+                CANCELLED_WORK.inc(kind="llm_stream")
+            await _aclose(stream)
+        if scope is not None and scope.cancelled and isinstance(e, Exception) and not isinstance(e, ClientDisconnected):
+            # 上游连接被我们关掉后读循环抛出的网络错误，统一成取消
+            raise ClientDisconnected(scope.reason) from e
+        raise
+    else:
+        if scope is not None:
+            scope.unregister(key)
+
+
+async def watch_disconnect(request, scope: CancelScope, interval: float = 0.5):
+    """轮询 request.is_disconnected()，断开后取消整个请求"""
+    while not scope.cancelled:
+        if await request.is_disconnected():
+            scope.cancel("client_disconnected")
+            return
+        await asyncio.sleep(interval)
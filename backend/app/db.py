@@ -1,5 +1,8 @@
 # app/db.py
 import os
+import json
+import time
+import threading
 import pymysql
 from dbutils.pooled_db import PooledDB
 from dotenv import load_dotenv
@@ -7,6 +10,80 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+class PoolStats:
+    """单个连接池的运行指标：等待时间、占用数，用来给连接池定容量"""
+
+    def __init__(self, host: str, db_name: str, max_connections: int):
+        self.host = host
+        self.db_name = db_name
+        self.max_connections = max_connections
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def acquired(self, waited: float):
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.acquires += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def released(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "host": self.host,
+                "database": self.db_name,
+                "max_connections": self.max_connections,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "utilization": round(self.in_use / self.max_connections, 3) if self.max_connections else 0,
+                "acquires": self.acquires,
+                "wait_avg_ms": round(self.wait_total / self.acquires * 1000, 2) if self.acquires else 0,
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+            }
+
+
+class TrackedConnection:
+    """包一层池化连接：close() 时归还计数；host 用于定位查询实际跑在哪台机器上"""
+
+    def __init__(self, conn, stats: PoolStats, port: int = None):
+        self._conn = conn
+        self._stats = stats
+        self._closed = False
+        self.host = stats.host
+        self.port = port
+
+    def thread_id(self):
+        """MySQL 侧的连接 ID (KILL QUERY 用)；穿过 DBUtils 的包装拿到底层 pymysql 连接"""
+        raw = self._conn
+        while not hasattr(raw, "server_thread_id") and hasattr(raw, "_con"):
+            raw = raw._con
+        return raw.thread_id() if hasattr(raw, "server_thread_id") else None
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._stats.released()
+            self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
 class DBManager:
     _instance = None
     # 排除系统库，加快扫描速度
@@ -19,6 +96,8 @@ class DBManager:
         if cls._instance is None:
             cls._instance = super(DBManager, cls).__new__(cls)
             cls._instance.pools = {}
+            cls._instance.pool_stats = {}
+            cls._instance._pool_lock = threading.Lock()
             cls._instance.conn_params = {
                 'host': os.getenv("DB_HOST"),
                 'port': int(os.getenv("DB_PORT", 3306)),
@@ -27,6 +106,33 @@ class DBManager:
                 'cursorclass': pymysql.cursors.DictCursor,
                 'connect_timeout': 3  # 3秒连不上就跳过
             }
+            # 连接池大小：全局默认 + 按库覆盖 (DB_POOL_CONFIG='{"lpcarnet": {"max": 10, "mincached": 2}}')
+            cls._instance.pool_defaults = {
+                'max': int(os.getenv("DB_POOL_MAX", 5)),
+                'mincached': int(os.getenv("DB_POOL_MINCACHED", 1)),
+                'maxcached': int(os.getenv("DB_POOL_MAXCACHED", 0)),
+            }
+            try:
+                cls._instance.pool_overrides = json.loads(os.getenv("DB_POOL_CONFIG", "") or "{}")
+            except ValueError:
+                print("⚠️ [DB] DB_POOL_CONFIG 不是合法 JSON，忽略")
+                cls._instance.pool_overrides = {}
+
+            # 只读副本：DB_REPLICA_HOSTS=10.0.0.2:3306,10.0.0.3
+            cls._instance.replicas = []
+            for item in os.getenv("DB_REPLICA_HOSTS", "").split(","):
+                item = item.strip()
+                if not item: continue
+                host, _, port = item.partition(":")
+                cls._instance.replicas.append({
+                    "host": host, "port": int(port or cls._instance.conn_params['port']),
+                    "healthy": False, "lag": None, "checked_at": 0.0
+                })
+            cls._instance.replica_max_lag = float(os.getenv("DB_REPLICA_MAX_LAG", 30))
+            cls._instance.replica_check_interval = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 10))
+            # 首次健康检查放到后台线程：副本连不上时不能卡住导入 / 第一个请求，检查完成前一律按不健康走主库
+            if cls._instance.replicas:
+                threading.Thread(target=cls._instance._replica_health_loop, daemon=True).start()
             # 初始化不阻塞，按需获取
         return cls._instance
 
@@ -47,13 +153,112 @@ class DBManager:
             print(f"❌ [DB] 获取库列表失败: {e}")
             return []
 
-    def get_connection(self, db_name: str):
-        if db_name not in self.pools:
-            self.pools[db_name] = PooledDB(
-                creator=pymysql, maxconnections=5, mincached=1, blocking=True,
-                database=db_name, **self.conn_params
-            )
-        return self.pools[db_name].connection()
+    def _replica_status(self, replica: dict):
+        """返回复制延迟 (秒)；复制线程停止或连不上时返回 None"""
+        params = dict(self.conn_params, host=replica["host"], port=replica["port"])
+        conn = pymysql.connect(**params)
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.MySQLError:
+                    # MySQL < 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+                return float(lag) if lag is not None else None
+        finally:
+            conn.close()
+
+    def _check_replicas(self):
+        for replica in self.replicas:
+            try:
+                lag = self._replica_status(replica)
+            except Exception as e:
+                lag = None
+                print(f"⚠️ [DB] Replica {replica['host']} 健康检查失败: {e}")
+            was_healthy = replica["healthy"]
+            replica["lag"] = lag
+            replica["healthy"] = lag is not None and lag <= self.replica_max_lag
+            replica["checked_at"] = time.time()
+            if was_healthy != replica["healthy"]:
+                print(f"🔁 [DB] Replica {replica['host']} healthy={replica['healthy']} lag={lag}")
+
+    def _replica_health_loop(self):
+        while True:
+            self._check_replicas()
+            time.sleep(self.replica_check_interval)
+
+    def _pick_host(self, db_name: str, readonly: bool):
+        """只读查询走延迟最低的健康副本 (同延迟选池子更空的)，没有可用副本时回落主库"""
+        primary = (self.conn_params['host'], self.conn_params['port'])
+        if not readonly:
+            return primary
+        healthy = [r for r in self.replicas if r["healthy"]]
+        if not healthy:
+            return primary
+
+        def load(r):
+            stats = self.pool_stats.get((r["host"], r["port"], db_name))
+            return stats.in_use / stats.max_connections if stats and stats.max_connections else 0
+
+        best = min(healthy, key=lambda r: (r["lag"], load(r)))
+        return best["host"], best["port"]
+
+    def _pool_config(self, db_name: str) -> dict:
+        cfg = dict(self.pool_defaults)
+        cfg.update(self.pool_overrides.get(db_name, {}))
+        return cfg
+
+    def get_connection(self, db_name: str, readonly: bool = False):
+        """
+        readonly=True：Agent 生成的查询，允许路由到只读副本
+        返回的连接用完必须 close()，否则占用计数不会归还
+        """
+        host, port = self._pick_host(db_name, readonly)
+        key = (host, port, db_name)
+        if key not in self.pools:
+            with self._pool_lock:
+                if key not in self.pools:
+                    cfg = self._pool_config(db_name)
+                    params = dict(self.conn_params, host=host, port=port)
+                    self.pool_stats[key] = PoolStats(host, db_name, cfg['max'])
+                    self.pools[key] = PooledDB(
+                        creator=pymysql, maxconnections=cfg['max'], mincached=cfg['mincached'],
+                        maxcached=cfg['maxcached'], blocking=True, database=db_name, **params
+                    )
+
+        start = time.perf_counter()
+        conn = self.pools[key].connection()
+        stats = self.pool_stats[key]
+        stats.acquired(time.perf_counter() - start)
+        return TrackedConnection(conn, stats, port)
+
+    def kill_query(self, conn, thread_id: int):
+        """
+        另开一条直连 (不占连接池) 到 conn 所在的机器，KILL QUERY 打断它正在跑的语句。
+        只杀语句不杀连接，被打断的连接照常归还连接池。
+        """
+        params = dict(self.conn_params, host=conn.host, port=conn.port or self.conn_params['port'])
+        killer = pymysql.connect(**params)
+        try:
+            with killer.cursor() as cursor:
+                cursor.execute(f"KILL QUERY {int(thread_id)}")
+            print(f"🔪 [DB] KILL QUERY {thread_id} @ {conn.host}")
+        finally:
+            killer.close()
+
+    def get_pool_stats(self) -> dict:
+        """连接池 + 副本状态快照，/api/db/pools 直接返回"""
+        return {
+            "pools": [s.snapshot() for s in list(self.pool_stats.values())],
+            "replicas": [
+                {"host": r["host"], "port": r["port"], "healthy": r["healthy"], "lag": r["lag"]}
+                for r in self.replicas
+            ],
+        }
 
     def get_all_tables_metadata(self) -> list:
         """
@@ -70,42 +275,50 @@ class DBManager:
 
             try:
                 conn = self.get_connection(db_name)
-                with conn.cursor() as cursor:
-                    cursor.execute("SET SESSION wait_timeout=5")
-                    cursor.execute("SHOW TABLES")
-                    tables = [list(r.values())[0] for r in cursor.fetchall()]
-
-                    if not tables:
-                        print(" (Empty)")
-                        continue
-
-                    # 为了演示速度，这里只扫每个库前 50 张表
-                    # 生产环境请去掉 [:50]
-                    scan_limit = tables[:50]
-
-                    for table in scan_limit:
-                        try:
-                            # 获取建表语句 (这是 LLM 最爱吃的格式)
-                            cursor.execute(f"SHOW CREATE TABLE `{table}`")
-                            res = cursor.fetchone()
-                            if res:
-                                ddl_str = list(res.values())[1]
-                                # 获取列名用于 embedding
-                                cursor.execute(f"DESCRIBE `{table}`")
-                                cols = [row['Field'] for row in cursor.fetchall()]
-
-                                results.append({
-                                    "database": db_name,
-                                    "table": table,
-                                    "columns": ",".join(cols),
-                                    "ddl_str": ddl_str
-                                })
-                        except:
+                # 空库 continue、中途出错都要归还连接，否则占用计数一直虚高
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SET SESSION wait_timeout=5")
+                        cursor.execute("SHOW TABLES")
+                        tables = [list(r.values())[0] for r in cursor.fetchall()]
+
+                        if not tables:
+                            print(" (Empty)")
                             continue
-                conn.close()
+
+                        # 为了演示速度，这里只扫每个库前 50 张表
+                        # 生产环境请去掉 [:50]
+                        scan_limit = tables[:50]
+
+                        for table in scan_limit:
+                            try:
+                                # 获取建表语句 (这是 LLM 最爱吃的格式)
+                                cursor.execute(f"SHOW CREATE TABLE `{table}`")
+                                res = cursor.fetchone()
+                                if res:
+                                    ddl_str = list(res.values())[1]
+                                    # 获取列名用于 embedding
+                                    cursor.execute(f"DESCRIBE `{table}`")
+                                    cols = [row['Field'] for row in cursor.fetchall()]
+
+                                    results.append({
+                                        "database": db_name,
+                                        "table": table,
+                                        "columns": ",".join(cols),
+                                        "ddl_str": ddl_str
+                                    })
+                            except:
+                                continue
+                finally:
+                    conn.close()
                 print(f" ✅ ({len(scan_limit)} tables)")
             except Exception as e:
                 print(f" ❌ Skip ({e})")
                 continue
 
+        # 可选：抽样列画像 (枚举值、日期范围、格式)，随 DDL 一起入库
+        if os.getenv("SCHEMA_PROFILE", "0") == "1":
+            from .profiler import SchemaProfiler
+            SchemaProfiler(self).profile_all(results)
+
         return results
\ No newline at end of file
@@ -1,27 +1,224 @@
 # app/db_guard.py
-import re
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+load_dotenv()
 
 
 class SQLGuard:
-    FORBIDDEN_KEYWORDS = [
-        "DROP ", "DELETE ", "UPDATE ", "INSERT ", "ALTER ",
-        "GRANT ", "REVOKE ", "TRUNCATE ", "CREATE "
-    ]
+    # 只读：顶层只允许 SELECT / UNION，树里出现任何写操作/DDL/锁都拒绝
+    READONLY_ROOTS = (exp.Select, exp.Union, exp.Intersect, exp.Except)
+    FORBIDDEN_NODES = (
+        exp.Insert, exp.Update, exp.Delete, exp.Drop, exp.Create, exp.Alter,
+        exp.Merge, exp.TruncateTable, exp.Grant, exp.Command, exp.Lock, exp.Into,
+    )
+    DEFAULT_LIMIT = 100
+
+    # 解析结果缓存：同一条 SQL (LLM 重试、EXPLAIN、执行、收录) 只解析一次
+    CACHE_SIZE = 2048
+    _ast_cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    # EXPLAIN 成本闸门：预估扫描行数超过阈值直接打回给 LLM 重写
+    MAX_EXAMINED_ROWS = int(os.getenv("SQL_MAX_EXAMINED_ROWS", 5_000_000))
+    # 不走索引的全表扫描，单表超过这个行数就拒绝
+    MAX_FULL_SCAN_ROWS = int(os.getenv("SQL_MAX_FULL_SCAN_ROWS", 1_000_000))
+
+    @staticmethod
+    def normalize(sql: str) -> str:
+        """去掉首尾空白、末尾分号，压缩空白：只用于比较 / 查重，不能拿去执行 (会破坏注释和字符串常量)"""
+        return " ".join(sql.strip().rstrip(";").split())
+
+    @staticmethod
+    def strip(sql: str) -> str:
+        """只去掉首尾空白和末尾分号，SQL 文本本身原样保留"""
+        return sql.strip().rstrip(";").strip()
+
+    @staticmethod
+    def parse(sql: str) -> exp.Expression:
+        """
+        解析为 MySQL 语法树 (按 SQL 哈希缓存)。
+        只允许单条只读语句，否则抛 ValueError。返回的树是共享的，修改前必须 copy()。
+        """
+        # 缓存 key 用原文：压缩空白会让 'a  b' 和 'a b' 共用一棵树
+        text = SQLGuard.strip(sql)
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with SQLGuard._cache_lock:
+            tree = SQLGuard._ast_cache.get(key)
+            if tree is not None:
+                SQLGuard._ast_cache.move_to_end(key)
+                return tree
+
+        try:
+            statements = [s for s in sqlglot.parse(text, read="mysql") if s is not None]
+        except SqlglotError as e:
+            raise ValueError(f"SQL parse error: {e}")
+
+        if len(statements) != 1:
+            raise ValueError("SECURITY ALERT: Only a single statement is allowed.")
+        tree = statements[0]
+        if not isinstance(tree, SQLGuard.READONLY_ROOTS):
+            raise ValueError(f"SECURITY ALERT: Only SELECT is allowed, got {tree.key.upper()}.")
+        for node in tree.walk():
+            if isinstance(node, SQLGuard.FORBIDDEN_NODES):
+                raise ValueError(f"SECURITY ALERT: {node.key.upper()} is forbidden.")
+
+        with SQLGuard._cache_lock:
+            SQLGuard._ast_cache[key] = tree
+            while len(SQLGuard._ast_cache) > SQLGuard.CACHE_SIZE:
+                SQLGuard._ast_cache.popitem(last=False)
+        return tree
+
+    @staticmethod
+    def fingerprint(sql: str) -> str:
+        """规范化后的 SQL (统一大小写/空白/引号风格)，用于判断两条 SQL 是否实质相同"""
+        return SQLGuard.parse(sql).sql(dialect="mysql", normalize=True)
+
+    @staticmethod
+    def tables(sql: str) -> List[str]:
+        """提取引用的真实表 (database.table，小写)，CTE 名称不算，用于缓存失效和路由"""
+        tree = SQLGuard.parse(sql)
+        ctes = {c.alias_or_name.lower() for c in tree.find_all(exp.CTE)}
+        found = set()
+        for t in tree.find_all(exp.Table):
+            name = t.name.lower()
+            if not name or (not t.db and name in ctes):
+                continue
+            found.add(f"{t.db.lower()}.{name}" if t.db else name)
+        return sorted(found)
+
+    @staticmethod
+    def _is_single_row(select: exp.Expression) -> bool:
+        """最外层是不带 GROUP BY 的聚合 (SELECT COUNT(*) ...)，结果只有一行，不需要 LIMIT"""
+        if not isinstance(select, exp.Select) or select.args.get("group"):
+            return False
+        for col in select.expressions:
+            # 只看当前层，子查询里的聚合不算
+            aggs = [a for a in col.find_all(exp.AggFunc) if a.parent_select is select]
+            if not aggs or col.find(exp.Window):
+                return False
+        return bool(select.expressions)
 
     @staticmethod
     def validate(sql: str) -> str:
-        sql_upper = sql.upper().strip()
+        tree = SQLGuard.parse(sql)
+
+        # 智能 LIMIT：只在最外层 SELECT/UNION 上加，子查询里的 LIMIT/聚合不影响判断
+        if tree.args.get("limit") or SQLGuard._is_single_row(tree):
+            return SQLGuard.strip(sql)
+        return tree.copy().limit(SQLGuard.DEFAULT_LIMIT).sql(dialect="mysql")
+
+    @staticmethod
+    def row_limit(sql: str) -> Optional[int]:
+        """
+        最外层 LIMIT 能让扫描提前结束时返回 LIMIT + OFFSET：不带 ORDER BY / GROUP BY / HAVING / DISTINCT、
+        没有聚合和窗口函数 (这些都要先读完全部行)；其它情况返回 None
+        """
+        try:
+            tree = SQLGuard.parse(sql)
+        except ValueError:
+            return None
+        limit = tree.args.get("limit")
+        if not isinstance(tree, exp.Select) or limit is None:
+            return None
+        if any(tree.args.get(k) for k in ("order", "group", "having", "distinct")):
+            return None
+        if any(a.parent_select is tree for a in tree.find_all(exp.AggFunc)) or tree.find(exp.Window):
+            return None
+        try:
+            offset = tree.args.get("offset")
+            return int(limit.expression.name) + (int(offset.expression.name) if offset else 0)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def _collect_tables(node, out: list, outer_rows: float = 1.0):
+        """
+        遍历 EXPLAIN FORMAT=JSON 的计划树，收集每张表的访问信息。
+        nested_loop 里内表的扫描次数 = 外层已产出的行数，所以要累乘。
+        """
+        if isinstance(node, list):
+            for item in node:
+                SQLGuard._collect_tables(item, out, outer_rows)
+            return
+        if not isinstance(node, dict):
+            return
+
+        if "nested_loop" in node:
+            produced = outer_rows
+            for item in node["nested_loop"]:
+                table = item.get("table") if isinstance(item, dict) else None
+                if table:
+                    SQLGuard._add_table(table, out, produced)
+                    # rows_produced_per_join 是连接到当前表为止的累计产出行数
+                    produced = max(float(table.get("rows_produced_per_join", 1) or 1), 1.0)
+                    SQLGuard._collect_tables({k: v for k, v in table.items() if isinstance(v, (dict, list))}, out, 1.0)
+                else:
+                    SQLGuard._collect_tables(item, out, produced)
+            for k, v in node.items():
+                if k != "nested_loop":
+                    SQLGuard._collect_tables(v, out, outer_rows)
+            return
+
+        if "table_name" in node and "access_type" in node:
+            SQLGuard._add_table(node, out, outer_rows)
+        for v in node.values():
+            if isinstance(v, (dict, list)):
+                SQLGuard._collect_tables(v, out, 1.0)
+
+    @staticmethod
+    def _add_table(table: dict, out: list, scans: float):
+        if "table_name" not in table:
+            return
+        per_scan = float(table.get("rows_examined_per_scan", 0) or 0)
+        out.append({
+            "table": table.get("table_name"),
+            "access_type": table.get("access_type"),
+            "key": table.get("key"),
+            "possible_keys": table.get("possible_keys") or [],
+            "rows_per_scan": per_scan,
+            "rows_examined": per_scan * scans,
+            # WHERE 过滤后剩下的比例 (EXPLAIN 里是百分数字符串)
+            "filtered": float(table.get("filtered", 100) or 100) / 100,
+        })
+
+    @staticmethod
+    def check_cost(plan: dict, row_limit: Optional[int] = None):
+        """
+        根据 EXPLAIN FORMAT=JSON 的结果判断查询是否过重。
+        row_limit: SQLGuard.row_limit(sql)，单表查询读够这么多行 (按 filtered 折算) 就停，
+        EXPLAIN 的 rows 仍是全表估计，不能按全表扫描算。
+        返回 (是否放行, 原因)，原因会作为错误信息喂给 LLM 的自动修复流程。
+        """
+        tables = []
+        SQLGuard._collect_tables(plan, tables)
+        if not tables:
+            return True, ""
+        if row_limit is not None and len(tables) == 1:
+            # 多表连接时驱动表要读多少行取决于连接的扇出，估不准，仍按 EXPLAIN 的行数算
+            t = tables[0]
+            needed = row_limit / max(t["filtered"], 1e-6)
+            t["rows_per_scan"] = t["rows_examined"] = min(t["rows_examined"], needed)
 
-        # 1. 黑名单检查
-        for kw in SQLGuard.FORBIDDEN_KEYWORDS:
-            if kw in sql_upper:
-                raise ValueError(f"SECURITY ALERT: Keyword '{kw}' forbidden.")
+        total = sum(t["rows_examined"] for t in tables)
+        problems = []
+        for t in tables:
+            if t["access_type"] == "ALL" and not t["key"] and t["rows_per_scan"] > SQLGuard.MAX_FULL_SCAN_ROWS:
+                hint = f" (possible keys: {', '.join(t['possible_keys'])})" if t["possible_keys"] else ""
+                problems.append(f"full table scan on `{t['table']}` (~{int(t['rows_per_scan'])} rows, no index used{hint})")
 
-        # 2. 智能 LIMIT (修复点：只针对 SELECT)
-        # 只有以 SELECT 开头，且没有 LIMIT，且不是聚合查询时，才加 LIMIT
-        if sql_upper.startswith("SELECT") and "LIMIT " not in sql_upper:
-            is_agg = any(x in sql_upper for x in ["COUNT(", "SUM(", "AVG(", "MAX(", "MIN("])
-            if not is_agg:
-                return sql + " LIMIT 100"
+        if total > SQLGuard.MAX_EXAMINED_ROWS:
+            problems.append(f"estimated {int(total)} rows examined (limit {SQLGuard.MAX_EXAMINED_ROWS})")
 
-        return sql
\ No newline at end of file
+        if not problems:
+            return True, ""
+        return False, ("QUERY TOO EXPENSIVE: " + "; ".join(problems) +
+                       ". Rewrite it to use an indexed column in WHERE (e.g. a recent date range on a time column), "
+                       "narrow the filter, or aggregate instead of returning raw rows.")
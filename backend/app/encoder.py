@@ -0,0 +1,240 @@
+# app/encoder.py
+import abc
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_PATH = './models/paraphrase-multilingual-MiniLM-L12-v2'
+
+
+def _threads() -> int:
+    # 0 = 交给运行时自己决定 (通常是物理核数)
+    return int(os.getenv("EMBEDDING_THREADS", 0))
+
+
+class BaseEncoder(abc.ABC):
+    """
+    Embedding 编码器接口：VectorStore 只依赖 encode()，换后端不用改检索代码。
+    encode 返回 (N, dim) 的 float32 向量 (未归一化，归一化由 FAISS 侧负责)。
+    """
+    name = "base"
+    model_path = ""
+
+    @property
+    def model_id(self) -> str:
+        """向量缓存的校验键：后端 + 模型目录，任何一个变了磁盘上的旧向量都不能复用"""
+        if not self.model_path:
+            return self.name
+        return f"{self.name}:{os.path.basename(os.path.normpath(self.model_path))}"
+
+    @abc.abstractmethod
+    def encode(self, texts, batch_size: int = 32):
+        ...
+
+
+class TorchEncoder(BaseEncoder):
+    """默认后端：SentenceTransformer + PyTorch fp32"""
+    name = "torch"
+
+    def __init__(self, model_path: str = MODEL_PATH):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if _threads():
+            torch.set_num_threads(_threads())
+        self.model_path = model_path
+        self.model = SentenceTransformer(model_path)
+
+    def encode(self, texts, batch_size: int = 32):
+        return self.model.encode(texts, batch_size=batch_size)
+
+
+class OnnxEncoder(BaseEncoder):
+    """
+    轻量运行时：用 ONNX Runtime 跑同一个 MiniLM 模型，不依赖 torch。
+    onnxruntime 是可选依赖，不在 requirements.txt 里 (pip install onnxruntime；首次导出 / 量化还要 onnx)。
+    quantized=True 时使用 int8 动态量化模型 (第一次用时从 fp32 模型自动生成)。
+    输出与 SentenceTransformer.encode 一致：mean pooling 后的 float32 向量。
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str = MODEL_PATH, quantized: bool = False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        onnx_dir = os.path.join(model_path, "onnx")
+        fp32_file = os.path.join(onnx_dir, os.getenv("EMBEDDING_ONNX_FILE", "model.onnx"))
+        if not os.path.exists(fp32_file):
+            export_onnx(model_path, fp32_file)
+        model_file = fp32_file
+        if quantized:
+            self.name = "onnx-int8"
+            model_file = os.path.join(onnx_dir, "model_int8.onnx")
+            if not os.path.exists(model_file):
+                quantize_onnx(fp32_file, model_file)
+
+        self.model_path = model_path
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=128)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if _threads():
+            opts.intra_op_num_threads = _threads()
+        self.session = ort.InferenceSession(model_file, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size: int = 32):
+        import numpy as np
+
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        encodings = self.tokenizer.encode_batch(texts)
+        dim = None
+        out = [None] * len(texts)
+
+        # 按长度排序后再切 batch，同一 batch 内长度接近，padding 浪费最少
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        for start in range(0, len(order), batch_size):
+            idxs = order[start:start + batch_size]
+            width = max(len(encodings[i].ids) for i in idxs)
+            ids = np.zeros((len(idxs), width), dtype=np.int64)
+            mask = np.zeros((len(idxs), width), dtype=np.int64)
+            for row, i in enumerate(idxs):
+                n = len(encodings[i].ids)
+                ids[row, :n] = encodings[i].ids
+                mask[row, :n] = 1
+
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feeds)[0]
+            # mean pooling (与 sentence-transformers 的 Pooling 层一致)
+            m = mask[..., None].astype(np.float32)
+            pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            dim = pooled.shape[1]
+            for row, i in enumerate(idxs):
+                out[i] = pooled[row]
+
+        if not out:
+            return np.zeros((0, dim or 0), dtype=np.float32)
+        return np.vstack(out).astype(np.float32)
+
+
+class DynamicBatcher(BaseEncoder):
+    """
+    动态批处理：多个线程同时调用 encode 时 (并发请求的检索)，
+    在 max_wait_ms 内把请求攒成一个 batch 交给底层编码器，一次前向算完再拆回去。
+    """
+
+    def __init__(self, encoder: BaseEncoder, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.encoder = encoder
+        self.name = f"{encoder.name}+batch"
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    @property
+    def model_id(self) -> str:
+        return self.encoder.model_id
+
+    def encode(self, texts, batch_size: int = 32):
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        # 大批量 (建索引) 直接走底层，不跟在线请求抢
+        if len(texts) >= self.max_batch:
+            return self.encoder.encode(texts, batch_size=batch_size)
+        done = threading.Event()
+        job = {"texts": texts, "done": done, "result": None, "error": None}
+        self._queue.put(job)
+        done.wait()
+        if job["error"]:
+            raise job["error"]
+        return job["result"]
+
+    def _loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            size = len(jobs[0]["texts"])
+            try:
+                while size < self.max_batch:
+                    job = self._queue.get(timeout=self.max_wait)
+                    jobs.append(job)
+                    size += len(job["texts"])
+            except queue.Empty:
+                pass
+
+            texts = [t for job in jobs for t in job["texts"]]
+            try:
+                emb = self.encoder.encode(texts, batch_size=self.max_batch)
+                offset = 0
+                for job in jobs:
+                    n = len(job["texts"])
+                    job["result"] = emb[offset:offset + n]
+                    offset += n
+            except Exception as e:
+                for job in jobs:
+                    job["error"] = e
+            for job in jobs:
+                job["done"].set()
+
+
+def export_onnx(model_path: str, out_file: str):
+    """把 SentenceTransformer 里的 Transformer 导出成 ONNX (只需要跑一次，需要 torch + transformers)"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    print(f"📦 [Encoder] 导出 ONNX: {out_file}")
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    model = AutoModel.from_pretrained(model_path).eval()
+    sample = AutoTokenizer.from_pretrained(model_path)(["export 导出"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[n] for n in names), out_file,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=axes, opset_version=14
+        )
+
+
+def quantize_onnx(src: str, dst: str):
+    """int8 动态量化 (权重量化，激活运行时量化)，CPU 上通常快 2~3 倍，模型体积约 1/4"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"📦 [Encoder] int8 量化: {dst}")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+
+
+# 后端注册表：新后端 (GPU、远程 Embedding API...) 在这里注册即可被 EMBEDDING_BACKEND 选中
+ENCODERS = {
+    "torch": lambda path: TorchEncoder(path),
+    "onnx": lambda path: OnnxEncoder(path),
+    "onnx-int8": lambda path: OnnxEncoder(path, quantized=True),
+}
+
+
+def register_encoder(name: str, factory):
+    ENCODERS[name] = factory
+
+
+def load_encoder(model_path: str = MODEL_PATH, backend: str = None) -> BaseEncoder:
+    """
+    EMBEDDING_BACKEND=torch (默认) | onnx | onnx-int8
+    EMBEDDING_THREADS=N 控制推理线程数，EMBEDDING_DYNAMIC_BATCH=1 开启并发请求合批
+    重依赖都在这里按需 import，模块本身 import 几乎零开销
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if backend not in ENCODERS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend} (available: {', '.join(ENCODERS)})")
+    print(f"🧠 [Encoder] 加载 Embedding 模型 (backend={backend})...")
+    encoder = ENCODERS[backend](model_path)
+    if os.getenv("EMBEDDING_DYNAMIC_BATCH", "0") == "1":
+        encoder = DynamicBatcher(encoder)
+    return encoder
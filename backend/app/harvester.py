@@ -0,0 +1,118 @@
+# app/harvester.py
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .db_guard import SQLGuard
+
+load_dotenv()
+
+
+class SQLHarvester:
+    """
+    自动收录成功的 (问题, SQL) 作为 few-shot 示例，写入 sql 索引。
+    请求路径上只做一次非阻塞入队；后台线程攒批、按规范化 SQL 查重后批量写入，
+    每批只重建一次索引，并限制每小时写入条数，写放大有上限。
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SQLHarvester, cls).__new__(cls)
+            inst = cls._instance
+            inst.enabled = os.getenv("HARVEST_ENABLED", "1") == "1"
+            inst.batch_size = int(os.getenv("HARVEST_BATCH", 50))
+            inst.flush_seconds = float(os.getenv("HARVEST_FLUSH_SECONDS", 30))
+            inst.max_per_hour = int(os.getenv("HARVEST_MAX_PER_HOUR", 500))
+            # 太慢的 SQL 不适合当示例
+            inst.max_latency_ms = float(os.getenv("HARVEST_MAX_LATENCY_MS", 10000))
+            # 空结果大概率是理解错了问题
+            inst.min_rows = int(os.getenv("HARVEST_MIN_ROWS", 1))
+            inst._queue = queue.Queue(maxsize=int(os.getenv("HARVEST_MAX_QUEUE", 1000)))
+            # 最近收录过的指纹 (本进程内去重，避免同一条 SQL 反复发给向量库)
+            inst._seen = OrderedDict()
+            inst._window_start = time.time()
+            inst._window_count = 0
+            inst.stats = {"queued": 0, "dropped": 0, "duplicates": 0, "over_quota": 0, "written": 0,
+                          "flushes": 0}
+            inst._thread = None
+        return cls._instance
+
+    def submit(self, question: str, sql: str, success: bool, latency_ms: float, rows: int = 0):
+        """请求路径调用：只入队，不做任何 IO；队列满了直接丢弃"""
+        if not self.enabled or not success or not question or not sql:
+            return
+        if latency_ms > self.max_latency_ms or rows < self.min_rows:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait({"question": question.strip(), "sql": sql, "latency_ms": latency_ms})
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = []
+            deadline = time.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.flush(batch)
+                except Exception as e:
+                    print(f"⚠️ [Harvest] 写入失败: {e}")
+
+    def _dedup(self, batch: list) -> list:
+        """返回 [(指纹, 条目)]；这里只查重不登记，写入成功的才记进 _seen"""
+        items, fps = [], set()
+        for item in batch:
+            try:
+                fp = SQLGuard.fingerprint(item["sql"])
+            except ValueError:
+                continue
+            if fp in self._seen or fp in fps:
+                self.stats["duplicates"] += 1
+                continue
+            fps.add(fp)
+            items.append((fp, {"question": item["question"], "sql": item["sql"], "source": "harvest"}))
+        return items
+
+    def _quota(self) -> int:
+        now = time.time()
+        if now - self._window_start >= 3600:
+            self._window_start, self._window_count = now, 0
+        return max(self.max_per_hour - self._window_count, 0)
+
+    def flush(self, batch: list):
+        items = self._dedup(batch)
+        quota = self._quota()
+        if len(items) > quota:
+            # 超出配额的不登记指纹，下个窗口再遇到还能收录
+            self.stats["over_quota"] += len(items) - quota
+            items = items[:quota]
+        if not items:
+            return
+        from .vector_service import get_vector_store
+        added = get_vector_store().add_training_batch('sql', [item for _, item in items])
+        for fp, _ in items:
+            self._seen[fp] = True
+        while len(self._seen) > 10000:
+            self._seen.popitem(last=False)
+        self._window_count += len(items)
+        self.stats["written"] += added or 0
+        self.stats["flushes"] += 1
+        print(f"🌾 [Harvest] 收录 {added}/{len(items)} 条 SQL 示例")
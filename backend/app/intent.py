@@ -0,0 +1,148 @@
+# app/intent.py
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHAT, QUERY, ANALYSIS = "CHAT", "QUERY", "ANALYSIS"
+
+# 种子样本：每类的典型问法 (故意包含"数"、"图"这类会骗过关键词规则的闲聊)
+# data/intent_examples.jsonl ({"text": ..., "intent": ...}) 里的样本会追加进来
+SEED_EXAMPLES = {
+    CHAT: [
+        "你好", "你是谁", "谢谢你", "你能做什么", "今天天气怎么样", "讲个笑话", "好的，明白了",
+        "这个系统怎么用", "数学好难啊", "我想学数据分析，有什么书推荐", "帮我写一段自我介绍",
+        "晚上吃什么好", "图书馆几点关门", "hello", "how are you", "thanks, that's helpful",
+    ],
+    QUERY: [
+        "查一下上个月各车型的销量", "今天新增了多少用户", "统计每个城市的订单数", "C11 最近一周的交付量",
+        "销量前十的经销商", "哪个车型退款最多", "列出所有未激活的账号", "本月的营收是多少",
+        "各省份的充电桩数量", "2024年每个月的注册人数趋势", "库存低于100的零件有哪些", "那上个月呢",
+        "换成按周统计", "show me orders created yesterday", "how many users signed up this week",
+    ],
+    ANALYSIS: [
+        "分析一下这些数据", "把上面的结果画成柱状图", "解释一下为什么三月份下降了", "这个趋势说明什么",
+        "按占比画个饼图", "帮我总结一下刚才的结果", "用折线图展示", "哪个最高，高出多少",
+        "计算一下环比增长率", "这些数据有什么异常", "plot this as a line chart", "summarize the result above",
+    ],
+}
+
+# 旧的关键词规则，置信度不够时兜底
+DATA_KEYWORDS = ["查", "分析", "图", "数", "多少", "select", "排名"]
+ANALYSIS_KEYWORDS = ["分析", "画", "图", "解释"]
+
+
+class IntentRouter:
+    """
+    意图路由：闲聊 / 新查询 / 针对上一轮结果的分析。
+    用问题的 Embedding 和每类样本的质心算余弦相似度 (最近质心分类)，
+    问题向量之后直接拿去检索，不重复 encode；分类本身只是 3 x dim 的点积，远低于 1 ms。
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(IntentRouter, cls).__new__(cls)
+            inst = cls._instance
+            # softmax 温度：余弦相似度差 0.05 大约对应 e 倍的概率差
+            inst.temperature = float(os.getenv("INTENT_TEMPERATURE", 0.05))
+            inst.min_confidence = float(os.getenv("INTENT_MIN_CONFIDENCE", 0.5))
+            inst.examples_path = os.getenv("INTENT_EXAMPLES", "./data/intent_examples.jsonl")
+            inst.log_path = os.getenv("INTENT_LOG_FILE")
+            inst.labels: List[str] = [CHAT, QUERY, ANALYSIS]
+            inst._centroids = None
+            inst._encoder_name = None
+            inst._lock = threading.Lock()
+        return cls._instance
+
+    def examples(self) -> Dict[str, List[str]]:
+        merged = {k: list(v) for k, v in SEED_EXAMPLES.items()}
+        if os.path.exists(self.examples_path):
+            with open(self.examples_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip(): continue
+                    item = json.loads(line)
+                    if item.get("intent") in merged:
+                        merged[item["intent"]].append(item["text"])
+        return merged
+
+    def centroids(self, store) -> np.ndarray:
+        """每类样本一次性批量 encode，取归一化后的均值；换了 Embedding 后端会重算"""
+        name = getattr(store.model, "name", None)
+        if self._centroids is not None and self._encoder_name == name:
+            return self._centroids
+        with self._lock:
+            if self._centroids is None or self._encoder_name != name:
+                examples = self.examples()
+                texts = [t for label in self.labels for t in examples[label]]
+                emb = np.asarray(store.model.encode(texts), dtype="float32")
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+                rows, offset = [], 0
+                for label in self.labels:
+                    n = len(examples[label])
+                    c = emb[offset:offset + n].mean(axis=0)
+                    rows.append(c / max(np.linalg.norm(c), 1e-12))
+                    offset += n
+                self._centroids, self._encoder_name = np.vstack(rows), name
+                print(f"🧭 [Intent] 质心已就绪: {', '.join(f'{l}={len(examples[l])}' for l in self.labels)}")
+        return self._centroids
+
+    @staticmethod
+    def keyword_intent(text: str, has_data: bool) -> str:
+        if has_data and any(k in text for k in ANALYSIS_KEYWORDS):
+            return ANALYSIS
+        return QUERY if any(k in text for k in DATA_KEYWORDS) else CHAT
+
+    def classify(self, q_emb: np.ndarray, centroids: np.ndarray, has_data: bool):
+        scores = centroids @ q_emb.reshape(-1)
+        if not has_data:
+            # 没有上一轮数据就谈不上"分析"，屏蔽掉这一类
+            scores = scores.copy()
+            scores[self.labels.index(ANALYSIS)] = -np.inf
+        logits = (scores - scores.max()) / self.temperature
+        probs = np.exp(logits) / np.exp(logits).sum()
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best]), scores
+
+    def route(self, text: str, store, has_data: bool = False) -> dict:
+        """
+        返回 {"intent", "confidence", "method", "embedding", "encode_ms", "classify_ms"}
+        embedding 是归一化后的问题向量 (1, dim)，检索直接复用；失败时为 None，走关键词规则
+        """
+        decision = {"intent": None, "confidence": None, "method": "embedding", "embedding": None,
+                    "encode_ms": 0.0, "classify_ms": 0.0}
+        try:
+            centroids = self.centroids(store)
+            start = time.perf_counter()
+            q_emb = store.encode_query(text)
+            decision["encode_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+            start = time.perf_counter()
+            intent, confidence, scores = self.classify(q_emb, centroids, has_data)
+            decision["classify_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            decision.update(intent=intent, confidence=round(confidence, 3), embedding=q_emb,
+                            scores={l: round(float(s), 3) for l, s in zip(self.labels, scores) if np.isfinite(s)})
+            if confidence < self.min_confidence:
+                decision.update(intent=self.keyword_intent(text, has_data), method="keyword_fallback")
+        except Exception as e:
+            print(f"⚠️ [Intent] Embedding 路由失败，使用关键词规则: {e}")
+            decision.update(intent=self.keyword_intent(text, has_data), method="keyword")
+
+        print(f"🧭 [Intent] {decision['intent']} conf={decision['confidence']} via {decision['method']} "
+              f"(encode {decision['encode_ms']} ms, classify {decision['classify_ms']} ms)")
+        self._log(text, has_data, decision)
+        return decision
+
+    def _log(self, text: str, has_data: bool, decision: dict):
+        """决策落盘 (INTENT_LOG_FILE)，人工校对后可追加到 intent_examples.jsonl"""
+        if not self.log_path:
+            return
+        record = {k: v for k, v in decision.items() if k != "embedding"}
+        record.update(text=text, has_data=has_data, ts=time.time())
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -1,6 +1,7 @@
 import os
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from .telemetry import span
 
 load_dotenv()
 
@@ -28,9 +29,36 @@ class LLMService:
             "timeout": 60.0
         }
 
+        # 流式模式下让服务端在最后一个 chunk 带上 usage (含 Prompt Cache 命中数)
+        if stream:
+            params["stream_options"] = {"include_usage": True}
+
         if tools and len(tools) > 0:
             params["tools"] = tools
             params["tool_choice"] = tool_choice
 
         # 直接返回 SDK 的响应对象（可能是 Response 或者是 Stream）
-        return await self.client.chat.completions.create(**params)
\ No newline at end of file
+        # 流式时 span 只覆盖到响应头返回 (建连 + 排队)，逐 token 的耗时由调用方的 span 记录
+        with span("llm.chat_completion", model=self.model_name, stream=stream,
+                  messages=len(messages), tools=len(tools or [])) as sp:
+            resp = await self.client.chat.completions.create(**params)
+            if not stream:
+                sp.set(**self.parse_usage(getattr(resp, "usage", None)))
+            return resp
+
+    @staticmethod
+    def parse_usage(usage) -> dict:
+        """
+        统一 usage 字段：DeepSeek 用 prompt_cache_hit_tokens，OpenAI 用 prompt_tokens_details.cached_tokens
+        """
+        if not usage:
+            return {}
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details else None
+        return {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "completion_tokens": usage.completion_tokens or 0,
+            "cached_tokens": cached or 0,
+        }
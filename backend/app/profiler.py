@@ -0,0 +1,163 @@
+# app/profiler.py
+"""
+Schema 扫描时的列画像 (可选，SCHEMA_PROFILE=1 开启)：光有 DDL，LLM 只能猜枚举值和日期格式，
+猜错就报错 / 查空，然后进自动修复、多一轮 LLM。扫描时顺手抽样，把这些"值长什么样"的信息记下来：
+
+- 行数估计：information_schema.TABLES.TABLE_ROWS (统计信息，不扫表)
+- 每列：抽样 (LIMIT PROFILE_SAMPLE_ROWS，不排序，走主键顺序读前 N 行) 里的去重数 / NULL 比例
+- 低基数列 (样本里去重数 <= PROFILE_TOP_MAX_DISTINCT)：出现最多的几个取值
+- 日期列：最小 ~ 最大 (带索引的列直接 MIN/MAX 全表，走索引很便宜；否则用样本)
+- 高基数字符串：只给"格式" (数字 -> 9、字母 -> A、汉字 -> 字)，不把具体值 (手机号、车牌) 发给 LLM
+
+控制对库的压力：PROFILE_CONCURRENCY 张表并发，每条扫表语句带 /*+ MAX_EXECUTION_TIME(PROFILE_TIMEOUT_MS) */，
+超时 / 出错的表直接跳过，不影响 DDL 扫描本身。
+结果是一段紧凑文本，存在 DDL 记录的 profile 字段里，随检索结果进 Prompt (受 Token 预算约束)。
+"""
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATE_TYPES = ("date", "datetime", "timestamp", "year")
+STRING_TYPES = ("char", "varchar", "enum", "set")
+INT_TYPES = ("tinyint", "smallint", "mediumint", "int", "bigint")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+_DIGIT_RE = re.compile(r"\d")
+_ALPHA_RE = re.compile(r"[A-Za-z]")
+
+
+def _base_type(mysql_type: str) -> str:
+    return re.split(r"[\s(]", mysql_type.strip().lower(), 1)[0]
+
+
+def _shape(value: str) -> str:
+    """值的格式：2024-01-05 -> 9999-99-99，浙A12345 -> 字A99999 (字母只保留大小写)"""
+    shape = _DIGIT_RE.sub("9", value)
+    shape = _ALPHA_RE.sub(lambda m: "A" if m.group(0).isupper() else "a", shape)
+    return _CJK_RE.sub("字", shape)
+
+
+def _brief(value, limit: int = 24) -> str:
+    text = str(value).replace("\n", " ")
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class SchemaProfiler:
+    def __init__(self, db=None):
+        from .db import DBManager
+        self.db = db or DBManager()
+        self.sample_rows = int(os.getenv("PROFILE_SAMPLE_ROWS", 2000))
+        self.concurrency = int(os.getenv("PROFILE_CONCURRENCY", 4))
+        self.timeout_ms = int(os.getenv("PROFILE_TIMEOUT_MS", 3000))
+        self.max_distinct = int(os.getenv("PROFILE_TOP_MAX_DISTINCT", 20))
+        self.top_n = int(os.getenv("PROFILE_TOP_N", 8))
+        self.max_chars = int(os.getenv("PROFILE_MAX_CHARS", 600))
+
+    def profile_all(self, tables: List[dict]) -> int:
+        """并发给每张表写 item["profile"]，返回成功的表数"""
+        if not tables:
+            return 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="profile") as pool:
+            profiles = list(pool.map(self._safe_profile, tables))
+        done = 0
+        for item, profile in zip(tables, profiles):
+            if profile:
+                item["profile"] = profile
+                done += 1
+        print(f"🔬 [Profile] {done}/{len(tables)} 张表完成列画像，耗时 {time.perf_counter() - start:.1f}s")
+        return done
+
+    def _safe_profile(self, item: dict) -> Optional[str]:
+        try:
+            return self.profile_table(item["database"], item["table"])
+        except Exception as e:
+            print(f"⚠️ [Profile] 跳过 {item.get('database')}.{item.get('table')}: {e}")
+            return None
+
+    def profile_table(self, db_name: str, table: str) -> Optional[str]:
+        conn = self.db.get_connection(db_name, readonly=True)
+        try:
+            with conn.cursor() as cursor:
+                # 超时用语句级 hint (MySQL 5.7+，其他版本当注释忽略)：SET SESSION 会留在池里的连接上，
+                # 拖垮后面借到这条连接的业务查询
+                hint = f"/*+ MAX_EXECUTION_TIME({int(self.timeout_ms)}) */"
+                cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                               "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s", (db_name, table))
+                row = cursor.fetchone()
+                est_rows = list(row.values())[0] if row else None
+
+                cursor.execute(f"DESCRIBE `{table}`")
+                columns = [(r["Field"], _base_type(r["Type"]), bool(r.get("Key"))) for r in cursor.fetchall()]
+                wanted = [c for c in columns if c[1] in DATE_TYPES + STRING_TYPES + INT_TYPES]
+                if not wanted:
+                    return self.render(est_rows, [])
+
+                select = ", ".join(f"`{name}`" for name, _, _ in wanted)
+                cursor.execute(f"SELECT {hint} {select} FROM `{table}` LIMIT {int(self.sample_rows)}")
+                sample = cursor.fetchall()
+
+                stats = []
+                for name, ctype, indexed in wanted:
+                    values = [r.get(name) for r in sample]
+                    col = self.profile_column(name, ctype, values)
+                    if ctype in DATE_TYPES and indexed and sample:
+                        # 带索引的日期列：MIN/MAX 只读索引两端；超时就用样本的范围
+                        try:
+                            cursor.execute(f"SELECT {hint} MIN(`{name}`) AS lo, MAX(`{name}`) AS hi FROM `{table}`")
+                            r = cursor.fetchone()
+                            if r and r["lo"] is not None:
+                                col["range"] = (r["lo"], r["hi"])
+                        except Exception:
+                            pass
+                    stats.append(col)
+                return self.render(est_rows, stats)
+        finally:
+            conn.close()
+
+    def profile_column(self, name: str, ctype: str, values: list) -> dict:
+        """纯 Python，按样本算单列画像 (方便单测)"""
+        non_null = [v for v in values if v is not None]
+        col = {"name": name, "type": ctype, "null_ratio": 1 - len(non_null) / len(values) if values else 0.0}
+        if not non_null:
+            return col
+        counts = Counter(non_null)
+        col["distinct"] = len(counts)
+        if ctype in DATE_TYPES:
+            col["range"] = (min(non_null), max(non_null))
+        elif len(counts) <= self.max_distinct and len(counts) < len(non_null):
+            # 低基数：枚举 / 状态码
+            col["top"] = [v for v, _ in counts.most_common(self.top_n)]
+        elif ctype in STRING_TYPES:
+            shapes = Counter(_shape(str(v)) for v in non_null)
+            shape, n = shapes.most_common(1)[0]
+            if n >= 0.8 * len(non_null) and "9" in shape and len(shape) <= 32:
+                col["format"] = shape
+        return col
+
+    def render(self, est_rows, stats: List[dict]) -> Optional[str]:
+        """紧凑文本：rows≈5000 | city: 6 values [杭州, 上海, ...] | created_at: 2024-01-01 ~ 2024-12-28 | vin: format AA99999"""
+        parts = [f"rows≈{est_rows}"] if est_rows is not None else []
+        for col in stats:
+            hints = []
+            if "top" in col:
+                more = ", ..." if col["distinct"] > len(col["top"]) else ""
+                hints.append(f"{col['distinct']} values [{', '.join(_brief(v) for v in col['top'])}{more}]")
+            if "range" in col:
+                lo, hi = col["range"]
+                hints.append(f"{_brief(lo)} ~ {_brief(hi)}")
+            if "format" in col:
+                hints.append(f"format {col['format']}")
+            if col.get("null_ratio", 0) >= 0.5:
+                hints.append(f"{col['null_ratio']:.0%} NULL")
+            if hints:
+                parts.append(f"{col['name']}: {'; '.join(hints)}")
+        if not parts:
+            return None
+        text = " | ".join(parts)
+        return text if len(text) <= self.max_chars else text[:self.max_chars].rsplit(" | ", 1)[0] + " | ..."
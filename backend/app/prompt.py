@@ -1,25 +1,68 @@
 # app/prompt.py
-from typing import Dict, List
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
 
 class PromptBuilder:
+    # 🔥 静态前缀：所有 RAG 请求逐字节一致，放在最前面才能命中 DeepSeek/OpenAI 的 Prompt Cache
+    # 注意：这里不允许出现任何动态内容 (时间、用户名、检索结果...)
+    STATIC_PREFIX = """
+You are an expert Data Analyst (Vanna-style).
+Answer the user's question using the provided context.
+
+### Rules
+1. **SQL First:** Use `execute_sql` to get data.
+2. **Explicit DB:** Always prefix tables with their database name found in the DDL.
+3. **ReadOnly:** SELECT only.
+4. **Visualization:** After getting data, if suitable, use `generate_chart`.
+5. **Analysis:** If complex calculation is needed, use `execute_python`.
+
+**CRITICAL:** The database name is specified in the comments (e.g., /* Database: lpcarnet */).
+When writing SQL, ALWAYS use the full `database.table` syntax (e.g., `SELECT * FROM lpcarnet.car_base_info`).
+"""
+
+    ANALYSIS_PREFIX = """
+You are a Data Analyst. Data is already loaded in memory (pandas df).
+DO NOT query SQL again.
+Use `execute_python` for calculation or `generate_chart` for plotting.
+"""
+
+    _DDL_KEY_RE = re.compile(r"/\*\s*Database:\s*(\S+)\s*\*/\s*CREATE TABLE `?([^`\s(]+)`?", re.IGNORECASE)
+
+    @staticmethod
+    def ddl_key(ddl: str) -> str:
+        """从 DDL 中解析 database.table，作为排序/去重的稳定 key"""
+        m = PromptBuilder._DDL_KEY_RE.search(ddl)
+        if m:
+            return f"{m.group(1)}.{m.group(2)}".lower()
+        return ddl
+
     @staticmethod
-    def build_system_prompt(rag_results: Dict[str, List[str]]) -> str:
+    def sort_ddl(ddls: List[str]) -> List[str]:
+        """按 database.table 排序，同一批表无论检索顺序如何都生成同一段文本"""
+        return sorted(ddls, key=PromptBuilder.ddl_key)
+
+    @staticmethod
+    def build_system_prompt(rag_results: Dict[str, List[str]], ddl_order: Optional[List[str]] = None,
+                            profiles: str = "") -> str:
         """
         构建 System Prompt。
+        布局：静态指令前缀 -> DDL (确定性排序) -> 文档 -> SQL 示例，越靠后越易变。
         rag_results['ddl'] 里已经包含了 /* Database: xxx */ 的注释，LLM 会懂的。
+        ddl_order: 由 PrefixCache 给出的会话内稳定顺序，不传则按表名排序。
+        profiles: 已按预算裁好的列画像 (PromptBudgeter.fit_profiles)，为空时 Prompt 与未开启画像时完全一致。
         """
-        ddl = "\n\n".join(rag_results.get('ddl', [])) or "No related tables found."
-        docs = "\n".join([f"- {d}" for d in rag_results.get('doc', [])]) or "None"
+        ddl_list = ddl_order if ddl_order is not None else PromptBuilder.sort_ddl(rag_results.get('ddl', []))
+        ddl = "\n\n".join(ddl_list) or "No related tables found."
+        if profiles:
+            ddl += ("\n\nColumn value hints (sampled at schema scan; use the exact values/formats shown "
+                    "in filters):\n" + profiles)
+        docs = "\n".join([f"- {d}" for d in sorted(rag_results.get('doc', []))]) or "None"
         sqls = "\n".join([f"Example: {s}" for s in rag_results.get('sql', [])]) or "None"
 
-        return f"""
-You are an expert Data Analyst (Vanna-style).
-Answer the user's question using the provided context.
-
+        return f"""{PromptBuilder.STATIC_PREFIX}
 ### 1. Available Database Tables (DDL)
-**CRITICAL:** The database name is specified in the comments (e.g., /* Database: lpcarnet */).
-When writing SQL, ALWAYS use the full `database.table` syntax (e.g., `SELECT * FROM lpcarnet.car_base_info`).
-
 {ddl}
 
 ### 2. Documentation
@@ -27,21 +70,64 @@ When writing SQL, ALWAYS use the full `database.table` syntax (e.g., `SELECT * F
 
 ### 3. Similar SQL Examples
 {sqls}
-
-### Rules
-1. **SQL First:** Use `execute_sql` to get data.
-2. **Explicit DB:** Always prefix tables with their database name found in the DDL.
-3. **ReadOnly:** SELECT only.
-4. **Visualization:** After getting data, if suitable, use `generate_chart`.
-5. **Analysis:** If complex calculation is needed, use `execute_python`.
 """
 
+    @staticmethod
+    def build_session_tables(tables: List[dict], engine: str) -> str:
+        """本会话已有的结果表，放在 Prompt 最末尾 (每次查询都会变，不影响前面的缓存前缀)"""
+        if not tables:
+            return ""
+        lines = [
+            "",
+            "### Session Result Tables",
+            f"Results from earlier queries in this conversation are loaded into a local {engine} database.",
+            "For follow-ups on them (re-grouping, filtering, sorting, top-N) use `query_session_data` "
+            "instead of querying the production database again.",
+        ]
+        for t in tables:
+            cols = ", ".join(t["columns"][:30]) + (", ..." if len(t["columns"]) > 30 else "")
+            source = f" -- from: {' '.join(t['sql'].split())[:200]}" if t.get("sql") else ""
+            lines.append(f"- {t['name']} ({t['rows']} rows): {cols}{source}")
+        return "\n".join(lines) + "\n"
+
     @staticmethod
     def build_analysis_prompt(data_preview: str, length: int) -> str:
-        return f"""
-You are a Data Analyst. Data is already loaded in memory (pandas df).
-DO NOT query SQL again.
+        return f"""{PromptBuilder.ANALYSIS_PREFIX}
 Analyze this data ({length} rows):
 {data_preview}
-Use `execute_python` for calculation or `generate_chart` for plotting.
-"""
\ No newline at end of file
+"""
+
+
+class PrefixCache:
+    """
+    会话级前缀复用：记住每个会话已经发过的 DDL 顺序。
+    后续轮次沿用旧顺序，新检索到的表只追加在末尾，这样上一轮的 System Prompt
+    仍然是这一轮的前缀，Provider 侧 KV Cache 可以继续命中。
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_tables: int = 16):
+        self.max_sessions = max_sessions
+        # 累积的表太多时重新排序 (牺牲一次命中，避免 Prompt 无限膨胀)
+        self.max_tables = max_tables
+        self._sessions = OrderedDict()
+
+    def order(self, session_id: Optional[str], ddls: List[str],
+              fits: Optional[Callable[[List[str]], bool]] = None) -> List[str]:
+        """fits: Token 预算检查，沿用旧顺序会超预算时退回本轮的排序结果"""
+        fresh = PromptBuilder.sort_ddl(ddls)
+        if not session_id:
+            return fresh
+
+        prev = self._sessions.get(session_id, [])
+        known = {PromptBuilder.ddl_key(d) for d in prev}
+        appended = [d for d in fresh if PromptBuilder.ddl_key(d) not in known]
+        ordered = prev + appended
+
+        if len(ordered) > self.max_tables or (fits and not fits(ordered)):
+            ordered = fresh
+
+        self._sessions[session_id] = ordered
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return ordered
@@ -0,0 +1,349 @@
+# app/results.py
+"""
+查询结果登记：每个成功的 execute_sql 结果分配一个 result_id，table 事件只推前 50 行预览，
+其余通过 GET /api/results/{id} 分页 / 选列 / 流式导出 (NDJSON、CSV、Arrow IPC)，不用再问一遍。
+
+- 小结果留在内存里；超过 RESULT_SPILL_ROWS 行或内存超过 RESULT_MAX_MEMORY_MB 时，
+  后台线程落盘成 NDJSON (每 RESULT_INDEX_STRIDE 行记一个字节偏移，分页直接 seek)，落完释放内存
+- 导出按 RESULT_CHUNK_ROWS 行一块边读边写，不会把整个响应拼在内存里
+- 超过 RESULT_TTL_SECONDS 没访问的结果连同落盘文件一起清掉
+- 内存里的结果只在登记它的 worker 可见；落盘的结果 (带 .meta.json) 任何 worker 都能读
+"""
+import os
+import io
+import re
+import csv
+import json
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from .telemetry import register_collector
+from .serialize import dumps, loads
+
+load_dotenv()
+
+_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class ResultSet:
+    __slots__ = ("id", "columns", "row_count", "sql", "created_at", "last_access",
+                 "rows", "path", "offsets", "mem_bytes")
+
+    def __init__(self, rid: str, rows: list, sql: Optional[str]):
+        self.id = rid
+        self.columns = list(rows[0].keys()) if rows else []
+        self.row_count = len(rows)
+        self.sql = sql
+        self.created_at = self.last_access = time.time()
+        self.rows = rows
+        # 落盘后：NDJSON 文件路径 + 每 stride 行的字节偏移
+        self.path = None
+        self.offsets: List[int] = []
+        sample = rows[:20]
+        self.mem_bytes = len(dumps(sample, lenient=True)) * len(rows) // max(len(sample), 1)
+
+    def meta(self) -> dict:
+        return {"id": self.id, "columns": self.columns, "rows": self.row_count, "sql": self.sql,
+                "created_at": self.created_at, "spilled": self.path is not None}
+
+
+class ResultRegistry:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ResultRegistry, cls).__new__(cls)
+            inst = cls._instance
+            inst.ttl = float(os.getenv("RESULT_TTL_SECONDS", 3600))
+            inst.spill_rows = int(os.getenv("RESULT_SPILL_ROWS", 5000))
+            inst.max_memory = float(os.getenv("RESULT_MAX_MEMORY_MB", 256)) * 2 ** 20
+            inst.spill_dir = os.getenv("RESULT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "agent_results"))
+            inst.stride = int(os.getenv("RESULT_INDEX_STRIDE", 1000))
+            inst.chunk_rows = int(os.getenv("RESULT_CHUNK_ROWS", 2000))
+            inst.max_page = int(os.getenv("RESULT_MAX_PAGE", 10000))
+            inst.entries = {}
+            inst._lock = threading.Lock()
+            # 落盘串行做，不和查询抢 CPU / IO
+            inst._spiller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-spill")
+            inst._last_sweep = 0.0
+        return cls._instance
+
+    # ---------------- 登记 / 落盘 / 过期 ----------------
+
+    def register(self, rows: list, sql: Optional[str] = None) -> str:
+        """只存引用，O(1)；大结果交给后台线程落盘"""
+        rs = ResultSet(uuid.uuid4().hex, rows, sql)
+        with self._lock:
+            self.entries[rs.id] = rs
+        self._evict()
+        if rs.row_count > self.spill_rows:
+            self._spiller.submit(self._spill, rs)
+        return rs.id
+
+    def _path(self, rid: str) -> str:
+        return os.path.join(self.spill_dir, f"{rid}.ndjson")
+
+    def _spill(self, rs: ResultSet):
+        rows = rs.rows
+        if rows is None:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path, offsets = self._path(rs.id), []
+        try:
+            with open(path + ".tmp", "wb") as f:
+                for n, row in enumerate(rows):
+                    if n % self.stride == 0:
+                        offsets.append(f.tell())
+                    f.write(dumps(row, lenient=True) + b"\n")
+            os.replace(path + ".tmp", path)
+            with open(self._path(rs.id) + ".meta.json", "w", encoding="utf-8") as f:
+                json.dump(dict(rs.meta(), spilled=True, offsets=offsets), f, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️ [Results] 落盘失败，保留在内存: {e}")
+            return
+        # 先挂上文件再释放内存，读的一方要么看到 rows 要么看到 path
+        rs.path, rs.offsets = path, offsets
+        rs.rows = None
+        print(f"💾 [Results] {rs.id} 已落盘: {rs.row_count} 行 -> {path}")
+
+    def _memory_bytes(self) -> int:
+        return sum(rs.mem_bytes for rs in list(self.entries.values()) if rs.rows is not None)
+
+    def _evict(self):
+        now = time.time()
+        with self._lock:
+            expired = [rs for rs in self.entries.values() if now - rs.last_access > self.ttl]
+            for rs in expired:
+                del self.entries[rs.id]
+        for rs in expired:
+            self._remove_files(rs.id)
+
+        # 内存超预算：从最久没访问的开始落盘 (不丢结果)
+        used = self._memory_bytes()
+        if used > self.max_memory:
+            for rs in sorted(list(self.entries.values()), key=lambda r: r.last_access):
+                if used <= self.max_memory:
+                    break
+                if rs.rows is not None and rs.row_count:
+                    used -= rs.mem_bytes
+                    self._spiller.submit(self._spill, rs)
+
+        # 别的 worker 落下的过期文件，每分钟扫一次；本 worker 还登记着的按 last_access 算，不看 mtime
+        if now - self._last_sweep > 60 and os.path.isdir(self.spill_dir):
+            self._last_sweep = now
+            for name in os.listdir(self.spill_dir):
+                if name[:32] in self.entries:
+                    continue
+                full = os.path.join(self.spill_dir, name)
+                try:
+                    if now - os.path.getmtime(full) > self.ttl:
+                        os.remove(full)
+                except OSError:
+                    pass
+
+    def _remove_files(self, rid: str):
+        for suffix in ("", ".meta.json"):
+            try:
+                os.remove(self._path(rid) + suffix)
+            except OSError:
+                pass
+
+    # ---------------- 读取 ----------------
+
+    def get(self, rid: str) -> Optional[ResultSet]:
+        if not _ID_RE.fullmatch(rid or ""):
+            return None
+        now = time.time()
+        rs = self.entries.get(rid)
+        if rs is not None and now - rs.last_access > self.ttl:
+            # 过期了但还没轮到 _evict：不再返回，顺手清掉
+            with self._lock:
+                self.entries.pop(rid, None)
+            self._remove_files(rid)
+            return None
+        if rs is None:
+            rs = self._load_spilled(rid, now)
+        if rs is not None:
+            rs.last_access = now
+            if rs.path is not None:
+                # 刷新 mtime，别的 worker 扫盘时按最近访问时间算过期
+                for suffix in ("", ".meta.json"):
+                    try:
+                        os.utime(rs.path + suffix, (now, now))
+                    except OSError:
+                        pass
+        return rs
+
+    def _load_spilled(self, rid: str, now: float) -> Optional[ResultSet]:
+        """别的 worker 登记、已落盘的结果；文件超过 TTL 没被访问过的当作已过期"""
+        meta_path = self._path(rid) + ".meta.json"
+        try:
+            if now - os.path.getmtime(meta_path) > self.ttl:
+                self._remove_files(rid)
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        rs = ResultSet(rid, [], meta.get("sql"))
+        rs.columns, rs.row_count, rs.created_at = meta["columns"], meta["rows"], meta["created_at"]
+        rs.rows, rs.path, rs.offsets, rs.mem_bytes = None, self._path(rid), meta["offsets"], 0
+        with self._lock:
+            self.entries[rid] = rs
+        return rs
+
+    def _project(self, rs: ResultSet, columns: Optional[List[str]]) -> List[str]:
+        if not columns:
+            return rs.columns
+        unknown = [c for c in columns if c not in rs.columns]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        return columns
+
+    def iter_chunks(self, rs: ResultSet, offset: int = 0, limit: Optional[int] = None,
+                    columns: Optional[List[str]] = None, chunk_rows: Optional[int] = None) -> Iterator[list]:
+        """按块产出 [row, ...] (已按 columns 投影)，落盘的结果从文件边读边出"""
+        cols = self._project(rs, columns)
+        chunk_rows = chunk_rows or self.chunk_rows
+        end = rs.row_count if limit is None else min(rs.row_count, offset + limit)
+        project = (lambda row: row) if cols == rs.columns else (lambda row: {c: row.get(c) for c in cols})
+
+        rows = rs.rows
+        if rows is not None:
+            for start in range(offset, end, chunk_rows):
+                yield [project(r) for r in rows[start:min(start + chunk_rows, end)]]
+            return
+
+        if offset >= end:
+            return
+        block = offset // self.stride
+        with open(rs.path, "rb") as f:
+            f.seek(rs.offsets[block])
+            n, chunk = block * self.stride, []
+            for line in f:
+                if n >= end:
+                    break
+                if n >= offset:
+                    chunk.append(project(loads(line)))
+                    if len(chunk) >= chunk_rows:
+                        yield chunk
+                        chunk = []
+                n += 1
+            if chunk:
+                yield chunk
+
+    def page(self, rs: ResultSet, offset: int = 0, limit: int = 100, columns: Optional[List[str]] = None) -> dict:
+        limit = max(0, min(limit, self.max_page))
+        offset = max(0, offset)
+        rows = [r for chunk in self.iter_chunks(rs, offset, limit, columns) for r in chunk]
+        next_offset = offset + len(rows)
+        return dict(rs.meta(), columns=self._project(rs, columns), offset=offset, limit=limit, data=rows,
+                    next_offset=next_offset if next_offset < rs.row_count else None)
+
+    # ---------------- 导出 ----------------
+
+    def export(self, rs: ResultSet, fmt: str, offset: int = 0, limit: Optional[int] = None,
+               columns: Optional[List[str]] = None) -> Iterator[bytes]:
+        cols = self._project(rs, columns)
+        chunks = self.iter_chunks(rs, offset, limit, cols)
+        if fmt == "ndjson":
+            for chunk in chunks:
+                yield b"".join(dumps(r, lenient=True) + b"\n" for r in chunk)
+        elif fmt == "csv":
+            # 带 BOM，Excel 打开中文不乱码
+            yield self._csv_lines([cols], "\ufeff")
+            for chunk in chunks:
+                yield self._csv_lines(([r.get(c) for c in cols] for r in chunk))
+        elif fmt == "arrow":
+            yield from self._arrow(chunks, cols)
+        else:
+            raise ValueError(f"unsupported format: {fmt}")
+
+    @staticmethod
+    def _csv_lines(rows, prefix: str = "") -> bytes:
+        buf = io.StringIO()
+        buf.write(prefix)
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _arrow(chunks, cols: List[str]) -> Iterator[bytes]:
+        """Arrow IPC stream：每块一个 RecordBatch，schema 按第一块推断 (pyarrow 为可选依赖)"""
+        import pyarrow as pa
+        buf = io.BytesIO()
+        writer, schema = None, None
+        for chunk in chunks:
+            if schema is None:
+                schema = pa.Table.from_pylist(chunk).select(cols).schema
+                writer = pa.ipc.new_stream(buf, schema)
+            writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if writer is None:
+            schema = pa.schema([(c, pa.null()) for c in cols])
+            writer = pa.ipc.new_stream(buf, schema)
+        writer.close()
+        yield buf.getvalue()
+
+    # ---------------- 观测 ----------------
+
+    def gauges(self) -> list:
+        entries = list(self.entries.values())
+        return [
+            ("results_registered", "Result sets currently registered", {}, len(entries)),
+            ("results_spilled", "Result sets served from disk", {}, sum(rs.path is not None for rs in entries)),
+            ("results_memory_bytes", "Estimated memory held by in-memory result sets", {}, self._memory_bytes()),
+        ]
+
+
+register_collector(lambda: ResultRegistry().gauges())
+
+router = APIRouter()
+
+
+@router.get("/api/results/{result_id}")
+def get_result(result_id: str, offset: int = 0, limit: Optional[int] = None,
+               columns: Optional[str] = None, format: str = "json"):
+    """
+    format=json (默认)：分页返回 {"data": [...], "next_offset": ...}，limit 默认 100
+    format=ndjson / csv / arrow：流式导出 (offset / limit 可选，不传导出全部)
+    columns=a,b,c：只要这几列
+    """
+    registry = ResultRegistry()
+    rs = registry.get(result_id)
+    if rs is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired.")
+    cols = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    try:
+        registry._project(rs, cols)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {e.args[0]}")
+
+    if format == "json":
+        return registry.page(rs, offset, 100 if limit is None else limit, cols)
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Arrow export requires pyarrow (pip install pyarrow).")
+
+    ext = "arrows" if format == "arrow" else format
+    headers = {"Content-Disposition": f'attachment; filename="{result_id}.{ext}"', "X-Total-Rows": str(rs.row_count)}
+    # 同步生成器：Starlette 放到线程池里迭代，读文件不卡事件循环
+    return StreamingResponse(registry.export(rs, format, max(0, offset), limit, cols),
+                             media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
@@ -2,8 +2,61 @@
 import pandas as pd
 import json
 import io
-import contextlib
+import sys
+import threading
 import numpy as np
+from .telemetry import span
+from .cancel import current_scope, interrupt_thread
+from .serialize import to_jsonable
+
+
+class SandboxCancelled(BaseException):
+    """客户端断开时注入到沙箱线程；继承 BaseException，用户代码里的 except Exception 吞不掉"""
+
+
+class _ThreadLocalStdout:
+    """
+    进程级的 sys.stdout 代理：当前线程正在跑沙箱时写进它自己的缓冲区，其余线程照常写到原来的 stdout。
+    沙箱在线程池里并发执行，redirect_stdout 会改全局 sys.stdout (串到别的请求和服务日志里)；
+    只替换 print 又会漏掉直接写 sys.stdout 的输出 (df.info()、sys.stdout.write)。
+    """
+
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+
+    def _stream(self):
+        return getattr(self._local, "buffer", None) or self._target
+
+    def write(self, text):
+        return self._stream().write(text)
+
+    def writelines(self, lines):
+        return self._stream().writelines(lines)
+
+    def flush(self):
+        return self._stream().flush()
+
+    def __getattr__(self, name):
+        # encoding / isatty / fileno 等沿用原来的 stdout
+        return getattr(self._target, name)
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def release(self):
+        self._local.buffer = None
+
+
+_stdout_lock = threading.Lock()
+
+
+def _stdout_proxy() -> _ThreadLocalStdout:
+    """装一次代理；别的代码 (测试框架、日志) 后来又换掉了 sys.stdout 时，包住新的那个"""
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+        return sys.stdout
 
 
 class PythonSandbox:
@@ -15,24 +68,38 @@ class PythonSandbox:
             "json": json
         }
 
-    def _sanitize(self, obj):
-        """清洗数据类型，确保 JSON 可序列化"""
-        if isinstance(obj,
-                      (np.int_, np.intc, np.intp, np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32,
-                       np.uint64)):
-            return int(obj)
-        elif isinstance(obj, (np.float_, np.float16, np.float32, np.float64)):
-            return float(obj)
-        elif isinstance(obj, (np.ndarray,)):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {k: self._sanitize(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._sanitize(i) for i in obj]
-        return obj
+    @staticmethod
+    def _describe(result) -> str:
+        # DataFrame / Series 保留 pandas 自己的表格文本
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            return str(result)
+        return str(to_jsonable(result, lenient=True))
 
     def execute(self, code: str, data_context: list = None) -> dict:
         """执行代码，支持注入 df 变量"""
+        with span("sandbox.execute", code_chars=len(code or ""), rows=len(data_context or [])) as sp:
+            scope = current_scope()
+            key = None
+            if scope is not None:
+                # 在 asyncio.to_thread 的工作线程里跑，客户端断开时往本线程注入异常
+                ident = threading.get_ident()
+                key = scope.register("sandbox", lambda: interrupt_thread(ident, SandboxCancelled))
+                if key is None:
+                    sp.status = "cancelled"
+                    return {"success": False, "error": "Cancelled: client disconnected"}
+            try:
+                try:
+                    res = self._execute(code, data_context)
+                finally:
+                    if scope is not None:
+                        scope.unregister(key)
+            except SandboxCancelled:
+                sp.status = "cancelled"
+                return {"success": False, "error": "Cancelled: client disconnected"}
+            sp.set(success=res["success"])
+            return res
+
+    def _execute(self, code: str, data_context: list = None) -> dict:
         # 1. 静态安全检查
         if any(kw in code for kw in ["os.system", "subprocess", "eval(", "open("]):
             return {"success": False, "error": "System Policy Violation: Unsafe operations."}
@@ -46,11 +113,15 @@ class PythonSandbox:
             except Exception as e:
                 return {"success": False, "error": f"DataFrame conversion failed: {str(e)}"}
 
-        # 3. 捕获输出并执行
+        # 3. 捕获输出并执行：print 和直接写 sys.stdout 的输出都进本线程的 output_capture
         output_capture = io.StringIO()
+        proxy = _stdout_proxy()
+        proxy.capture(output_capture)
         try:
-            with contextlib.redirect_stdout(output_capture):
+            try:
                 exec(code, {}, local_scope)
+            finally:
+                proxy.release()
 
             stdout = output_capture.getvalue()
             chart_config = local_scope.get("chart_config", None)
@@ -59,8 +130,9 @@ class PythonSandbox:
             return {
                 "success": True,
                 "stdout": stdout.strip(),
-                "chart_config": self._sanitize(chart_config) if chart_config else None,
-                "result": str(self._sanitize(result)) if result is not None else None
+                # NumPy / pandas 类型统一由 serialize 转换，不认识的对象用 str() 兜底
+                "chart_config": to_jsonable(chart_config, lenient=True) if chart_config else None,
+                "result": self._describe(result) if result is not None else None
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
\ No newline at end of file
@@ -0,0 +1,113 @@
+# app/serialize.py
+"""
+统一的 JSON 序列化层。
+
+原来查询结果要走好几遍：ToolManager._sanitize 递归转 Decimal / datetime / bytes，
+沙箱里 PythonSandbox._sanitize 再递归转 NumPy 类型，然后 SSE 推送 json.dumps 一次、
+拼进 tool 消息又 json.dumps 一次。现在：
+
+- 装了 orjson 用 orjson (C 实现；datetime / date / NumPy 数组和标量原生支持，NaN 输出 null)，
+  没装退回标准库 json，特殊类型统一走 _default；超过 64 位的整数 orjson 不支持，lenient 时也退回标准库
+- prepare(rows)：序列化一次，同时拿到纯 JSON 类型的对象 (给 pandas / 前端预览) 和字节 (直接复用)
+- RawJSON：已经序列化好的字段，dumps 时原样拼进去，不再重新编码 (orjson 3.8 没有 Fragment)
+"""
+import json
+import datetime
+import decimal
+from typing import Any, Tuple
+
+try:
+    import orjson
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """已经是 JSON 的字节；只在 dict 顶层的值上生效"""
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode("utf-8", errors="ignore")
+    if type(obj).__name__ in ("NaTType", "NAType"):
+        # pandas 的缺失值，先于 datetime 判断 (NaT 也是 datetime 的子类)
+        return None
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        # pandas.Timestamp 等子类 (orjson 只认标准类型)
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        # MySQL TIME 列在 pymysql 里是 timedelta
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    module = type(obj).__module__
+    if module.startswith("pandas"):
+        if hasattr(obj, "to_dict") and hasattr(obj, "columns"):
+            return obj.to_dict(orient="records")
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+    if module.startswith("numpy") and hasattr(obj, "tolist"):
+        # object 数组、orjson 不认的 dtype、标准库 json 下的所有 NumPy 类型
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _lenient_default(obj):
+    try:
+        return _default(obj)
+    except TypeError:
+        return str(obj)
+
+
+def _encode(obj, default) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=_OPTIONS)
+        except TypeError as e:
+            # orjson 只支持 64 位以内的整数 (沙箱里算出来的大数)；宽松模式退回标准库，原样输出
+            if default is not _lenient_default or "64-bit" not in str(e):
+                raise
+    return json.dumps(obj, ensure_ascii=False, default=default, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any, lenient: bool = False) -> bytes:
+    """
+    序列化成 UTF-8 字节 (紧凑格式)。lenient=True 时不认识的类型用 str() 兜底 (导出、日志)；
+    dict 顶层的 RawJSON 值原样拼接。
+    """
+    default = _lenient_default if lenient else _default
+    if isinstance(obj, dict) and any(type(v) is RawJSON for v in obj.values()):
+        parts = []
+        for k, v in obj.items():
+            value = v.raw if type(v) is RawJSON else _encode(v, default)
+            parts.append(_encode(str(k), default) + b":" + value)
+        return b"{" + b",".join(parts) + b"}"
+    return _encode(obj, default)
+
+
+def dumps_str(obj: Any, lenient: bool = False) -> str:
+    return dumps(obj, lenient).decode("utf-8")
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def prepare(obj: Any, lenient: bool = False) -> Tuple[Any, bytes]:
+    """序列化一次：返回 (纯 JSON 类型的对象, 字节)，字节可以用 RawJSON 直接复用"""
+    raw = dumps(obj, lenient)
+    return loads(raw), raw
+
+
+def to_jsonable(obj: Any, lenient: bool = False) -> Any:
+    """转成只含 dict / list / str / 数字 / None 的对象 (替代原来的递归 _sanitize)"""
+    return prepare(obj, lenient)[0]
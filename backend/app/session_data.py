@@ -0,0 +1,216 @@
+# app/session_data.py
+"""
+会话级本地分析：把本会话查出来的结果集登记成表 (t1, t2, ...)，放进进程内的嵌入式引擎，
+追问 ("按月份再分组"、"只看前十") 走 query_session_data 工具在本地跑 SQL，不再回源生产库，
+也不用让 LLM 写 pandas。
+
+- 引擎：装了 duckdb 用 DuckDB (列式、向量化，能直接读落盘的 NDJSON)；没装退回标准库 sqlite3 内存库
+- 数据来自 ResultRegistry (内存里的行 / 落盘文件)，会话第一次查询时才建表，之后复用
+- 只读 + 只能引用本会话的表；DuckDB 建完表后关闭外部文件访问 (read_csv 之类读不了本机文件)
+- 每个会话最多 SESSION_DATA_MAX_TABLES 张表，会话数 / 空闲时间有上限，超出的整体丢弃
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+from .db_guard import SQLGuard
+from .results import ResultRegistry
+
+load_dotenv()
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class _Session:
+    def __init__(self):
+        # name -> {"result_id", "sql", "columns", "rows"}
+        self.tables = OrderedDict()
+        self.seq = 0
+        self.conn = None
+        self.loaded = set()
+        self.last_access = time.time()
+        # 同一会话的查询在线程池里串行执行 (sqlite / duckdb 连接都不是线程安全的)
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+            self.loaded.clear()
+
+
+class SessionData:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SessionData, cls).__new__(cls)
+            inst = cls._instance
+            inst.max_sessions = int(os.getenv("SESSION_DATA_MAX_SESSIONS", 256))
+            inst.max_tables = int(os.getenv("SESSION_DATA_MAX_TABLES", 8))
+            inst.ttl = float(os.getenv("SESSION_DATA_TTL_SECONDS", 3600))
+            inst.max_rows = int(os.getenv("SESSION_DATA_MAX_ROWS", 1000))
+            inst.engine = inst._pick_engine(os.getenv("SESSION_DATA_ENGINE", "auto"))
+            inst.sessions = OrderedDict()
+            inst._lock = threading.Lock()
+            print(f"🦆 [SessionData] 本地分析引擎: {inst.engine}")
+        return cls._instance
+
+    @staticmethod
+    def _pick_engine(name: str) -> str:
+        if name in ("auto", "duckdb"):
+            try:
+                import duckdb  # noqa: F401
+                return "duckdb"
+            except ImportError:
+                if name == "duckdb":
+                    print("⚠️ [SessionData] 未安装 duckdb (pip install duckdb)，退回 sqlite")
+        return "sqlite"
+
+    # ---------------- 登记 ----------------
+
+    def _session(self, key: str, create: bool = False) -> Optional[_Session]:
+        now = time.time()
+        with self._lock:
+            for k in [k for k, s in self.sessions.items() if now - s.last_access > self.ttl]:
+                self.sessions.pop(k).close()
+            sess = self.sessions.get(key)
+            if sess is None and create:
+                sess = self.sessions[key] = _Session()
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)[1].close()
+            if sess is not None:
+                self.sessions.move_to_end(key)
+                sess.last_access = now
+            return sess
+
+    def add(self, key: str, result_id: str, sql: Optional[str] = None) -> Optional[str]:
+        """把 ResultRegistry 里的一个结果登记为本会话的下一张表，返回表名 (t1, t2, ...)"""
+        rs = ResultRegistry().get(result_id)
+        if not key or rs is None or not rs.columns:
+            return None
+        sess = self._session(key, create=True)
+        with sess.lock:
+            sess.seq += 1
+            name = f"t{sess.seq}"
+            sess.tables[name] = {"result_id": result_id, "sql": sql or rs.sql, "columns": list(rs.columns), "rows": rs.row_count}
+            while len(sess.tables) > self.max_tables:
+                old, _ = sess.tables.popitem(last=False)
+                if old in sess.loaded:
+                    sess.conn.execute(f"DROP TABLE IF EXISTS {_quote(old)}")
+                    sess.loaded.discard(old)
+        return name
+
+    def tables(self, key: str) -> List[dict]:
+        sess = self._session(key) if key else None
+        if sess is None:
+            return []
+        return [dict(t, name=name) for name, t in list(sess.tables.items())]
+
+    def latest_rows(self, key: str) -> Optional[list]:
+        """最近一张表的全部行 (分析模式没有上一轮 tool 消息时，用它当 df)"""
+        tables = self.tables(key)
+        registry = ResultRegistry()
+        rs = registry.get(tables[-1]["result_id"]) if tables else None
+        if rs is None:
+            return None
+        return [r for chunk in registry.iter_chunks(rs) for r in chunk]
+
+    # ---------------- 查询 ----------------
+
+    def _connect(self):
+        if self.engine == "duckdb":
+            import duckdb
+            return duckdb.connect(":memory:")
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def _load(self, sess: _Session, name: str, meta: dict):
+        registry = ResultRegistry()
+        rs = registry.get(meta["result_id"])
+        if rs is None:
+            raise ValueError(f"Table {name} has expired, please query the database again.")
+        cols = meta["columns"]
+        if self.engine == "duckdb":
+            if rs.path:
+                # 落盘的结果直接让 DuckDB 读 NDJSON，不经过 Python 对象
+                sess.conn.execute(f"CREATE TABLE {_quote(name)} AS SELECT * FROM read_json_auto(?)", [rs.path])
+            else:
+                import pandas as pd
+                df = pd.DataFrame.from_records(rs.rows, columns=cols)
+                sess.conn.register("_incoming", df)
+                sess.conn.execute(f"CREATE TABLE {_quote(name)} AS SELECT * FROM _incoming")
+                sess.conn.unregister("_incoming")
+        else:
+            sess.conn.execute(f"CREATE TABLE {_quote(name)} ({', '.join(_quote(c) for c in cols)})")
+            insert = f"INSERT INTO {_quote(name)} VALUES ({', '.join('?' * len(cols))})"
+            for chunk in registry.iter_chunks(rs):
+                sess.conn.executemany(insert, [[r.get(c) for c in cols] for r in chunk])
+        sess.loaded.add(name)
+
+    def _ensure_loaded(self, sess: _Session):
+        if sess.conn is None:
+            sess.conn = self._connect()
+        pending = [(n, m) for n, m in sess.tables.items() if n not in sess.loaded]
+        if not pending:
+            return
+        if self.engine == "duckdb" and sess.loaded:
+            # 外部访问已经关了，新表只能重建连接再整体装一遍
+            sess.close()
+            sess.conn = self._connect()
+            pending = list(sess.tables.items())
+        for name, meta in pending:
+            self._load(sess, name, meta)
+        if self.engine == "duckdb":
+            sess.conn.execute("SET enable_external_access = false")
+
+    def _check(self, sql: str, allowed: set) -> str:
+        """单条只读 SELECT，且只能引用本会话的表"""
+        try:
+            statements = [s for s in sqlglot.parse(sql.strip().rstrip(";"), read=self.engine) if s is not None]
+        except SqlglotError as e:
+            raise ValueError(f"SQL parse error: {e}")
+        if len(statements) != 1 or not isinstance(statements[0], SQLGuard.READONLY_ROOTS):
+            raise ValueError("Only a single SELECT over session tables is allowed.")
+        tree = statements[0]
+        for node in tree.walk():
+            if isinstance(node, SQLGuard.FORBIDDEN_NODES):
+                raise ValueError(f"{node.key.upper()} is forbidden.")
+        ctes = {c.alias_or_name.lower() for c in tree.find_all(exp.CTE)}
+        for t in tree.find_all(exp.Table):
+            name = t.name.lower()
+            if t.db or not name or (name not in allowed and name not in ctes):
+                raise ValueError(f"Unknown table {t.sql()}; available: {', '.join(sorted(allowed))}.")
+        return sql.strip().rstrip(";")
+
+    def query(self, key: str, sql: str) -> dict:
+        """同步执行 (调用方放到线程里)；返回 {"status", "data", "columns", "truncated", "engine"}"""
+        sess = self._session(key)
+        if sess is None or not sess.tables:
+            return {"status": "error", "message": "No result tables in this session; use execute_sql first."}
+        start = time.perf_counter()
+        try:
+            with sess.lock:
+                clean = self._check(sql, set(sess.tables))
+                self._ensure_loaded(sess)
+                cursor = sess.conn.execute(clean)
+                columns = [d[0] for d in cursor.description]
+                rows = cursor.fetchmany(self.max_rows + 1)
+        except Exception as e:
+            return {"status": "error", "message": f"Session SQL Error: {e}", "sql": sql}
+        truncated = len(rows) > self.max_rows
+        data = [dict(zip(columns, r)) for r in rows[:self.max_rows]]
+        elapsed = round((time.perf_counter() - start) * 1000, 2)
+        print(f"🦆 [SessionData] {len(data)} rows in {elapsed} ms ({self.engine}): {clean[:100]}")
+        return {"status": "success", "data": data, "columns": columns, "truncated": truncated,
+                "sql": clean, "engine": self.engine, "elapsed_ms": elapsed}
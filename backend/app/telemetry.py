@@ -0,0 +1,274 @@
+# app/telemetry.py
+"""
+链路追踪 + 指标：回答"这次慢在检索、首 token、SQL、自动修复还是沙箱"。
+
+    with span("tool.execute_sql", db=target_db) as sp:
+        ...
+        sp.set(rows=len(res))
+
+每个 span 结束时：
+1. 耗时记入 Prometheus 直方图 agent_stage_seconds{stage, status}，/metrics 输出文本格式 (不依赖 prometheus_client)
+2. OTEL_ENABLED=1 且装了 opentelemetry-sdk 时，同步生成 OTel span (导出器按 OTEL_EXPORTER_OTLP_* 环境变量配置)
+3. TRACE_FILE=path 时每个 span 追加一行 JSON (本地排查 / 测试断言用)
+span 父子关系走 contextvars：asyncio.create_task / to_thread 起的子任务自动挂到当前 span 下。
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+_file_lock = threading.Lock()
+
+# 秒级阶段耗时的默认分桶 (5ms ~ 60s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value) -> str:
+    """Prometheus 文本格式里 label 值要转义反斜杠、双引号和换行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.buckets = name, doc, tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [每个桶的计数..., sum, count]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            for bound, n in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(key, le)} {n}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_label_str(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name, self.doc = name, doc
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._series.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_str(key)} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Duration of each traced stage")
+TTFT_SECONDS = Histogram("agent_ttft_seconds", "Time from request to first streamed token")
+SQL_ROWS = Histogram("agent_sql_rows", "Rows returned by execute_sql", buckets=ROW_BUCKETS)
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM tokens by kind (prompt / completion / cached)")
+METRICS = [STAGE_SECONDS, TTFT_SECONDS, SQL_ROWS, LLM_TOKENS]
+
+# 渲染时现取的 gauge (连接池占用等)：fn() -> [(name, doc, labels, value), ...]
+_collectors: List[Callable[[], List[tuple]]] = []
+
+
+def register_collector(fn: Callable[[], List[tuple]]):
+    _collectors.append(fn)
+    return fn
+
+
+def unregister_collector(fn: Callable[[], List[tuple]]):
+    """测试 / 热重载时撤掉登记过的 collector，没登记过的忽略"""
+    if fn in _collectors:
+        _collectors.remove(fn)
+
+
+def register_metric(metric):
+    """其他模块自己定义的 Histogram / Counter，登记后随 /metrics 一起输出"""
+    METRICS.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            samples = fn()
+        except Exception as e:
+            print(f"⚠️ [Metrics] collector failed: {e}")
+            continue
+        declared = set()
+        for name, doc, labels, value in samples:
+            if name not in declared:
+                declared.add(name)
+                lines.extend([f"# HELP {name} {doc}", f"# TYPE {name} gauge"])
+            lines.append(f"{name}{_label_str(tuple(sorted(labels.items())))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- OpenTelemetry (可选) ----------------
+
+_tracer = None
+_tracer_ready = False
+
+
+def _otel_tracer():
+    """第一次用到时才 import opentelemetry，没装或没开就返回 None"""
+    global _tracer, _tracer_ready
+    if _tracer_ready:
+        return _tracer
+    _tracer_ready = True
+    if os.getenv("OTEL_ENABLED", "0") != "1":
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter as OTLPSpanExporter
+        service = os.getenv("OTEL_SERVICE_NAME", "text2sql-agent")
+        provider = TracerProvider(resource=Resource.create({"service.name": service}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("app.telemetry")
+    except ImportError as e:
+        print(f"⚠️ [Telemetry] OTEL_ENABLED=1 但缺少 opentelemetry-sdk: {e}")
+    return _tracer
+
+
+def _otel_value(v):
+    return v if isinstance(v, (str, bool, int, float)) else str(v)
+
+
+# ---------------- Span ----------------
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "status",
+                 "start", "_t0", "_otel", "_ended")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.status = "ok"
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._ended = False
+        self._otel = None
+        tracer = _otel_tracer()
+        if tracer is not None:
+            from opentelemetry import trace
+            ctx = trace.set_span_in_context(parent._otel) if parent is not None and parent._otel else None
+            self._otel = tracer.start_span(name, context=ctx)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, status: Optional[str] = None):
+        if self._ended:
+            return
+        self._ended = True
+        if status:
+            self.status = status
+        duration = self.elapsed
+        STAGE_SECONDS.observe(duration, stage=self.name, status=self.status)
+
+        if self._otel is not None:
+            from opentelemetry.trace import Status, StatusCode
+            for k, v in self.attrs.items():
+                if v is not None:
+                    self._otel.set_attribute(k, _otel_value(v))
+            if self.status == "error":
+                self._otel.set_status(Status(StatusCode.ERROR, str(self.attrs.get("error", ""))))
+            self._otel.end()
+
+        path = os.getenv("TRACE_FILE")
+        if path:
+            record = {
+                "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": self.start,
+                "duration_ms": round(duration * 1000, 3), "status": self.status, "attrs": self.attrs,
+            }
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with _file_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def start_span(name: str, **attrs) -> Span:
+    """手动结束的 span (流式循环里跨 yield 的阶段用)，挂在当前 span 下但不改变当前 span"""
+    return Span(name, _current.get(), **attrs)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = _current.get()
+    sp = Span(name, parent, **attrs)
+    token = _current.set(sp)
+    try:
+        yield sp
+    except GeneratorExit:
+        sp.status = "cancelled"
+        raise
+    except BaseException as e:
+        # asyncio.CancelledError 也是 BaseException：客户端断开/任务取消
+        sp.status = "cancelled" if type(e).__name__ == "CancelledError" else "error"
+        sp.attrs.setdefault("error", str(e)[:200])
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 异步生成器在另一个 Context 里被关闭，直接还原成父 span
+            _current.set(parent)
+        sp.end()
@@ -0,0 +1,230 @@
+# app/token_budget.py
+import os
+import re
+import json
+from functools import lru_cache
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenCounter:
+    """
+    本地离线 Token 计数 (不走网络)。
+    优先加载 tokenizer.json (HuggingFace tokenizers 格式，可以放 DeepSeek 的词表)，
+    找不到时退化为字符估算：中文约 1 字 1 token，其它约 4 字符 1 token。
+    """
+    _instance = None
+    DEFAULT_PATH = "./models/paraphrase-multilingual-MiniLM-L12-v2/tokenizer.json"
+    _CJK_RE = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TokenCounter, cls).__new__(cls)
+            cls._instance._tokenizer = None
+            cls._instance._loaded = False
+        return cls._instance
+
+    @property
+    def tokenizer(self):
+        # 词表文件十几 MB，首次计数时才加载，不影响启动
+        if not self._loaded:
+            self._loaded = True
+            path = os.getenv("PROMPT_TOKENIZER_PATH", self.DEFAULT_PATH)
+            if os.path.exists(path):
+                try:
+                    from tokenizers import Tokenizer
+                    self._tokenizer = Tokenizer.from_file(path)
+                except Exception as e:
+                    print(f"⚠️ [Budget] Tokenizer 加载失败，使用估算: {e}")
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return _count_cached(self, text)
+
+    def _count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        cjk = len(self._CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count_messages(self, messages: List[dict]) -> int:
+        # 每条消息额外约 4 个 token 的角色/分隔符开销
+        total = 0
+        for m in messages:
+            total += 4 + self.count(str(m.get("content") or ""))
+            if m.get("tool_calls"):
+                total += self.count(json.dumps(m["tool_calls"], ensure_ascii=False))
+        return total
+
+
+@lru_cache(maxsize=4096)
+def _count_cached(counter: TokenCounter, text: str) -> int:
+    # DDL / 静态前缀会反复出现，缓存计数结果
+    return counter._count(text)
+
+
+class PromptBudgeter:
+    """
+    按 Token 预算组装 Prompt：
+    1. DDL 压缩为紧凑的列清单 (去掉索引、字符集、引擎等对写 SQL 无用的部分)
+    2. 超出预算时按检索排名从后往前丢表
+    3. 历史对话只保留预算内的最近几轮，更早的轮次压缩成一条摘要
+    """
+    _COL_RE = re.compile(r"^\s*`([^`]+)`\s+([a-zA-Z]+)(\((?:'(?:[^'\\]|\\.|'')*'|[^)'])*\))?(.*)$")
+    _VALUE_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+    # enum / set 的取值是写 WHERE 条件要用的原值，保留下来 (太长的截断)
+    ENUM_MAX_VALUES = int(os.getenv("PROMPT_ENUM_MAX_VALUES", 20))
+    _COMMENT_RE = re.compile(r"COMMENT\s*=?\s*'((?:[^'\\]|\\.|'')*)'", re.IGNORECASE)
+    _PK_RE = re.compile(r"PRIMARY KEY\s*\(([^)]*)\)", re.IGNORECASE)
+    _HEAD_RE = re.compile(r"^(/\*.*?\*/\s*)?CREATE TABLE\s+`?([^`\s(]+)`?", re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, budget: Optional[int] = None, history_budget: Optional[int] = None):
+        self.counter = TokenCounter()
+        self.budget = budget or int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+        self.history_budget = history_budget or int(os.getenv("PROMPT_HISTORY_BUDGET", 1500))
+        self.profile_budget = int(os.getenv("PROMPT_PROFILE_BUDGET", 800))
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def compress_ddl(ddl: str) -> str:
+        """
+        CREATE TABLE `t` (... 完整定义 ...) ENGINE=... COMMENT='表注释'
+        => /* Database: db */
+           CREATE TABLE `t` (id bigint PK 'id', name varchar '名称', status enum('paid','refunded'), ...) COMMENT='表注释'
+        解析不了的 DDL 原样返回。
+        """
+        head = PromptBudgeter._HEAD_RE.search(ddl)
+        if not head:
+            return ddl
+        db_comment = (head.group(1) or "").strip()
+        table = head.group(2)
+
+        pk = set()
+        m = PromptBudgeter._PK_RE.search(ddl)
+        if m:
+            pk = {c.strip(" `") for c in m.group(1).split(",")}
+
+        cols = []
+        table_comment = ""
+        for line in ddl.splitlines():
+            col = PromptBudgeter._COL_RE.match(line)
+            if col:
+                name, ctype, args, rest = col.group(1), col.group(2).lower(), col.group(3), col.group(4)
+                item = f"{name} {ctype}"
+                if ctype in ("enum", "set") and args:
+                    values = PromptBudgeter._VALUE_RE.findall(args)
+                    more = ",..." if len(values) > PromptBudgeter.ENUM_MAX_VALUES else ""
+                    item += f"({','.join(values[:PromptBudgeter.ENUM_MAX_VALUES])}{more})"
+                if name in pk:
+                    item += " PK"
+                c = PromptBudgeter._COMMENT_RE.search(rest)
+                if c and c.group(1) and c.group(1) != name:
+                    item += f" '{c.group(1)}'"
+                cols.append(item)
+            elif line.startswith(")"):
+                c = PromptBudgeter._COMMENT_RE.search(line)
+                if c:
+                    table_comment = c.group(1)
+
+        if not cols:
+            return ddl
+        compact = f"CREATE TABLE `{table}` ({', '.join(cols)})"
+        if table_comment:
+            compact += f" COMMENT='{table_comment}'"
+        return f"{db_comment}\n{compact}" if db_comment else compact
+
+    def context_tokens(self, rag_results: Dict[str, List[str]], ddl_list: Optional[List[str]] = None) -> int:
+        ddl_list = rag_results.get('ddl', []) if ddl_list is None else ddl_list
+        parts = list(ddl_list) + rag_results.get('doc', []) + rag_results.get('sql', [])
+        return sum(self.counter.count(p) + 2 for p in parts)
+
+    def fit_context(self, rag_results: Dict[str, List[str]], reserved: int) -> Dict[str, List[str]]:
+        """
+        reserved: 已被静态前缀、工具定义、历史对话占用的 Token。
+        检索结果按相关度排序，超预算时先丢 SQL 示例/文档的尾部，再丢排名靠后的表 (至少保留 1 张)。
+        """
+        res = {
+            "ddl": [self.compress_ddl(d) for d in rag_results.get('ddl', [])],
+            "doc": list(rag_results.get('doc', [])),
+            "sql": list(rag_results.get('sql', [])),
+        }
+        for k, v in rag_results.items():
+            res.setdefault(k, v)
+        available = self.budget - reserved
+
+        while self.context_tokens(res) > available:
+            if len(res['sql']) > 1:
+                res['sql'].pop()
+            elif len(res['doc']) > 1:
+                res['doc'].pop()
+            elif len(res['ddl']) > 1:
+                res['ddl'].pop()
+            else:
+                break
+        return res
+
+    def fit_profiles(self, profiles: Dict[str, str], ddl_list: List[str], available: int) -> str:
+        """
+        列画像 (SCHEMA_PROFILE) 按 DDL 的顺序逐表放入，不超过 min(PROMPT_PROFILE_BUDGET, 剩余预算)。
+        只给进了 Prompt 的表配画像；放不下的表直接省略 (DDL 本身优先)。
+        """
+        if not profiles:
+            return ""
+        from .prompt import PromptBuilder
+        limit = min(self.profile_budget, available)
+        lines, used = [], 0
+        for ddl in ddl_list:
+            key = PromptBuilder.ddl_key(ddl)
+            if key not in profiles:
+                continue
+            line = f"- {key}: {profiles[key]}"
+            cost = self.counter.count(line) + 1
+            if used + cost > limit:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    def fits(self, rag_results: Dict[str, List[str]], ddl_list: List[str], reserved: int) -> bool:
+        return self.context_tokens(rag_results, ddl_list) <= self.budget - reserved
+
+    @staticmethod
+    def _brief(text, limit=60) -> str:
+        text = " ".join(str(text or "").split())
+        return text if len(text) <= limit else text[:limit] + "..."
+
+    def fit_history(self, history: List[dict]) -> List[dict]:
+        """
+        从最新一条往前取，直到用完历史预算 (最后一条用户消息无论多长都保留)。
+        窗口外的旧轮次压缩为一条 system 摘要，避免丢失上下文。
+        """
+        window = []
+        used = 0
+        for msg in reversed(history):
+            cost = self.counter.count_messages([msg])
+            if window and used + cost > self.history_budget:
+                break
+            window.insert(0, msg)
+            used += cost
+
+        # 窗口不能以 tool 消息开头 (它对应的 assistant tool_calls 已被裁掉)
+        while len(window) > 1 and window[0].get("role") == "tool":
+            window.pop(0)
+
+        older = history[:len(history) - len(window)]
+        lines = []
+        for m in older:
+            role = m.get("role")
+            if role == "user":
+                lines.append(f"- User asked: {self._brief(m.get('content'))}")
+            elif role == "assistant" and m.get("content"):
+                lines.append(f"- Assistant answered: {self._brief(m.get('content'))}")
+        if not lines:
+            return window
+
+        summary = "Earlier conversation (summarized):\n" + "\n".join(lines[-10:])
+        return [{"role": "system", "content": summary}] + window
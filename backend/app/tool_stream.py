@@ -0,0 +1,92 @@
+# app/tool_stream.py
+from typing import List
+
+
+class JsonClosureScanner:
+    """
+    增量扫描 JSON 片段，判断最外层对象是否已经闭合。
+    只跟踪括号深度和字符串/转义状态，不做完整解析，每个字符 O(1)。
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.closed = False
+
+    def feed(self, fragment: str) -> bool:
+        for ch in fragment:
+            if self.closed:
+                break
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]":
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    self.closed = True
+        return self.closed
+
+
+class ToolCallAssembler:
+    """
+    拼接 delta.tool_calls 碎片，并在每个工具的参数 JSON 闭合的瞬间报告出来，
+    让 Agent 可以在 LLM 还在输出后续工具时就开始执行前面的 SQL。
+    calls 的结构与 OpenAI 的 tool_calls 保持一致，可以直接写回 msgs。
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._scanners = []
+        self._reported = set()
+
+    def feed(self, tool_deltas) -> List[int]:
+        """喂入一个 chunk 的 delta.tool_calls，返回这次刚刚完整的工具下标"""
+        ready = []
+        for tool_delta in tool_deltas:
+            index = tool_delta.index
+
+            # 新工具开始：前一个工具即使没扫到闭合也视为完整 (兜底非标准输出)
+            if index >= len(self.calls):
+                ready += self._close_before(index)
+                self.calls.append({
+                    "id": tool_delta.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_delta.function.name,
+                        "arguments": ""
+                    }
+                })
+                self._scanners.append(JsonClosureScanner())
+
+            # 拼接参数
+            fragment = tool_delta.function.arguments
+            if fragment:
+                self.calls[index]["function"]["arguments"] += fragment
+                if self._scanners[index].feed(fragment) and index not in self._reported:
+                    self._reported.add(index)
+                    ready.append(index)
+        return ready
+
+    def _close_before(self, index: int) -> List[int]:
+        ready = []
+        for i in range(index):
+            if i not in self._reported:
+                self._reported.add(i)
+                ready.append(i)
+        return ready
+
+    def finish(self) -> List[int]:
+        """流结束，剩下没报告的工具全部视为完整"""
+        return self._close_before(len(self.calls))
@@ -2,17 +2,44 @@
 import json
 import re
 import ast
-import datetime
-import decimal
+import threading
 from typing import Dict, Any
 from .db import DBManager
+from .db_guard import SQLGuard
+from .telemetry import span, SQL_ROWS
+from .cancel import current_scope
+from .serialize import prepare
 
 
 class ToolManager:
     def __init__(self):
         self.db = DBManager()
 
-    def get_definitions(self):
+    SESSION_DATA_TOOL = {
+        "type": "function",
+        "function": {
+            "name": "query_session_data",
+            "description": "Run a read-only SQL query locally over result tables from earlier in this conversation "
+                           "(t1, t2, ... listed under Session Result Tables). Use it for follow-ups such as "
+                           "re-grouping, filtering or top-N; it does not touch the production database.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "SQL over session tables, e.g. SELECT ... FROM t1"}
+                },
+                "required": ["query"]
+            }
+        }
+    }
+
+    def get_definitions(self, with_session_data: bool = False):
+        """with_session_data: 本会话已有结果表时，追加 query_session_data (放最后，不影响前面的缓存前缀)"""
+        definitions = self._base_definitions()
+        if with_session_data:
+            definitions.append(self.SESSION_DATA_TOOL)
+        return definitions
+
+    def _base_definitions(self):
         return [
             {
                 "type": "function",
@@ -74,32 +101,88 @@ class ToolManager:
             pass
         return {}
 
-    def _sanitize(self, data: Any) -> Any:
-        if isinstance(data, list): return [self._sanitize(i) for i in data]
-        if isinstance(data, dict): return {k: self._sanitize(v) for k, v in data.items()}
-        if isinstance(data, (datetime.datetime, datetime.date)): return data.isoformat()
-        if isinstance(data, decimal.Decimal): return float(data)
-        if isinstance(data, bytes): return data.decode('utf-8', errors='ignore')
-        return data
+    def _target_db(self, sql: str = "") -> str:
+        # 优先连 SQL 里引用的第一个库 (解析树有缓存，不重复解析)
+        try:
+            for table in SQLGuard.tables(sql):
+                if "." in table:
+                    return table.split(".", 1)[0]
+        except ValueError:
+            pass
+        # 否则随便连一个库，只要能执行 SQL 即可 (MySQL 支持跨库查询)
+        dbs = self.db._fetch_all_dbs()
+        return dbs[0] if dbs else "mysql"
+
+    def explain(self, sql: str):
+        """
+        预检：EXPLAIN FORMAT=JSON 拿执行计划 (不真正执行查询)
+        EXPLAIN 本身报错 (语法错误等) 时返回 None，交给真正执行时报错并进入自动修复
+        """
+        try:
+            conn = self.db.get_connection(self._target_db(sql), readonly=True)
+            with conn.cursor() as cursor:
+                cursor.execute(f"EXPLAIN FORMAT=JSON {sql}")
+                row = cursor.fetchone()
+                return json.loads(list(row.values())[0]) if row else None
+        except Exception as e:
+            print(f"⚠️ [Explain] skip: {e}")
+            return None
+        finally:
+            if 'conn' in locals() and conn: conn.close()
 
     def execute(self, tool_name, args):
         if tool_name != "execute_sql": return {"status": "error", "message": "Invalid call"}
 
         sql = args.get("query", "")
-
-        # 随便连一个库，只要能执行 SQL 即可 (MySQL 支持跨库查询)
-        dbs = self.db._fetch_all_dbs()
-        target_db = dbs[0] if dbs else "mysql"
+        target_db = self._target_db(sql)
 
         print(f"⚡ [Exec] SQL: {sql[:100]}...")
 
+        scope = current_scope()
+        with span("tool.execute_sql", db=target_db) as sp:
+            kill_key, killer = None, []
+            try:
+                conn = self.db.get_connection(target_db, readonly=True)
+                sp.set(host=conn.host)
+                if scope is not None:
+                    kill_key = self._register_kill(scope, conn, killer)
+                    if kill_key is None and scope.cancelled:
+                        sp.status = "cancelled"
+                        return {"status": "error", "message": "Cancelled: client disconnected"}
+                with conn.cursor() as cursor:
+                    cursor.execute(sql)
+                    res = cursor.fetchall()
+                    sp.set(rows=len(res))
+                    SQL_ROWS.observe(len(res))
+                    # 序列化一次：data 给预览 / pandas，raw 直接拼进 tool 消息
+                    data, raw = prepare(res)
+                    return {"status": "success", "data": data, "raw": raw}
+            except Exception as e:
+                sp.status = "cancelled" if scope is not None and scope.cancelled else "error"
+                sp.set(error=str(e)[:200])
+                return {"status": "error", "message": f"SQL Error: {str(e)}"}
+            finally:
+                if scope is not None:
+                    scope.unregister(kill_key)
+                # KILL 发出去之前不能把连接还回池子，否则可能打断别人的查询
+                for t in killer:
+                    t.join(timeout=5)
+                if 'conn' in locals() and conn: conn.close()
+
+    def _register_kill(self, scope, conn, killer: list):
+        """客户端断开时对这条连接发 KILL QUERY (另起线程发，不阻塞事件循环)"""
+        thread_id = conn.thread_id() if hasattr(conn, "thread_id") else None
+        if thread_id is None:
+            return None
+
+        def kill():
+            t = threading.Thread(target=self._kill, args=(conn, thread_id), daemon=True)
+            t.start()
+            killer.append(t)
+        return scope.register("sql", kill)
+
+    def _kill(self, conn, thread_id: int):
         try:
-            conn = self.db.get_connection(target_db)
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
-                res = cursor.fetchall()
-                return {"status": "success", "data": self._sanitize(res)}
+            self.db.kill_query(conn, thread_id)
         except Exception as e:
-            return {"status": "error", "message": f"SQL Error: {str(e)}"}
-        finally:
-            if 'conn' in locals() and conn: conn.close()
\ No newline at end of file
+            print(f"⚠️ [Exec] KILL QUERY {thread_id} 失败: {e}")
\ No newline at end of file
@@ -1,12 +1,10 @@
 # app/training.py
 from fastapi import APIRouter
 from pydantic import BaseModel
-from .vector_store import VectorStore
+from .vector_service import get_vector_store
 from .db import DBManager
 
 router = APIRouter()
-vs = VectorStore()
-db = DBManager()
 
 
 class TrainRequest(BaseModel):
@@ -17,7 +15,10 @@ class TrainRequest(BaseModel):
 @router.post("/api/rag/train")
 def train(req: TrainRequest):
     try:
-        vs.add_training_data(req.training_type, req.content)
+        added = get_vector_store().add_training_data(req.training_type, req.content)
+        if not added:
+            # 同一个问题 / 文档已经在知识库里了，明确告诉调用方没有新增
+            return {"status": "duplicate", "message": "Training data already exists; nothing added."}
         return {"status": "success", "message": "Training data added."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -26,7 +27,8 @@ def train(req: TrainRequest):
 def auto_train():
     """后台任务调用的函数"""
     try:
-        tables = db.get_all_tables_metadata()
+        vs = get_vector_store()
+        tables = DBManager().get_all_tables_metadata()
         if not tables:
             return {"status": "warning", "message": "No tables found."}
 
@@ -0,0 +1,236 @@
+# app/vector_service.py
+"""
+共享向量服务 (Sidecar)：一台机器只跑一份 Embedding 模型 + FAISS 索引，
+uvicorn 的多个 worker 通过 Unix Socket 调用，内存不随 worker 数增长，
+/api/rag/train 写入后所有 worker 立刻可见。
+
+启动 (backend 目录下)：
+    VECTOR_SERVICE_SOCKET=./data/vector.sock python -m app.vector_service
+    VECTOR_SERVICE_SOCKET=./data/vector.sock uvicorn main:app --workers 8
+"""
+import os
+import json
+import socket
+import struct
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from .telemetry import span
+
+load_dotenv()
+
+_HEADER = struct.Struct("!I")
+
+
+def _pack(obj) -> bytes:
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+class VectorServiceClient:
+    """
+    与 VectorStore 接口一致 (retrieve / add_training_data / model.encode)，
+    业务代码不用关心向量库是本进程的还是 Sidecar 的。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.model = self
+
+    def _sock(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _recv_exact(self, sock, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("vector service closed the connection")
+            buf += chunk
+        return buf
+
+    def _call(self, op: str, **kwargs):
+        # 每个线程一条长连接，断开 (Sidecar 重启) 时重连一次
+        for attempt in range(2):
+            try:
+                sock = self._sock()
+                sock.sendall(_pack(dict(kwargs, op=op)))
+                size = _HEADER.unpack(self._recv_exact(sock, _HEADER.size))[0]
+                resp = json.loads(self._recv_exact(sock, size))
+                break
+            except (ConnectionError, OSError):
+                self._local.sock = None
+                if attempt: raise
+        if resp.get("error"):
+            raise RuntimeError(f"vector service: {resp['error']}")
+        return resp.get("result")
+
+    def retrieve(self, query: str, top_k=8, databases: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        with span("vector.retrieve", queries=1, top_k=top_k, remote=True):
+            return self._call("retrieve", query=query, top_k=top_k, databases=databases)
+
+    def retrieve_batch(self, queries: List[str], top_k=8,
+                       databases: Optional[List[str]] = None) -> List[Dict[str, List[str]]]:
+        with span("vector.retrieve", queries=len(queries), top_k=top_k, remote=True):
+            return self._call("retrieve_batch", queries=list(queries), top_k=top_k, databases=databases)
+
+    def encode_query(self, text: str):
+        import numpy as np
+        q_emb = self.encode([text])
+        return q_emb / np.clip(np.linalg.norm(q_emb, axis=1, keepdims=True), 1e-12, None)
+
+    def retrieve_by_embedding(self, q_emb, top_k=8, databases: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        with span("vector.retrieve", queries=1, top_k=top_k, remote=True, reused_embedding=True):
+            return self._call("retrieve_emb", embedding=[float(x) for x in q_emb[0]], top_k=top_k,
+                              databases=databases)
+
+    def add_training_data(self, dtype: str, content: dict):
+        return self._call("add", dtype=dtype, content=content)
+
+    def add_training_batch(self, dtype: str, contents: List[dict]) -> int:
+        return self._call("add_batch", dtype=dtype, contents=contents)
+
+    def encode(self, texts, **kwargs):
+        import numpy as np
+        if isinstance(texts, str):
+            texts = [texts]
+        return np.array(self._call("encode", texts=list(texts)), dtype="float32")
+
+
+class ReadWriteLock:
+    """多读单写：检索之间并发，写入 (替换索引 / 向量 / 负载) 时等正在进行的检索结束，且期间没有新的检索进来"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            # 有写者在等时新读者让路，避免持续的检索把写入饿死
+            while self._writing or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+
+    def release_write(self):
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class VectorService:
+    def __init__(self, path: str):
+        from .vector_store import VectorStore
+        self.path = path
+        self.store = VectorStore()
+        # 检索走读锁可以并发；写入会替换 indices / vectors / 分区，必须等检索都退出
+        self._lock = ReadWriteLock()
+
+    def _dispatch(self, req: dict):
+        op = req.get("op")
+        if op == "retrieve":
+            with self._lock.read():
+                return self.store.retrieve(req["query"], top_k=req.get("top_k", 8), databases=req.get("databases"))
+        if op == "retrieve_batch":
+            with self._lock.read():
+                return self.store.retrieve_batch(req["queries"], top_k=req.get("top_k", 8),
+                                                 databases=req.get("databases"))
+        if op == "retrieve_emb":
+            with self._lock.read():
+                return self.store.retrieve_by_embedding([req["embedding"]], top_k=req.get("top_k", 8),
+                                                        databases=req.get("databases"))
+        if op == "add":
+            with self._lock.write():
+                return self.store.add_training_data(req["dtype"], req["content"])
+        if op == "add_batch":
+            with self._lock.write():
+                return self.store.add_training_batch(req["dtype"], req["contents"])
+        if op == "encode":
+            return self.store.model.encode(req["texts"]).tolist()
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"unknown op: {op}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                req = json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+                try:
+                    result = await loop.run_in_executor(None, self._dispatch, req)
+                    resp = {"result": result}
+                except Exception as e:
+                    resp = {"error": str(e)}
+                writer.write(_pack(resp))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        print(f"✅ [VectorService] listening on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+
+_client = None
+
+
+def get_vector_store():
+    """配置了 VECTOR_SERVICE_SOCKET 时走共享 Sidecar，否则本进程加载 VectorStore"""
+    global _client
+    path = os.getenv("VECTOR_SERVICE_SOCKET")
+    if path:
+        if _client is None:
+            _client = VectorServiceClient(path)
+        return _client
+    from .vector_store import VectorStore
+    return VectorStore()
+
+
+if __name__ == "__main__":
+    asyncio.run(VectorService(os.getenv("VECTOR_SERVICE_SOCKET", "./data/vector.sock")).serve())
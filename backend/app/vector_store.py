@@ -1,122 +1,562 @@
 # app/vector_store.py
-import faiss
+import hashlib
 import json
+import mmap
 import os
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+import re
+import threading
+import numpy as np
+from typing import List, Dict, Optional
+from .encoder import load_encoder
+from .telemetry import span
+
+
+class PayloadStore:
+    """
+    mmap 的 JSONL 负载存储：内存里只保留每条记录的偏移量 (8 字节/条)，
+    检索命中后才按 id 读出并解析那一行，知识库再大也不会整份读进内存。
+    接口和 list 一致 (len / 下标 / append / 迭代)，VectorStore 里可以直接替换。
+    追加要先解除映射，和检索线程的读取互斥 (_lock 只护住切片，解析 JSON 在锁外)。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._offsets = []
+        self._mm = None
+        self._lock = threading.Lock()
+        self._scan()
+
+    @classmethod
+    def from_json(cls, json_path: str, path: str) -> "PayloadStore":
+        """把原来的 index_xxx.json 转成 JSONL (只在 JSONL 不存在时做一次)"""
+        if not os.path.exists(path) and os.path.exists(json_path):
+            with open(json_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            os.replace(path + ".tmp", path)
+        return cls(path)
+
+    def _scan(self):
+        self._remap()
+        self._offsets = []
+        if self._mm is None:
+            return
+        pos, end = 0, len(self._mm)
+        while pos < end:
+            self._offsets.append(pos)
+            nl = self._mm.find(b"\n", pos)
+            pos = end if nl < 0 else nl + 1
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, i: int) -> dict:
+        with self._lock:
+            n = len(self._offsets)
+            if i < 0:
+                i += n
+            start = self._offsets[i]
+            end = self._offsets[i + 1] if i + 1 < n else len(self._mm)
+            raw = self._mm[start:end]
+        return json.loads(raw)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, item: dict):
+        line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # 追加前先解除映射 (Windows 下映射中的文件不能扩展)
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            try:
+                with open(self.path, "ab") as f:
+                    offset = f.tell()
+                    f.write(line)
+                self._offsets.append(offset)
+            finally:
+                # 写失败也要重新映射，否则后面的读取全部失败
+                self._remap()
 
 
 class VectorStore:
     _instance = None
+    # 加载模型 + 索引要好几秒，期间并发的首次调用必须等同一个实例，不能各自加载一份
+    _instance_lock = threading.Lock()
     DATA_DIR = "./data"
     # 三种类型的索引：表结构、文档、历史 SQL
     FILES = {"ddl": "index_ddl", "doc": "index_doc", "sql": "index_sql"}
 
+    # 向量压缩：flat (float32 精确) | fp16 (内存减半) | pq (乘积量化，约 1/32)
+    INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+    # 压缩索引先取 k * RERANK_FACTOR 个候选，再用磁盘上的原始向量精排
+    RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 4))
+    PQ_M = int(os.getenv("VECTOR_PQ_M", 48))
+    # 负载 (DDL/文档/SQL 原文) 放在 mmap 的 JSONL 里，按需读取
+    PAYLOAD_MMAP = os.getenv("VECTOR_PAYLOAD_MMAP", "0") == "1"
+    # DDL 的 Embedding 文本模板 (见 ddl_emb_text)，效果用 test/bench_retrieval.py 对比；换模板后需重新训练
+    DDL_TEMPLATE = os.getenv("VECTOR_DDL_TEMPLATE", "columns").lower()
+    # 按库过滤检索时，行数少于这个数的库直接用原始向量精确算分，更大的库单独建子索引
+    SUBINDEX_MIN_ROWS = int(os.getenv("VECTOR_SUBINDEX_MIN_ROWS", 4096))
+    _COL_COMMENT_RE = re.compile(r"^\s*`([^`]+)`[^\n]*?COMMENT\s+'([^']*)'", re.MULTILINE)
+    _TABLE_COMMENT_RE = re.compile(r"\)[^()]*?COMMENT\s*=\s*'([^']*)'\s*$")
+
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(VectorStore, cls).__new__(cls)
-            if not os.path.exists(cls.DATA_DIR): os.makedirs(cls.DATA_DIR)
+            with cls._instance_lock:
+                if cls._instance is None:
+                    # 全部加载完才发布，其它线程不会拿到半初始化的实例
+                    inst = super(VectorStore, cls).__new__(cls)
+                    inst._init_store()
+                    cls._instance = inst
+        return cls._instance
 
-            # 加载 Embedding 模型 (Vanna 默认也用这类模型)
-            # 第一次运行会下载，可能稍慢
-            cls._instance.model = SentenceTransformer('./models/paraphrase-multilingual-MiniLM-L12-v2')
+    def _init_store(self):
+        if not os.path.exists(self.DATA_DIR): os.makedirs(self.DATA_DIR)
 
-            cls._instance.indices = {}
-            cls._instance.data_store = {}
-            cls._instance._load_indices()
-        return cls._instance
+        # 加载 Embedding 模型 (Vanna 默认也用这类模型)
+        # torch / faiss 在这里才 import，不拖慢进程启动
+        self.model = load_encoder()
+
+        self.indices = {}
+        self.data_store = {}
+        # 原始向量 (已归一化 float32)，np.memmap 按需换页，只在精排时读候选行
+        self.vectors = {}
+        # 向量文件的校验状态 (模型、条数、emb_text 摘要) 和当前索引的 (类型, 建索引时的条数)，追加时增量更新
+        self._vector_state = {}
+        self._index_kinds = {}
+        # 所有写入 (harvester 收录、/api/rag/train、auto_train 扫描、换编码器) 串行执行
+        self._write_lock = threading.RLock()
+        # 查重用的 emb_text 集合，避免每次 add 都遍历全部负载
+        self.emb_texts = {}
+        # 自动收录的 SQL 示例按规范化后的 SQL 查重 (不同问法、同一条 SQL 只留一条)
+        self.sql_fingerprints = set()
+        # 每条负载的 database (小写，没有为 None)，加载和追加时维护，分区不用再逐条解析负载 (mmap 模式下很贵)
+        self.item_databases = {}
+        # 按 database 字段分区：{key: {db: 全局 id 数组}}，没有 database 的条目 (文档等) 放在 None 下、不参与过滤
+        self.partitions = {}
+        # 大库的子索引，按需构建：{(key, db): (建索引用的 id 数组, faiss index)}
+        self.sub_indices = {}
+        # 检索线程按需建子索引，写入线程重建分区时清空，两边都在这把锁下改 partitions / sub_indices
+        self._partition_lock = threading.Lock()
+        self._load_indices()
+
+    def set_encoder(self, encoder):
+        """切换 Embedding 后端 (见 app/encoder.py)，向量空间变了，所有索引重建"""
+        with self._write_lock:
+            self.model = encoder
+            self._index_kinds = {}
+            for key in self.FILES:
+                self._rebuild_index(key)
 
     def _load_indices(self):
         """加载本地索引"""
         for key in self.FILES:
-            self.data_store[key] = []
             path = os.path.join(self.DATA_DIR, f"{self.FILES[key]}.json")
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        self.data_store[key] = json.load(f)
-                except:
-                    pass
+            if self.PAYLOAD_MMAP:
+                jsonl = os.path.join(self.DATA_DIR, f"{self.FILES[key]}.jsonl")
+                self.data_store[key] = PayloadStore.from_json(path, jsonl)
+            else:
+                self.data_store[key] = []
+                if os.path.exists(path):
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            self.data_store[key] = json.load(f)
+                    except:
+                        pass
+            self.emb_texts[key], self.item_databases[key] = set(), []
+            for x in self.data_store[key]:
+                self.emb_texts[key].add(x.get('emb_text', ''))
+                self.item_databases[key].append(self._item_database(x))
+            if key == 'sql':
+                self.sql_fingerprints = {self._sql_fingerprint(x.get('sql', '')) for x in self.data_store[key]}
             self._rebuild_index(key)
 
-    def _rebuild_index(self, key):
-        """构建 FAISS 向量索引"""
+    def _vector_path(self, key) -> str:
+        # 文件名带上编码器后端，换后端不会误用旧向量；同后端换模型靠 .meta.json 里的 model 校验
+        backend = getattr(self.model, "name", "model").split("+")[0]
+        return os.path.join(self.DATA_DIR, f"{self.FILES[key]}.{backend}.f32")
+
+    def _model_id(self) -> str:
+        return getattr(self.model, "model_id", None) or getattr(self.model, "name", "model")
+
+    @staticmethod
+    def _digest(texts, base=None):
+        """emb_text 的滚动摘要：追加时在旧摘要上继续 update，不用重扫前面的负载"""
+        h = base.copy() if base is not None else hashlib.sha1()
+        for text in texts:
+            h.update(text.encode("utf-8") + b"\0")
+        return h
+
+    def _cached_count(self, path: str, texts: List[str]) -> tuple:
+        """
+        磁盘向量缓存能复用的条数和维度：同一个模型、条数不超过负载、文件够长、
+        前 count 条 emb_text 的摘要一致才复用 (负载被改写 / 换了模型都会重新编码)
+        """
+        try:
+            with open(path + ".meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            count, dim = int(meta["count"]), int(meta["dim"])
+            size = os.path.getsize(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+        if meta.get("model") != self._model_id() or count > len(texts) or size < count * dim * 4:
+            return 0, 0
+        if self._digest(texts[:count]).hexdigest() != meta.get("digest"):
+            print(f"⚠️ [VectorStore] {os.path.basename(path)} 与负载不一致，重新编码")
+            return 0, 0
+        return count, dim
+
+    def _update_vectors(self, key):
+        """
+        负载是只追加的，向量文件 (float32 裸数据 + .meta.json) 也只追加：
+        只编码新增的尾部写到文件末尾，再换上覆盖新长度的 memmap。
+        正在检索的线程手里还是旧的 memmap，文件只增长，旧映射一直有效。
+        返回 (全部向量, 本次之前已有的条数)；已有条数为 0 表示全部重新编码。
+        """
+        import faiss
         data = self.data_store[key]
-        if not data:
+        n = len(data)
+        path = self._vector_path(key)
+        state = self._vector_state.get(key)
+        reload = state is None or state["model"] != self._model_id() or state["path"] != path
+        if reload:
+            # 启动 / 换编码器：先校验磁盘缓存
+            texts = [x.get('emb_text', '') for x in data]
+            start, dim = self._cached_count(path, texts)
+            state = {"model": self._model_id(), "path": path, "count": start, "dim": dim,
+                     "digest": self._digest(texts[:start])}
+            new_texts = texts[start:]
+        else:
+            start = state["count"]
+            new_texts = [data[i].get('emb_text', '') for i in range(start, n)]
+
+        if new_texts:
+            new = np.asarray(self.model.encode(new_texts), dtype='float32')
+            faiss.normalize_L2(new)
+            if start:
+                # 截掉上次没来得及写 meta 的残留再追加 (只动旧映射之外的部分)
+                with open(path, "r+b") as f:
+                    f.seek(start * state["dim"] * 4)
+                    f.truncate()
+                    f.write(new.tobytes())
+            else:
+                # 全量重写：写临时文件再替换，不在旧映射底下截断文件
+                with open(path + ".tmp", "wb") as f:
+                    f.write(new.tobytes())
+                os.replace(path + ".tmp", path)
+            state["dim"] = new.shape[1]
+            state["digest"] = self._digest(new_texts, state["digest"])
+            state["count"] = n
+            with open(path + ".meta.json.tmp", "w", encoding="utf-8") as f:
+                json.dump({"model": state["model"], "dim": state["dim"], "count": n,
+                           "digest": state["digest"].hexdigest()}, f)
+            os.replace(path + ".meta.json.tmp", path + ".meta.json")
+
+        self._vector_state[key] = state
+        vecs = self.vectors.get(key)
+        if new_texts or reload or vecs is None:
+            vecs = np.memmap(path, dtype='float32', mode='r', shape=(n, state["dim"]))
+            self.vectors[key] = vecs
+        return vecs, start
+
+    def _index_kind(self, n: int) -> str:
+        # 数据太少不够训练 PQ 时退回 fp16
+        if self.INDEX_TYPE == "pq" and n < 256 * 39:
+            return "fp16"
+        return self.INDEX_TYPE
+
+    def _build_index(self, vecs):
+        """按 INDEX_TYPE 建 FAISS 索引"""
+        import faiss
+        n, d = vecs.shape
+        index_type = self._index_kind(n)
+
+        if index_type == "fp16":
+            idx = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "pq":
+            m = max(x for x in range(1, min(self.PQ_M, d) + 1) if d % x == 0)
+            idx = faiss.IndexPQ(d, m, 8, faiss.METRIC_INNER_PRODUCT)
+        else:
+            idx = faiss.IndexFlatIP(d)
+
+        if not idx.is_trained:
+            sample = np.ascontiguousarray(vecs[np.linspace(0, n - 1, min(n, 65536)).astype(int)])
+            idx.train(sample)
+        # 分块从 memmap 加入，避免一次性把全部 float32 读进内存
+        for i in range(0, n, 65536):
+            idx.add(np.ascontiguousarray(vecs[i:i + 65536]))
+        return idx
+
+    def _rebuild_index(self, key):
+        """构建 FAISS 向量索引；只追加了尾部且索引类型没变时增量加入"""
+        import faiss
+        if not len(self.data_store[key]):
             self.indices[key] = None
             return
 
-        # 提取用于 Embedding 的文本
-        texts = [i.get('emb_text', '') for i in data]
-        if not texts: return
-
-        emb = self.model.encode(texts)
-        idx = faiss.IndexFlatIP(emb.shape[1])
-        faiss.normalize_L2(emb)
-        idx.add(emb.astype('float32'))
+        vecs, start = self._update_vectors(key)
+        n = vecs.shape[0]
+        old = self.indices.get(key)
+        kind, built_n = self._index_kinds.get(key, (None, 0))
+        # PQ 的码本是建索引时训练的，数据翻倍后重新训练，否则新数据的量化误差越来越大
+        incremental = (old is not None and start and old.ntotal == start and kind == self._index_kind(n)
+                       and (kind != "pq" or n < 2 * built_n))
+        if incremental:
+            if start == n:
+                return
+            # 复制一份再加新向量，建好后整体替换：检索中的线程继续用旧索引，不和 add 并发
+            idx = faiss.clone_index(old)
+            for i in range(start, n, 65536):
+                idx.add(np.ascontiguousarray(vecs[i:min(n, i + 65536)]))
+        else:
+            idx = self._build_index(vecs)
+            self._index_kinds[key] = (self._index_kind(n), n)
+        # 向量在 _update_vectors 里已经换好，新索引返回的 id 一定能在向量里找到
         self.indices[key] = idx
+        self._rebuild_partitions(key)
+
+    @staticmethod
+    def _item_database(item: dict) -> Optional[str]:
+        db = item.get('database')
+        return db.lower() if db else None
+
+    def _rebuild_partitions(self, key):
+        groups = {}
+        for i, db in enumerate(self.item_databases[key]):
+            groups.setdefault(db, []).append(i)
+        partitions = {db: np.asarray(ids, dtype='int64') for db, ids in groups.items()}
+        with self._partition_lock:
+            self.partitions[key] = partitions
+            for sub in [s for s in self.sub_indices if s[0] == key]:
+                del self.sub_indices[sub]
 
     def add_training_data(self, dtype: str, content: dict):
         """
         核心训练方法：将 Schema/Doc/SQL 存入知识库
         """
-        if dtype not in self.FILES: return
-
-        # 1. 构造 Embedding 文本 (决定了检索的准确度)
-        if dtype == 'ddl':
-            # 格式：Database.Table + Columns
-            # 这样用户搜 "lpcarnet.car_base_info" 或 "车型表" 都能搜到
-            db = content.get('database', 'unknown')
-            tb = content.get('table', 'unknown')
-            cols = content.get('columns', '')
-            content['emb_text'] = f"DB: {db}, Table: {tb}, Columns: {cols}"
-
-            # 存储时，把 Database 信息注入到 DDL 字符串中，方便 LLM 识别
-            origin_ddl = content.get('ddl_str', '')
-            content['ddl_str'] = f"/* Database: {db} */\n{origin_ddl}"
-
-        elif dtype == 'sql':
-            content['emb_text'] = content['question']  # 根据问题检索 SQL
-        else:
-            content['emb_text'] = content['doc']
+        return self.add_training_batch(dtype, [content])
+
+    @classmethod
+    def ddl_comments(cls, ddl: str):
+        """从 DDL 里取表注释和列注释：(table_comment, [(column, comment), ...])"""
+        m = cls._TABLE_COMMENT_RE.search(ddl.strip())
+        return (m.group(1) if m else ""), cls._COL_COMMENT_RE.findall(ddl)
+
+    @classmethod
+    def ddl_emb_text(cls, content: dict, template: str = None) -> str:
+        """
+        columns  (默认)：DB + 表名 + 列名，搜 "lpcarnet.car_base_info" 这类精确名字效果好
+        comments：再加上表注释和列注释，中文业务问法 ("车型表"、"销量") 更容易命中
+        """
+        db = content.get('database', 'unknown')
+        tb = content.get('table', 'unknown')
+        cols = content.get('columns', '')
+        template = (template or cls.DDL_TEMPLATE)
+        if template == "comments":
+            table_comment, col_comments = cls.ddl_comments(content.get('ddl_str', ''))
+            described = ", ".join(f"{c}({t})" if t else c for c, t in col_comments) or cols
+            return f"DB: {db}, Table: {tb} {table_comment}, Columns: {described}"
+        return f"DB: {db}, Table: {tb}, Columns: {cols}"
+
+    @staticmethod
+    def _sql_fingerprint(sql: str) -> str:
+        from .db_guard import SQLGuard
+        try:
+            return SQLGuard.fingerprint(sql)
+        except ValueError:
+            return SQLGuard.normalize(sql).lower()
+
+    def add_training_batch(self, dtype: str, contents: List[dict]) -> int:
+        """
+        批量写入：所有条目一起落盘、只重建一次索引 (写放大与批次数成正比，而不是条目数)
+        返回实际新增的条数
+        """
+        if dtype not in self.FILES: return 0
+        with self._write_lock:
+            return self._add_batch(dtype, contents)
 
-        # 2. 查重 (防止重复训练)
-        for x in self.data_store[dtype]:
-            if x['emb_text'] == content['emb_text']: return
+    def _add_batch(self, dtype: str, contents: List[dict]) -> int:
 
-        # 3. 存储并重建索引
-        self.data_store[dtype].append(content)
+        added = 0
+        refreshed = 0
+        positions = None
+        for content in contents:
+            # 1. 构造 Embedding 文本 (决定了检索的准确度)
+            if dtype == 'ddl':
+                # 格式：Database.Table + Columns (+ 注释，取决于 DDL_TEMPLATE)
+                # 这样用户搜 "lpcarnet.car_base_info" 或 "车型表" 都能搜到
+                db = content.get('database', 'unknown')
+                content['emb_text'] = self.ddl_emb_text(content)
 
-        with open(os.path.join(self.DATA_DIR, f"{self.FILES[dtype]}.json"), 'w', encoding='utf-8') as f:
-            json.dump(self.data_store[dtype], f, ensure_ascii=False, indent=2)
+                # 存储时，把 Database 信息注入到 DDL 字符串中，方便 LLM 识别
+                origin_ddl = content.get('ddl_str', '')
+                content['ddl_str'] = f"/* Database: {db} */\n{origin_ddl}"
 
-        self._rebuild_index(dtype)
+            elif dtype == 'sql':
+                content['emb_text'] = content['question']  # 根据问题检索 SQL
+            else:
+                content['emb_text'] = content['doc']
 
-    def retrieve(self, query: str, top_k=8) -> Dict[str, List[str]]:
+            # 2. 查重 (防止重复训练)：同一问题；自动收录的 SQL 还要求规范化后不同
+            #    (手工训练的同一条 SQL 换个问法是有意补充的，照常写入)
+            if content['emb_text'] in self.emb_texts[dtype]:
+                # 重新扫描时表没变，但列画像可能更新了：只改负载，不动向量
+                if dtype == 'ddl' and content.get('profile') and not self.PAYLOAD_MMAP:
+                    if positions is None:
+                        positions = {c.get('emb_text'): i for i, c in enumerate(self.data_store[dtype])}
+                    old = self.data_store[dtype][positions[content['emb_text']]]
+                    if old.get('profile') != content['profile']:
+                        old['profile'] = content['profile']
+                        refreshed += 1
+                continue
+            if dtype == 'sql':
+                fp = self._sql_fingerprint(content.get('sql', ''))
+                if content.get('source') == 'harvest' and fp in self.sql_fingerprints: continue
+                self.sql_fingerprints.add(fp)
+
+            # 3. 存储
+            self.data_store[dtype].append(content)
+            self.emb_texts[dtype].add(content['emb_text'])
+            self.item_databases[dtype].append(self._item_database(content))
+            added += 1
+
+        if not added and not refreshed: return 0
+
+        if not self.PAYLOAD_MMAP:
+            with open(os.path.join(self.DATA_DIR, f"{self.FILES[dtype]}.json"), 'w', encoding='utf-8') as f:
+                json.dump(self.data_store[dtype], f, ensure_ascii=False, indent=2)
+
+        # 4. 重建索引 (只编码新增部分)
+        if added:
+            self._rebuild_index(dtype)
+        return added
+
+    def _search(self, key, q_emb, k: int, databases: Optional[List[str]] = None) -> List[int]:
+        """压缩索引多取候选，再用原始向量算精确内积重排"""
+        import faiss
+        if databases is not None:
+            return self._search_partitions(key, q_emb, k, databases)
+        idx = self.indices[key]
+        n = len(self.data_store[key])
+        compressed = not isinstance(idx, faiss.IndexFlat)
+        fetch = min(n, k * self.RERANK_FACTOR if compressed else k)
+        D, I = idx.search(q_emb, fetch)
+        ids = [int(i) for i in I[0] if 0 <= i < n]
+        if compressed and ids:
+            exact = np.asarray(self.vectors[key][ids]) @ q_emb[0]
+            ids = [ids[j] for j in np.argsort(-exact)]
+        return ids[:k]
+
+    def _sub_index(self, key, db, ids):
+        with self._partition_lock:
+            cached = self.sub_indices.get((key, db))
+        if cached is not None and cached[0] is ids:
+            return cached[1]
+        # 建索引比较慢，不占着锁；建好时分区已经被重建 (ids 过期) 就只给本次检索用，不缓存
+        sub = self._build_index(np.asarray(self.vectors[key][ids]))
+        with self._partition_lock:
+            if (self.partitions.get(key) or {}).get(db) is ids:
+                self.sub_indices[(key, db)] = (ids, sub)
+        return sub
+
+    def _search_partitions(self, key, q_emb, k: int, databases: List[str]) -> List[int]:
+        """
+        只在允许的库里检索：每个库各取 top-k (小库直接精确算分，大库走自己的子索引 + 精排)，
+        再按精确内积合并成全局 top-k。耗时随允许的库的规模走，而不是全部库。
+        没有 database 字段的条目 (文档、未标注库的 SQL 示例) 不受过滤。
+        """
+        import faiss
+        with self._partition_lock:
+            parts = self.partitions.get(key) or {}
+        wanted = [None] + sorted({d.lower() for d in databases if d})
+        candidates = []
+        for db in wanted:
+            ids = parts.get(db)
+            if ids is None or not len(ids):
+                continue
+            if len(ids) >= self.SUBINDEX_MIN_ROWS:
+                sub = self._sub_index(key, db, ids)
+                compressed = not isinstance(sub, faiss.IndexFlat)
+                _, I = sub.search(q_emb, min(len(ids), k * self.RERANK_FACTOR if compressed else k))
+                ids = ids[[i for i in I[0] if 0 <= i < len(ids)]]
+            candidates.append(ids)
+        if not candidates:
+            return []
+        ids = np.concatenate(candidates)
+        scores = np.asarray(self.vectors[key][ids]) @ q_emb[0]
+        return [int(ids[j]) for j in np.argsort(-scores)[:k]]
+
+    def retrieve(self, query: str, top_k=8, databases: Optional[List[str]] = None) -> Dict[str, List[str]]:
         """
         语义检索：Vanna 模式的核心
         只返回 Top-K 相关的表结构，节省 Token
+        databases: 请求方有权访问的库，None 表示不过滤
         """
-        res = {"ddl": [], "doc": [], "sql": []}
-        if not any(self.indices.values()): return res
+        return self.retrieve_batch([query], top_k=top_k, databases=databases)[0]
+
+    def retrieve_batch(self, queries: List[str], top_k=8,
+                       databases: Optional[List[str]] = None) -> List[Dict[str, List[str]]]:
+        """批量检索：所有问题一次 encode (批处理评测/预热缓存用)"""
+        import faiss
+        if not queries: return []
+        if not any(self.indices.values()):
+            return [{"ddl": [], "doc": [], "sql": []} for _ in queries]
 
-        q_emb = self.model.encode([query])
+        with span("vector.retrieve", queries=len(queries), top_k=top_k, index=self.INDEX_TYPE,
+                  databases=len(databases) if databases is not None else "all"):
+            with span("vector.encode", texts=len(queries)):
+                q_embs = np.asarray(self.model.encode(list(queries)), dtype='float32')
+            faiss.normalize_L2(q_embs)
+            return [self._retrieve_emb(q_embs[i:i + 1], top_k, databases) for i in range(len(queries))]
+
+    def encode_query(self, text: str):
+        """单条问题编码并归一化 -> (1, dim)；意图识别和检索共用，一个问题只 encode 一次"""
+        import faiss
+        q_emb = np.asarray(self.model.encode([text]), dtype='float32')
         faiss.normalize_L2(q_emb)
+        return q_emb
+
+    def retrieve_by_embedding(self, q_emb, top_k=8, databases: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """用 encode_query 得到的向量检索，跳过编码"""
+        if not any(self.indices.values()):
+            return {"ddl": [], "doc": [], "sql": []}
+        with span("vector.retrieve", queries=1, top_k=top_k, index=self.INDEX_TYPE, reused_embedding=True,
+                  databases=len(databases) if databases is not None else "all"):
+            return self._retrieve_emb(np.asarray(q_emb, dtype='float32').reshape(1, -1), top_k, databases)
 
+    def _retrieve_emb(self, q_emb, top_k: int, databases: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        res = {"ddl": [], "doc": [], "sql": []}
         for key, idx in self.indices.items():
             if not idx: continue
 
             # DDL 查多一点 (top_k)，文档和 SQL 查少一点
             k = top_k if key == 'ddl' else 3
-            D, I = idx.search(q_emb.astype('float32'), min(k, len(self.data_store[key])))
-
-            for i in I[0]:
-                if i < len(self.data_store[key]):
-                    item = self.data_store[key][i]
-                    if key == 'ddl':
-                        res['ddl'].append(item.get('ddl_str', ''))
-                    elif key == 'doc':
-                        res['doc'].append(item.get('doc', ''))
-                    elif key == 'sql':
-                        res['sql'].append(f"Q: {item.get('question')}\nA: {item.get('sql')}")
-        return res
\ No newline at end of file
+            for i in self._search(key, q_emb, k, databases):
+                # 只解析命中的负载 (mmap 模式下才真正读盘)
+                item = self.data_store[key][i]
+                if key == 'ddl':
+                    res['ddl'].append(item.get('ddl_str', ''))
+                    if item.get('profile'):
+                        # 列画像按 database.table 挂着，进 Prompt 时再按预算取舍
+                        table = f"{item.get('database')}.{item.get('table')}".lower()
+                        res.setdefault('profiles', {})[table] = item['profile']
+                elif key == 'doc':
+                    res['doc'].append(item.get('doc', ''))
+                elif key == 'sql':
+                    res['sql'].append(f"Q: {item.get('question')}\nA: {item.get('sql')}")
+        return res
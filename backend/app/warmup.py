@@ -0,0 +1,87 @@
+# app/warmup.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .db import DBManager
+from .vector_service import get_vector_store
+from .intent import IntentRouter
+from .llm import LLMService
+
+# 这几个阶段失败时服务答不了任何问题，不能标记 ready；其余阶段失败只是降级
+REQUIRED_PHASES = ("vector_store", "llm_client")
+
+
+class Readiness:
+    """启动预热状态，/ready 根据它决定是否接流量"""
+    ready = False
+    phases = {}
+    errors = {}
+    required = REQUIRED_PHASES
+
+
+def _timed(name: str, fn) -> bool:
+    start = time.perf_counter()
+    ok = True
+    try:
+        fn()
+    except Exception as e:
+        ok = False
+        Readiness.errors[name] = str(e)
+        print(f"⚠️ [Warmup] {name} 失败: {e}")
+    cost = round((time.perf_counter() - start) * 1000, 1)
+    Readiness.phases[name] = cost
+    print(f"⏱️ [Warmup] {name}: {cost} ms")
+    return ok
+
+
+def _warm_llm_client():
+    # 缺 LLM_API_KEY 等配置时 SDK 在构造客户端时就会报错
+    LLMService()
+
+
+def _warm_db_pools():
+    db = DBManager()
+    dbs = db._fetch_all_dbs()
+
+    def touch(name):
+        # 建池时按 mincached 建好空闲连接，并走一次只读路由 (副本池也一起建好)
+        for readonly in (False, True):
+            conn = db.get_connection(name, readonly=readonly)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(touch, dbs))
+
+
+def _warm_encoder():
+    # 第一次 encode 会触发 torch 的算子初始化/内存分配，提前跑掉
+    get_vector_store().model.encode(["warmup 预热"])
+
+
+def _warm_intent_router():
+    # 意图样本的质心要 encode 一批样本，放到启动时算
+    IntentRouter().centroids(get_vector_store())
+
+
+def warm_up() -> dict:
+    """
+    依次预热：加载向量索引 -> LLM 客户端 -> 跑一次 dummy encode -> 意图质心 -> 建好数据库连接池
+    单个阶段失败只记录不阻塞 (数据库挂了也能先提供闲聊)，全部跑完且 REQUIRED_PHASES 都成功才标记 ready
+    """
+    total = time.perf_counter()
+    ok = {
+        "vector_store": _timed("vector_store", get_vector_store),
+        "llm_client": _timed("llm_client", _warm_llm_client),
+        "encoder": _timed("encoder", _warm_encoder),
+        "intent_router": _timed("intent_router", _warm_intent_router),
+        "db_pools": _timed("db_pools", _warm_db_pools),
+    }
+    Readiness.phases["total"] = round((time.perf_counter() - total) * 1000, 1)
+    failed = [name for name in REQUIRED_PHASES if not ok[name]]
+    Readiness.ready = not failed
+    if failed:
+        print(f"❌ [Warmup] 必需阶段失败 {failed}，/ready 保持 503")
+    else:
+        print(f"✅ [Warmup] 预热完成，总耗时 {Readiness.phases['total']} ms")
+    return Readiness.phases
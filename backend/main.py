@@ -1,17 +1,27 @@
 # main.py
+import os
+import re
+import uuid
 import uvicorn
 import asyncio
-import json
 from contextlib import asynccontextmanager
-from typing import List, Dict, Any
-from fastapi import FastAPI
+from typing import List, Dict, Any, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
 from app.agent import AgentEngine
 from app.training import router as training_router
 from app.training import auto_train
+from app.results import router as results_router
+from app.db import DBManager
+from app.warmup import warm_up, Readiness
+from app.batch import BatchRunner
+from app.telemetry import render_metrics, register_collector
+from app.admission import AdmissionController, AdmissionRejected
+from app.serialize import dumps
+from app.cancel import CancelScope, ClientDisconnected, bind_scope, unbind_scope, watch_disconnect
 
 
 # 🔥 Vanna 模式的核心：服务启动后，后台静默建立索引
@@ -20,13 +30,20 @@ async def lifespan(app: FastAPI):
     # 1. 启动服务
     print("🚀 [System] 服务已启动 (Vanna-Like Mode)")
 
-    # 2. 创建后台任务扫描数据库 (不阻塞主线程)
-    asyncio.create_task(background_indexing_task())
+    # 2. 后台预热 + 扫描数据库 (不阻塞启动，/ready 在预热完成前返回 503)
+    asyncio.create_task(startup_task())
 
     yield
     print("👋 [System] 服务关闭")
 
 
+async def startup_task():
+    loop = asyncio.get_event_loop()
+    # 先预热 (连接池、模型、索引)，再做耗时的全量扫描，扫描期间已经可以正常服务
+    await loop.run_in_executor(None, warm_up)
+    await background_indexing_task()
+
+
 async def background_indexing_task():
     """后台全量扫描数据库，建立 RAG 索引"""
     print("⏳ [Background] 开始全量扫描数据库 Schema (构建知识库)...")
@@ -43,6 +60,8 @@ app = FastAPI(lifespan=lifespan)
 
 # 注册训练接口 (你可以手动调用 API 来补充文档或 SQL 对)
 app.include_router(training_router)
+# 查询结果分页 / 导出
+app.include_router(results_router)
 
 app.add_middleware(
     CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
@@ -51,31 +70,193 @@ app.add_middleware(
 engine = AgentEngine()
 
 
+def _pool_gauges():
+    """连接池占用 / 等待时间 / 副本延迟，/metrics 抓取时现算"""
+    samples = []
+    stats = DBManager().get_pool_stats()
+    for p in stats["pools"]:
+        labels = {"host": p["host"], "database": p["database"]}
+        samples.append(("db_pool_in_use", "Connections currently checked out", labels, p["in_use"]))
+        samples.append(("db_pool_max", "Pool capacity", labels, p["max_connections"]))
+        samples.append(("db_pool_wait_avg_ms", "Average wait to acquire a connection", labels, p["wait_avg_ms"]))
+    for r in stats["replicas"]:
+        labels = {"host": r["host"]}
+        samples.append(("db_replica_healthy", "Replica passes health/lag check", labels, int(bool(r["healthy"]))))
+        if r["lag"] is not None:
+            samples.append(("db_replica_lag_seconds", "Replica lag behind primary", labels, r["lag"]))
+    return samples
+
+
+register_collector(_pool_gauges)
+
+
+class BatchRequest(BaseModel):
+    # [{"id": "q1", "question": "..."}]
+    questions: List[Dict[str, Any]]
+    # 实际并发不超过 ADMISSION_PER_USER：每个问题都要先过准入控制
+    concurrency: int = 8
+    databases: Optional[List[str]] = None
+    # 同 ChatRequest：按用户 / 租户计入准入控制，不传时取 X-User-Id / X-Tenant-Id 请求头
+    user_id: Optional[str] = None
+    tenant_id: Optional[str] = None
+
+
 class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]]
+    # 同一会话的多轮请求带相同 session_id，用于复用 Prompt 前缀 (命中 Provider 缓存) 和会话结果表；
+    # 按 用户 + session_id 隔离，没有明确的用户标识时不跨请求复用
+    session_id: Optional[str] = None
+    # 准入控制按用户 / 租户限并发，不传时取 X-User-Id / X-Tenant-Id 请求头
+    user_id: Optional[str] = None
+    tenant_id: Optional[str] = None
+    # 用户有权访问的库：检索只在这些库的表里找，不传时取 X-Allowed-Databases 请求头 (逗号分隔)，都没有则不限
+    databases: Optional[List[str]] = None
+
 
+def _sse(event: dict) -> bytes:
+    # 每个事件只编码一次，直接以字节写出
+    return b"data: " + dumps(event, lenient=True) + b"\n\n"
 
-async def sse_stream(history: List[Dict[str, Any]]):
+
+async def sse_stream(history: List[Dict[str, Any]], session_id: Optional[str] = None, principal=None,
+                     request: Optional[Request] = None, databases: Optional[List[str]] = None,
+                     user: Optional[str] = None):
     yield "data: {\"type\": \"ping\", \"content\": \"connected\"}\n\n"
+    admission = AdmissionController()
+    ticket = None
+    # 客户端断开 -> 取消整个请求：关 LLM 流、KILL 正在跑的 SQL、打断沙箱
+    scope = CancelScope()
+    scope_token = bind_scope(scope)
+    watcher = asyncio.create_task(watch_disconnect(request, scope)) if request is not None else None
     try:
-        async for event in engine.run(history):
-            payload = json.dumps(event, ensure_ascii=False)
-            yield f"data: {payload}\n\n"
+        # 在响应体里才排队：生成器没跑起来 (客户端开流前就断了) 就不会有占着名额的 Ticket
+        # 排队中：推送队列位置，直到拿到执行名额
+        if principal is not None:
+            try:
+                ticket = admission.enqueue(*principal)
+                async for status in admission.wait(ticket):
+                    if scope.cancelled:
+                        return
+                    yield _sse(dict(status, type='queue'))
+            except AdmissionRejected as e:
+                err = {"type": "error", "code": 429, "reason": e.reason, "retry_after": e.retry_after, "content": str(e)}
+                yield _sse(err)
+                return
+
+        async for event in engine.run(history, session_id=session_id, databases=databases, user=user):
+            yield _sse(event)
         yield "data: [DONE]\n\n"
+    except ClientDisconnected:
+        # 没人收了，不用再推 error
+        print(f"🔌 [SSE] 客户端已断开，请求已取消 (session={session_id})")
+    except (asyncio.CancelledError, GeneratorExit):
+        # StreamingResponse 发现断开后会直接取消这个生成器：线程里的 SQL / 沙箱还得单独停
+        scope.cancel("client_disconnected")
+        raise
     except Exception as e:
         print(f"❌ Error: {e}")
-        err = json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False)
-        yield f"data: {err}\n\n"
+        yield _sse({"type": "error", "content": str(e)})
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        unbind_scope(scope_token)
+        # 正常结束、出错、客户端断开都会走到这里，归还名额
+        if ticket is not None:
+            admission.release(ticket)
+
+
+@app.get("/ready")
+def ready():
+    """就绪探针：预热完成前或必需阶段失败时返回 503，负载均衡据此决定是否转发流量"""
+    body = {"ready": Readiness.ready, "phases_ms": Readiness.phases, "errors": Readiness.errors,
+            "required": list(Readiness.required)}
+    return JSONResponse(body, status_code=200 if Readiness.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus 抓取入口：各阶段耗时直方图、TTFT、SQL 行数、Token 数、连接池。
+    async：准入控制的 gauge 只能在事件循环里读 (collector 都只读内存，不阻塞)
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admission")
+async def api_admission():
+    """准入控制实时状态：执行中 / 排队数、各租户占用、限额 (async：状态只在事件循环里读写)"""
+    return AdmissionController().snapshot()
+
+
+@app.get("/api/db/pools")
+def api_db_pools():
+    """连接池占用 / 等待时间 / 副本延迟，用来给连接池定容量"""
+    return DBManager().get_pool_stats()
+
+
+# 租户标识会作为 /metrics 的 label 输出，只接受短的、不需要转义的字符
+TENANT_RE = re.compile(r"[A-Za-z0-9_.:@-]{1,64}")
+# 本服务自己不做认证。=1 表示部署在网关后面：X-User-Id / X-Tenant-Id 由网关按认证结果设置 (并丢掉客户端自带的)，
+# 只认这两个请求头，忽略请求体里的 user_id / tenant_id；没有用户头的请求共用一个 anonymous 名额
+TRUSTED_IDENTITY_HEADERS = os.getenv("TRUSTED_IDENTITY_HEADERS", "0") == "1"
+
+
+def _identity(req, request: Request):
+    """
+    返回 (owner, user, tenant)：owner 是明确的用户标识 (没有为 None)，user / tenant 用于准入控制。
+    默认信任调用方自报的身份 (请求体或请求头)，没有用户标识时每个请求单独计
+    (不按 IP 归并，NAT 后面的用户不互相挤占)，仍受全局 / 租户限额约束；
+    自报身份可以随意换，按用户限额只防误用不防滥用，对外开放时要开 TRUSTED_IDENTITY_HEADERS
+    """
+    if TRUSTED_IDENTITY_HEADERS:
+        owner = request.headers.get("X-User-Id")
+        user = owner or "anonymous"
+        tenant = request.headers.get("X-Tenant-Id") or "default"
+    else:
+        owner = req.user_id or request.headers.get("X-User-Id")
+        user = owner or f"anonymous:{uuid.uuid4().hex}"
+        tenant = req.tenant_id or request.headers.get("X-Tenant-Id") or "default"
+    if not TENANT_RE.fullmatch(tenant):
+        raise HTTPException(status_code=400, detail="Invalid tenant id: expected 1-64 chars of [A-Za-z0-9_.:@-].")
+    return owner, user, tenant
 
 
 @app.post("/api/rag/chat")
-async def api_chat(req: ChatRequest):
+async def api_chat(req: ChatRequest, request: Request):
+    owner, user, tenant = _identity(req, request)
+    databases = req.databases
+    if databases is None and request.headers.get("X-Allowed-Databases") is not None:
+        databases = [d.strip() for d in request.headers["X-Allowed-Databases"].split(",") if d.strip()]
+    try:
+        AdmissionController().precheck(user, tenant)
+    except AdmissionRejected as e:
+        # 队列满 / 预计等太久：开流之前直接拒绝，客户端按 Retry-After 重试
+        return JSONResponse({"error": str(e), "reason": e.reason}, status_code=429,
+                            headers={"Retry-After": str(e.retry_after)})
+
     headers = {
         "Content-Type": "text/event-stream",
         "Cache-Control": "no-cache",
         "X-Accel-Buffering": "no",
     }
-    return StreamingResponse(sse_stream(req.messages), headers=headers, media_type="text/event-stream")
+    return StreamingResponse(sse_stream(req.messages, req.session_id, (user, tenant), request, databases, owner), headers=headers, media_type="text/event-stream")
+
+
+@app.post("/api/rag/batch")
+async def api_batch(req: BatchRequest, request: Request):
+    """批量问答：按完成顺序逐行返回 NDJSON (每个问题一行)"""
+    # 缺 question 的条目由 BatchRunner 单独输出 status=invalid，不拒绝整个请求
+    items = [dict(q, id=q.get("id", n)) for n, q in enumerate(req.questions)]
+    _, user, tenant = _identity(req, request)
+    # 每个问题都和交互式对话一样过准入控制；同一批最多占 per_user 个名额，不挤占其他用户
+    concurrency = max(1, min(req.concurrency, AdmissionController().per_user))
+    runner = BatchRunner(engine, concurrency=concurrency, databases=req.databases, principal=(user, tenant))
+
+    async def ndjson():
+        async for record in runner.run(items):
+            yield dumps(record, lenient=True) + b"\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+"""
+端到端基准：起本地假 LLM + N 个 backend worker (SQLite 版 DBManager、哈希 Embedding)，
+按给定并发压 /api/rag/chat，统计首 token 时间 (TTFT)、总延迟、吞吐和每个 worker 的内存。
+完全离线，结果可复现，用来发现 AgentEngine.run 的性能回退。
+
+用法 (在 backend 目录下)：
+    python test/bench_e2e.py
+    python test/bench_e2e.py --workers 2 --concurrency 32 --requests 400 --token-ms 10 --db-ms 20
+    python test/bench_e2e.py --encoder onnx-int8 --out bench_e2e.json     # 换真实 Embedding 后端
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = os.path.join(BACKEND_DIR, "test")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, TEST_DIR)
+
+QUESTIONS = [
+    "查一下各车型的销量排名",
+    "查询今年每个城市的订单数",
+    "上个月销量最多的车型是哪个",
+    "统计各车型的销售金额",
+    "查一下杭州的订单有多少",
+]
+
+
+def percentiles(values, ps=(50, 95, 99)) -> dict:
+    if not values:
+        return {f"p{p}": None for p in ps}
+    values = sorted(values)
+    out = {}
+    for p in ps:
+        # nearest-rank
+        k = min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1
+        out[f"p{p}"] = round(values[k], 1)
+    out["mean"] = round(sum(values) / len(values), 1)
+    return out
+
+
+def rss_mb(pid: int) -> dict:
+    """当前 / 峰值常驻内存 (Linux 读 /proc，其他平台用 psutil)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        kb = lambda key: int(fields[key].split()[0]) if key in fields else 0
+        return {"rss_mb": round(kb("VmRSS") / 1024, 1), "peak_rss_mb": round(kb("VmHWM") / 1024, 1)}
+    except FileNotFoundError:
+        try:
+            import psutil
+            return {"rss_mb": round(psutil.Process(pid).memory_info().rss / 2 ** 20, 1), "peak_rss_mb": None}
+        except ImportError:
+            return {"rss_mb": None, "peak_rss_mb": None}
+
+
+# ---------------- worker 进程 ----------------
+
+def serve(port: int, data_dir: str, db_file: str, db_ms: float):
+    """单个 backend worker：换上替身后跑真实的 main.app"""
+    import uvicorn
+    from bench_stubs import register_hash_encoder, install_fake_db
+    register_hash_encoder()
+    install_fake_db({"sales": db_file}, db_ms)
+
+    from app.vector_store import VectorStore
+    VectorStore.DATA_DIR = data_dir
+
+    import main
+    from app.warmup import warm_up
+    warm_up()
+    # 不跑 lifespan：后台全量扫描库会干扰计时
+    uvicorn.run(main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+
+
+# ---------------- 压测端 ----------------
+
+def prepare(workdir: str) -> dict:
+    from bench_stubs import SALES_DDL_ITEM, seed_sales_db
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    ddls = []
+    src = os.path.join(BACKEND_DIR, "data", "index_ddl.json")
+    if os.path.exists(src):
+        with open(src, "r", encoding="utf-8") as f:
+            ddls = json.load(f)
+    with open(os.path.join(data_dir, "index_ddl.json"), "w", encoding="utf-8") as f:
+        json.dump(ddls + [SALES_DDL_ITEM], f, ensure_ascii=False)
+    return {"data_dir": data_dir, "db_file": seed_sales_db(os.path.join(workdir, "sales.db"))}
+
+
+async def wait_ready(client, url: str, proc, timeout: float = 180):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.3)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+async def one_request(client, base: str, question: str, user: str = "bench") -> dict:
+    body = {"messages": [{"role": "user", "content": question}], "session_id": uuid.uuid4().hex, "user_id": user}
+    start = time.perf_counter()
+    rec = {"ok": False, "ttft_ms": None, "latency_ms": None, "events": 0, "error": None, "rejected": False}
+    try:
+        async with client.stream("POST", f"{base}/api/rag/chat", json=body) as resp:
+            if resp.status_code == 429:
+                # 准入控制直接拒绝
+                rec.update(rejected=True, error="429 " + (await resp.aread()).decode("utf-8"))
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[6:]
+                if payload == "[DONE]":
+                    rec["ok"] = True
+                    break
+                event = json.loads(payload)
+                rec["events"] += 1
+                if event.get("type") in ("thought", "text") and rec["ttft_ms"] is None:
+                    rec["ttft_ms"] = (time.perf_counter() - start) * 1000
+                elif event.get("type") == "error":
+                    rec["error"] = event.get("content")
+                    rec["rejected"] = event.get("code") == 429
+    except Exception as e:
+        rec["error"] = str(e)
+    rec["latency_ms"] = (time.perf_counter() - start) * 1000
+    return rec
+
+
+async def drive(bases, concurrency: int, total: int, users: int = 0) -> tuple:
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    records = []
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        async def loop():
+            for n in counter:
+                user = f"bench-{n % (users or concurrency)}"
+                records.append(await one_request(client, bases[n % len(bases)], QUESTIONS[n % len(QUESTIONS)], user))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return records, wall
+
+
+async def run_bench(args) -> dict:
+    import httpx
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    procs = []
+    try:
+        paths = prepare(workdir)
+        llm_port, base_port = args.port, args.port + 1
+        llm = subprocess.Popen([
+            sys.executable, os.path.join(TEST_DIR, "fake_llm_server.py"), "--port", str(llm_port),
+            "--token-ms", str(args.token_ms), "--prefill-ms", str(args.prefill_ms),
+        ])
+        procs.append(llm)
+
+        env = dict(os.environ,
+                   LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1", LLM_API_KEY="bench",
+                   DB_NAME="sales", SQL_COST_GATE="0", HARVEST_ENABLED="0",
+                   EMBEDDING_BACKEND=args.encoder)
+        env.pop("VECTOR_SERVICE_SOCKET", None)
+        workers = []
+        for i in range(args.workers):
+            port = base_port + i
+            proc = subprocess.Popen([
+                sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+                "--data-dir", paths["data_dir"], "--db-file", paths["db_file"], "--db-ms", str(args.db_ms),
+            ], env=env, cwd=BACKEND_DIR, stdout=None if args.verbose else subprocess.DEVNULL)
+            procs.append(proc)
+            workers.append({"port": port, "proc": proc, "base": f"http://127.0.0.1:{port}"})
+
+        async with httpx.AsyncClient(timeout=5) as client:
+            await wait_ready(client, f"http://127.0.0.1:{llm_port}/stats", llm)
+            for w in workers:
+                await wait_ready(client, f"{w['base']}/ready", w["proc"])
+        bases = [w["base"] for w in workers]
+        idle = {w["port"]: rss_mb(w["proc"].pid)["rss_mb"] for w in workers}
+
+        if args.warmup:
+            await drive(bases, min(args.concurrency, args.warmup), args.warmup)
+        records, wall = await drive(bases, args.concurrency, args.requests, args.users)
+
+        ok = [r for r in records if r["ok"] and not r["error"]]
+        return {
+            "config": {k: getattr(args, k) for k in
+                       ("workers", "concurrency", "requests", "token_ms", "prefill_ms", "db_ms", "encoder")},
+            "completed": len(ok),
+            "errors": len(records) - len(ok),
+            "rejected_429": sum(r["rejected"] for r in records),
+            "error_samples": list({r["error"] for r in records if r["error"]})[:3],
+            "throughput_rps": round(len(ok) / wall, 2),
+            "ttft_ms": percentiles([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+            "latency_ms": percentiles([r["latency_ms"] for r in ok]),
+            "workers": [dict(port=w["port"], rss_idle_mb=idle[w["port"]], **rss_mb(w["proc"].pid)) for w in workers],
+        }
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for /api/rag/chat")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--users", type=int, default=0, help="模拟的用户数 (准入控制按用户限流)，默认等于并发数")
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--prefill-ms", type=float, default=200.0)
+    parser.add_argument("--db-ms", type=float, default=10.0, help="每条 SQL 额外的固定耗时")
+    parser.add_argument("--encoder", default="hash", help="EMBEDDING_BACKEND (hash 为离线哈希编码器)")
+    parser.add_argument("--port", type=int, default=18001, help="假 LLM 端口，worker 依次用后面的端口")
+    parser.add_argument("--out", help="结果写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="显示 worker 日志")
+    # worker 子进程参数
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--db-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.data_dir, args.db_file, args.db_ms)
+        return
+
+    report = asyncio.run(run_bench(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Embedding 编码吞吐基准：对比 torch / onnx / onnx-int8 在不同线程数、batch 大小下的速度。
+
+用法 (在 backend 目录下)：
+    python test/bench_encoder.py
+    python test/bench_encoder.py --backends onnx-int8 --threads 1,4 --batch 1,32
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.encoder import MODEL_PATH, load_encoder
+from test_encoder_parity import sample_texts
+
+MODEL_DIR = os.path.normpath(os.path.join(BACKEND_DIR, MODEL_PATH))
+
+
+def bench(backend, threads, batch_size, texts, rounds=3):
+    os.environ["EMBEDDING_THREADS"] = str(threads)
+    encoder = load_encoder(MODEL_DIR, backend)
+    encoder.encode(texts[:4])  # 预热
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encoder.encode(texts, batch_size=batch_size)
+    cost = time.perf_counter() - start
+    return {
+        "backend": backend,
+        "threads": threads,
+        "batch_size": batch_size,
+        "texts_per_sec": round(len(texts) * rounds / cost, 1),
+        "ms_per_text": round(cost / (len(texts) * rounds) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--threads", default="1,4")
+    parser.add_argument("--batch", default="1,32")
+    parser.add_argument("--texts", type=int, default=256)
+    args = parser.parse_args()
+
+    texts = (sample_texts(args.texts) * 10)[:args.texts]
+    results = []
+    for backend in args.backends.split(","):
+        for threads in [int(t) for t in args.threads.split(",")]:
+            for batch_size in [int(b) for b in args.batch.split(",")]:
+                r = bench(backend, threads, batch_size, texts)
+                print(f"⚡ {r['backend']:<10} threads={r['threads']:<3} batch={r['batch_size']:<4} "
+                      f"{r['texts_per_sec']:>8} texts/s  {r['ms_per_text']} ms/text")
+                results.append(r)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
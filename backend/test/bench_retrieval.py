@@ -0,0 +1,214 @@
+"""
+检索质量 + 延迟基准：对比不同 Embedding 后端、索引类型、DDL emb_text 模板下
+VectorStore.retrieve 的 recall@k、MRR 和单次检索耗时，结果输出 JSON，方便长期跟踪。
+
+标注集 (data/retrieval_labels.jsonl，每行一个问题 -> 期望命中的表)：
+- 从 data/index_ddl.json 自动生成：用表注释 / 列注释拼出业务问法
+- 从 data/index_sql.json 自动生成：问题 -> SQL 里引用的表
+- 手工补充的行 (source=manual) 会一直保留；新生成的问题默认只在本次评测里用，不改动仓库里的标注文件，
+  需要沉淀下来时加 --save-labels (追加到 --labels 文件) 或 --save-labels 其它路径 (写出合并后的完整标注集)
+注意：自动生成的问题来自注释，对带注释的模板 (comments) 天然有利，做决策时以手工标注为准。
+
+用法 (在 backend 目录下)：
+    python test/bench_retrieval.py --encoders torch,onnx-int8 --templates columns,comments --index flat,fp16,pq
+    python test/bench_retrieval.py --encoders hash --out bench_retrieval.json      # 离线哈希编码器，只测流程/延迟
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "test"))
+
+from app.db_guard import SQLGuard
+from app.prompt import PromptBuilder
+from app.vector_store import VectorStore
+from bench_e2e import percentiles
+from bench_stubs import register_hash_encoder
+
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+LABELS_PATH = os.path.join(DATA_DIR, "retrieval_labels.jsonl")
+# 太通用的列不拿来造问题
+GENERIC_COLUMNS = {"id", "创建时间", "更新时间", "修改时间", "创建人", "修改人", "更新人", "是否删除", "备注"}
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def generate_labels(seed: int = 0) -> list:
+    rng = random.Random(seed)
+    labels = []
+    for item in _load_json(os.path.join(DATA_DIR, "index_ddl.json")):
+        table = f"{item.get('database')}.{item.get('table')}".lower()
+        table_comment, col_comments = VectorStore.ddl_comments(item.get("ddl_str", ""))
+        subject = table_comment.rstrip("表") if table_comment else ""
+        cols = [c for _, c in col_comments if c and c.split("。")[0] not in GENERIC_COLUMNS]
+        cols = [c.split("。")[0].split("，")[0] for c in cols]
+        if subject:
+            labels.append({"question": f"查一下{subject}", "tables": [table], "source": "ddl"})
+        if len(cols) >= 2:
+            a, b = rng.sample(cols, 2)
+            prefix = f"{subject}的" if subject else ""
+            labels.append({"question": f"统计{prefix}{a}和{b}", "tables": [table], "source": "ddl"})
+
+    for item in _load_json(os.path.join(DATA_DIR, "index_sql.json")):
+        try:
+            tables = [t.lower() for t in SQLGuard.tables(item.get("sql", ""))]
+        except ValueError:
+            continue
+        if tables and item.get("question"):
+            labels.append({"question": item["question"], "tables": tables, "sql": item["sql"], "source": "sql"})
+    return labels
+
+
+def load_labels(path: str = LABELS_PATH, update: bool = True, save_to: str = None) -> list:
+    """
+    读取标注集，并补上新生成的问题 (已有的行，包括手工标注，原样保留)。
+    新问题只有显式给了 save_to 才落盘：save_to 就是 path 时追加，否则把合并后的完整标注集写到 save_to。
+    """
+    labels = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            labels = [json.loads(line) for line in f if line.strip()]
+    fresh = []
+    if update:
+        known = {l["question"] for l in labels}
+        fresh = [l for l in generate_labels() if l["question"] not in known]
+        labels += fresh
+    if save_to and os.path.abspath(save_to) == os.path.abspath(path):
+        with open(path, "a", encoding="utf-8") as f:
+            for l in fresh:
+                f.write(json.dumps(l, ensure_ascii=False) + "\n")
+        print(f"📝 [Labels] 新增 {len(fresh)} 条 -> {path} (共 {len(labels)} 条)")
+    elif save_to:
+        with open(save_to, "w", encoding="utf-8") as f:
+            for l in labels:
+                f.write(json.dumps(l, ensure_ascii=False) + "\n")
+        print(f"📝 [Labels] 共 {len(labels)} 条 (新增 {len(fresh)} 条) -> {save_to}")
+    elif fresh:
+        print(f"📝 [Labels] 新生成 {len(fresh)} 条只用于本次评测 (加 --save-labels 才写回)")
+    return labels
+
+
+def build_store(workdir: str, encoder: str, template: str, index_type: str):
+    """在临时目录里按指定模板重写 emb_text，建一个独立的 VectorStore"""
+    data_dir = os.path.join(workdir, f"{encoder}-{template}")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+        for key, name in VectorStore.FILES.items():
+            items = _load_json(os.path.join(DATA_DIR, f"{name}.json"))
+            if key == "ddl":
+                for item in items:
+                    item["emb_text"] = VectorStore.ddl_emb_text(item, template)
+            if items:
+                with open(os.path.join(data_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+                    json.dump(items, f, ensure_ascii=False)
+
+    os.environ["EMBEDDING_BACKEND"] = encoder
+    os.environ["EMBEDDING_DYNAMIC_BATCH"] = "0"
+    VectorStore._instance = None
+    VectorStore.DATA_DIR = data_dir
+    VectorStore.INDEX_TYPE = index_type
+    VectorStore.PAYLOAD_MMAP = False
+    return VectorStore()
+
+
+def evaluate(vs, labels: list, ks) -> dict:
+    top_k = max(ks)
+    hits = {k: 0.0 for k in ks}
+    rr, sql_hits, sql_total, latencies = 0.0, 0, 0, []
+    for label in labels:
+        start = time.perf_counter()
+        res = vs.retrieve(label["question"], top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ranked = [PromptBuilder.ddl_key(d) for d in res["ddl"]]
+        expected = set(label["tables"])
+        for k in ks:
+            hits[k] += len(expected & set(ranked[:k])) / len(expected)
+        first = next((i for i, t in enumerate(ranked) if t in expected), None)
+        rr += 1 / (first + 1) if first is not None else 0
+
+        if label.get("sql"):
+            sql_total += 1
+            want = VectorStore._sql_fingerprint(label["sql"])
+            got = [VectorStore._sql_fingerprint(s.split("\nA: ", 1)[-1]) for s in res["sql"]]
+            sql_hits += want in got
+
+    n = max(len(labels), 1)
+    out = {f"recall@{k}": round(hits[k] / n, 4) for k in ks}
+    out["mrr"] = round(rr / n, 4)
+    if sql_total:
+        out["sql_hit@3"] = round(sql_hits / sql_total, 4)
+    out["latency_ms"] = percentiles(latencies)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality / latency benchmark")
+    parser.add_argument("--encoders", default=os.getenv("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--templates", default="columns,comments")
+    parser.add_argument("--index", default="flat,fp16,pq")
+    parser.add_argument("--k", default="1,3,5,8,12")
+    parser.add_argument("--limit", type=int, default=0, help="只用前 N 条标注 (0 = 全部)")
+    parser.add_argument("--labels", default=LABELS_PATH)
+    parser.add_argument("--no-update", action="store_true", help="不生成新标注，只用 --labels 里已有的")
+    parser.add_argument("--save-labels", nargs="?", const="", metavar="PATH",
+                        help="保存新生成的标注：不带路径时追加到 --labels 文件，带路径时写出完整标注集")
+    parser.add_argument("--out", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    register_hash_encoder()
+    save_to = None if args.save_labels is None else (args.save_labels or args.labels)
+    labels = load_labels(args.labels, update=not args.no_update, save_to=save_to)
+    if args.limit:
+        labels = random.Random(0).sample(labels, min(args.limit, len(labels)))
+    ks = [int(k) for k in args.k.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench_retrieval_")
+    results = []
+    try:
+        for encoder in args.encoders.split(","):
+            for template in args.templates.split(","):
+                for index_type in args.index.split(","):
+                    row = {"encoder": encoder, "template": template, "index": index_type}
+                    try:
+                        start = time.perf_counter()
+                        vs = build_store(workdir, encoder, template, index_type)
+                        row["build_s"] = round(time.perf_counter() - start, 2)
+                        row["index_effective"] = type(vs.indices.get("ddl")).__name__
+                        row.update(evaluate(vs, labels, ks))
+                    except Exception as e:
+                        row["error"] = str(e)
+                    results.append(row)
+                    print(f"  {encoder:<10} {template:<9} {index_type:<5} "
+                          f"R@{ks[-1]}={row.get(f'recall@{ks[-1]}', '-')} MRR={row.get('mrr', '-')} "
+                          f"p50={row.get('latency_ms', {}).get('p50', '-')}ms {row.get('error', '')}")
+    finally:
+        VectorStore._instance = None
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "labels": len(labels),
+        "label_sources": {s: sum(l.get("source") == s for l in labels) for s in {l.get("source") for l in labels}},
+        "k": ks,
+        "results": results,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+序列化微基准：对比原来的"递归 _sanitize + 多次 json.dumps"和 app/serialize 的一次序列化。
+
+- sql：数据库行 (Decimal / datetime / bytes) -> 清洗 -> SSE 预览事件 + tool 消息
+- sandbox：图表配置 / 结果里的 NumPy、pandas 类型 -> 清洗 -> SSE 事件
+
+用法 (在 backend 目录下)：
+    python test/bench_serialize.py
+    python test/bench_serialize.py --rows 100,5000 --rounds 20
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from app import serialize
+from app.serialize import RawJSON, dumps, prepare, to_jsonable
+
+
+# ---------------- 原来的实现 (对照组) ----------------
+
+def legacy_sql_sanitize(data):
+    if isinstance(data, list): return [legacy_sql_sanitize(i) for i in data]
+    if isinstance(data, dict): return {k: legacy_sql_sanitize(v) for k, v in data.items()}
+    if isinstance(data, (datetime.datetime, datetime.date)): return data.isoformat()
+    if isinstance(data, decimal.Decimal): return float(data)
+    if isinstance(data, bytes): return data.decode('utf-8', errors='ignore')
+    return data
+
+
+def legacy_numpy_sanitize(obj):
+    if isinstance(obj, (np.integer,)):
+        return int(obj)
+    elif isinstance(obj, (np.floating,)):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {k: legacy_numpy_sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_numpy_sanitize(i) for i in obj]
+    return obj
+
+
+def db_rows(n: int) -> list:
+    base = datetime.datetime(2024, 1, 1)
+    return [{"id": i, "model": ["C10", "C11", "C16"][i % 3], "city": "杭州",
+             "amount": decimal.Decimal(f"{i * 13 % 10000}.25"), "qty": i % 7,
+             "created_at": base + datetime.timedelta(minutes=i), "day": (base + datetime.timedelta(days=i % 365)).date(),
+             "vin": f"LSV{i:08d}".encode()} for i in range(n)]
+
+
+def chart_config(n: int) -> dict:
+    return {"type": "bar", "xKey": "month", "yKey": "qty",
+            "data": [{"month": f"2024-{i % 12 + 1:02d}", "qty": np.int64(i), "ratio": np.float64(i / 7)}
+                     for i in range(n)],
+            "series": np.arange(n, dtype="float32"), "total": np.int64(n)}
+
+
+# ---------------- 两条路径 ----------------
+
+def sql_legacy(rows):
+    data = legacy_sql_sanitize(rows)
+    event = json.dumps({"type": "table", "data": data[:50], "rows": len(data)}, ensure_ascii=False)
+    content = json.dumps({"status": "success", "message": "ok", "data": data}, ensure_ascii=False)
+    return event, content
+
+
+def sql_unified(rows):
+    data, raw = prepare(rows)
+    event = dumps({"type": "table", "data": data[:50], "rows": len(data)})
+    content = dumps({"status": "success", "message": "ok", "data": RawJSON(raw)}).decode("utf-8")
+    return event, content
+
+
+def sandbox_legacy(config):
+    return json.dumps({"type": "chart", "config": legacy_numpy_sanitize(config)}, ensure_ascii=False)
+
+
+def sandbox_unified(config):
+    return dumps({"type": "chart", "config": to_jsonable(config, lenient=True)})
+
+
+def timeit(fn, arg, rounds: int) -> float:
+    fn(arg)  # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="50,1000,10000")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for n in [int(r) for r in args.rows.split(",")]:
+        rows, config = db_rows(n), chart_config(n)
+        for path, legacy, unified, arg in (("sql", sql_legacy, sql_unified, rows),
+                                           ("sandbox", sandbox_legacy, sandbox_unified, config)):
+            old_ms, new_ms = timeit(legacy, arg, args.rounds), timeit(unified, arg, args.rounds)
+            r = {"path": path, "rows": n, "legacy_ms": round(old_ms, 3), "unified_ms": round(new_ms, 3),
+                 "speedup": round(old_ms / new_ms, 2), "encoder": "orjson" if serialize.orjson else "json"}
+            print(f"⚡ {path:<8} rows={n:<6} legacy {r['legacy_ms']:>9} ms  unified {r['unified_ms']:>9} ms  "
+                  f"x{r['speedup']}")
+            results.append(r)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
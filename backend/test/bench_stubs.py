@@ -0,0 +1,138 @@
+"""
+基准测试用的本地替身：不需要 MySQL、不需要下载 Embedding 模型。
+
+- HashEncoder：字符 1-gram + 2-gram 特征哈希成 384 维向量，确定性、毫秒级，
+  检索效果远不如真模型，只用来跑通流水线 / 测延迟；评测检索质量请用真实后端
+- install_fake_db：把 DBManager 换成 SQLite (每个库一个 ATTACH 的文件)，可加固定查询延迟
+"""
+import os
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+from app.encoder import BaseEncoder, register_encoder
+
+
+class HashEncoder(BaseEncoder):
+    name = "hash"
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str):
+        text = (text or "").lower()
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        return [zlib.crc32(g.encode("utf-8")) for g in grams]
+
+    def encode(self, texts, batch_size: int = 32):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for h in self._features(text):
+                # 用哈希的一位决定正负，减少碰撞带来的偏差
+                out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return out
+
+
+def register_hash_encoder():
+    register_encoder("hash", lambda path: HashEncoder())
+
+
+# ---------------- SQLite 版 DBManager ----------------
+
+SALES_DDL = """CREATE TABLE `orders` (
+  `id` bigint NOT NULL COMMENT '订单ID',
+  `model` varchar(32) NOT NULL COMMENT '车型',
+  `city` varchar(32) NOT NULL COMMENT '城市',
+  `qty` int NOT NULL COMMENT '销量',
+  `amount` decimal(12,2) NOT NULL COMMENT '金额',
+  `created_at` datetime NOT NULL COMMENT '下单时间',
+  PRIMARY KEY (`id`)
+) COMMENT='车型订单表'"""
+
+SALES_DDL_ITEM = {
+    "database": "sales", "table": "orders",
+    "columns": "id,model,city,qty,amount,created_at",
+    "ddl_str": "/* Database: sales */\n" + SALES_DDL,
+    "emb_text": "Database: sales | Table: orders | Cols: id,model,city,qty,amount,created_at",
+}
+
+
+def seed_sales_db(path: str, rows: int = 5000):
+    """生成 sales.orders 示例数据 (已存在则跳过)"""
+    if os.path.exists(path):
+        return path
+    rng = np.random.default_rng(0)
+    models = ["C01", "C10", "C11", "C16", "T03", "B10", "B11"]
+    cities = ["杭州", "上海", "北京", "深圳", "成都", "武汉"]
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, model TEXT, city TEXT, qty INTEGER, "
+                 "amount REAL, created_at TEXT)")
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?)", [
+        (i, models[rng.integers(len(models))], cities[rng.integers(len(cities))], int(rng.integers(1, 5)),
+         float(rng.integers(80, 300)) * 1000, f"2024-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d} 10:00:00")
+        for i in range(rows)
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+class _FakeCursor:
+    def __init__(self, conn: sqlite3.Connection, latency_ms: float):
+        self._cur = conn.cursor()
+        self._latency = latency_ms / 1000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+    def execute(self, sql, args=None):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._cur.execute(sql, args or ())
+
+    def _row(self, row):
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return self._row(row) if row is not None else None
+
+
+class _FakeConnection:
+    host = "sqlite"
+
+    def __init__(self, databases: dict, latency_ms: float):
+        self._conn = sqlite3.connect(":memory:")
+        for name, path in databases.items():
+            self._conn.execute(f"ATTACH DATABASE '{path}' AS {name}")
+        self._latency = latency_ms
+
+    def cursor(self):
+        return _FakeCursor(self._conn, self._latency)
+
+    def close(self):
+        self._conn.close()
+
+
+def install_fake_db(databases: dict, latency_ms: float = 0.0):
+    """
+    databases: {"sales": "/tmp/sales.db"}；SQL 里的 sales.orders 会落到对应 SQLite 文件
+    latency_ms: 每条 SQL 额外的固定耗时 (模拟网络 + 真实库的执行时间)
+    """
+    from app.db import DBManager
+
+    def get_connection(self, db_name=None, readonly=False):
+        return _FakeConnection(databases, latency_ms)
+
+    DBManager.get_connection = get_connection
+    DBManager._fetch_all_dbs = lambda self: list(databases)
@@ -0,0 +1,136 @@
+"""
+本地假 LLM：OpenAI 兼容的 /v1/chat/completions，按脚本流式吐 token / 工具调用，给端到端基准用。
+不需要网络和 API Key，吐字节奏 (首 token 前的 prefill、每个 token 的间隔) 可配置。
+
+脚本 (按对话状态决定回什么)：
+- 带 tools 且最后一条不是 tool 消息：先输出几个"思考"token，再分片输出一个 execute_sql 工具调用
+- 最后一条是 tool 消息：输出最终回答
+- 不带 tools：闲聊回答；非流式请求 (SQL 自动修复) 直接返回 SCRIPT_SQL
+
+用法 (在 backend 目录下)：
+    python test/fake_llm_server.py --port 18001 --token-ms 15 --prefill-ms 200
+    LLM_BASE_URL=http://127.0.0.1:18001/v1 LLM_API_KEY=bench python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SCRIPT_SQL = "SELECT model, SUM(qty) AS total FROM sales.orders GROUP BY model ORDER BY total DESC LIMIT 10"
+THOUGHT = "先确认相关的表，再按车型汇总销量。"
+ANSWER = "根据查询结果，销量最高的车型排在第一位，前三名合计占总销量的大部分，其余车型销量相对分散。"
+
+CONFIG = {"token_ms": 15.0, "prefill_ms": 200.0, "prefill_ms_per_1k": 0.0, "jitter": 0.2}
+STATS = {"requests": 0, "streamed_tokens": 0}
+
+
+def _tokens(text: str):
+    # 中文大约一个字一个 token，这里两个字一块，接近真实模型的分片
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+def _chunk(model: str, delta: dict = None, finish: str = None, usage: dict = None) -> str:
+    body = {
+        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta or {}, "finish_reason": finish}],
+    }
+    if usage:
+        body["usage"] = usage
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+
+async def _sleep_token():
+    ms = CONFIG["token_ms"] * (1 + random.uniform(-CONFIG["jitter"], CONFIG["jitter"]))
+    await asyncio.sleep(max(ms, 0) / 1000)
+
+
+def _prompt_chars(messages) -> int:
+    return sum(len(str(m.get("content") or "")) for m in messages)
+
+
+async def _stream(body: dict):
+    model = body.get("model", "fake")
+    messages = body.get("messages", [])
+    prompt_chars = _prompt_chars(messages)
+    prefill = CONFIG["prefill_ms"] + CONFIG["prefill_ms_per_1k"] * prompt_chars / 1000
+    await asyncio.sleep(prefill / 1000)
+
+    completion = 0
+    yield _chunk(model, {"role": "assistant", "content": ""})
+    if body.get("tools") and messages and messages[-1].get("role") != "tool":
+        for tok in _tokens(THOUGHT):
+            await _sleep_token()
+            completion += 1
+            yield _chunk(model, {"content": tok})
+        # 工具调用参数分片输出 (和真实模型一样，JSON 被切成若干碎片)
+        call_id = "call_" + uuid.uuid4().hex[:8]
+        args = json.dumps({"query": SCRIPT_SQL})
+        yield _chunk(model, {"tool_calls": [{"index": 0, "id": call_id, "type": "function",
+                                             "function": {"name": "execute_sql", "arguments": ""}}]})
+        for i in range(0, len(args), 8):
+            await _sleep_token()
+            completion += 1
+            yield _chunk(model, {"tool_calls": [{"index": 0, "function": {"arguments": args[i:i + 8]}}]})
+        yield _chunk(model, finish="tool_calls")
+    else:
+        for tok in _tokens(ANSWER):
+            await _sleep_token()
+            completion += 1
+            yield _chunk(model, {"content": tok})
+        yield _chunk(model, finish="stop")
+
+    STATS["streamed_tokens"] += completion
+    prompt_tokens = prompt_chars // 2
+    yield _chunk(model, usage={
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion,
+        "total_tokens": prompt_tokens + completion, "prompt_cache_hit_tokens": 0,
+    })
+    yield "data: [DONE]\n\n"
+
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    if body.get("stream"):
+        return StreamingResponse(_stream(body), media_type="text/event-stream")
+
+    await asyncio.sleep(CONFIG["prefill_ms"] / 1000)
+    return JSONResponse({
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": SCRIPT_SQL}}],
+        "usage": {"prompt_tokens": _prompt_chars(body.get("messages", [])) // 2,
+                  "completion_tokens": 20, "total_tokens": 20},
+    })
+
+
+@app.get("/stats")
+def stats():
+    return STATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible streaming server")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--token-ms", type=float, default=15.0, help="每个 token 的间隔")
+    parser.add_argument("--prefill-ms", type=float, default=200.0, help="首 token 前的固定延迟")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0, help="每 1k 字符 Prompt 额外的 prefill 延迟")
+    args = parser.parse_args()
+    CONFIG.update(token_ms=args.token_ms, prefill_ms=args.prefill_ms, prefill_ms_per_1k=args.prefill_ms_per_1k)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+测试脚本共用的命令行入口：不装 pytest 也能 python test/test_xxx.py 直接跑。
+直接运行脚本时 test/ 目录已经在 sys.path 里，在 __main__ 里 import 即可：
+
+    if __name__ == "__main__":
+        from runner import run_tests
+        run_tests(globals(), "xxx 检查通过")
+"""
+
+
+def run_tests(namespace: dict, banner: str):
+    """按定义顺序跑模块里所有 test_* 函数，全部通过后打印 banner"""
+    for name, fn in list(namespace.items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+    print(f"✅ {banner}")
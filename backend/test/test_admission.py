@@ -0,0 +1,266 @@
+"""
+准入控制检查：全局 / 用户 / 租户并发上限、用户超限不挡别人、队列满和等待超时返回 429、名额按时归还；
+开流前的 precheck 不占名额，响应体没跑起来也不会漏掉 Ticket；没有用户标识时不按 IP 归并；
+租户标识格式不对返回 400，/metrics 的租户 gauge 数量有上限；TRUSTED_IDENTITY_HEADERS 下只认网关设置的请求头。
+纯 asyncio，不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_admission.py
+    python -m pytest test/test_admission.py
+"""
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.admission import AdmissionController, AdmissionRejected
+
+
+def controller(**limits) -> AdmissionController:
+    AdmissionController._instance = None
+    ctl = AdmissionController()
+    ctl.max_active, ctl.max_queue, ctl.max_wait = 2, 4, 5.0
+    ctl.per_user, ctl.per_user_queued, ctl.per_tenant = 1, 4, 8
+    ctl.avg_service, ctl.update_interval = 0.1, 0.05
+    for k, v in limits.items():
+        setattr(ctl, k, v)
+    return ctl
+
+
+def test_per_user_limit_does_not_block_others():
+    async def main():
+        ctl = controller()
+        a1 = ctl.enqueue("alice")
+        a2 = ctl.enqueue("alice")      # alice 已占满自己的 1 个名额
+        b1 = ctl.enqueue("bob")        # 排在 a2 后面，但不受 alice 的限制
+        assert (a1.state, a2.state, b1.state) == ("active", "queued", "active")
+        ctl.release(a1)
+        assert a2.state == "active" and ctl.active == 2
+        for t in (a2, b1):
+            ctl.release(t)
+            ctl.release(t)             # 重复释放无副作用
+        assert ctl.active == 0 and not ctl.active_by_user and not ctl.waiters
+    asyncio.run(main())
+
+
+def test_tenant_limit():
+    async def main():
+        ctl = controller(max_active=10, per_user=10, per_tenant=2)
+        tickets = [ctl.enqueue(f"u{i}", "acme") for i in range(3)]
+        other = ctl.enqueue("x", "globex")
+        assert [t.state for t in tickets] == ["active", "active", "queued"] and other.state == "active"
+    asyncio.run(main())
+
+
+def test_queue_full_rejects():
+    async def main():
+        ctl = controller(max_queue=1, per_user=5)
+        ctl.enqueue("a"), ctl.enqueue("b"), ctl.enqueue("c")
+        try:
+            ctl.enqueue("d")
+        except AdmissionRejected as e:
+            assert e.reason == "queue_full" and e.retry_after >= 1
+        else:
+            raise AssertionError("expected 429")
+    asyncio.run(main())
+
+
+def test_estimated_wait_rejects():
+    async def main():
+        ctl = controller(avg_service=30.0, max_wait=10.0)
+        ctl.enqueue("a"), ctl.enqueue("b")
+        try:
+            ctl.enqueue("c")
+        except AdmissionRejected as e:
+            assert e.reason == "wait_too_long"
+        else:
+            raise AssertionError("expected 429")
+        assert not ctl.waiters
+    asyncio.run(main())
+
+
+def test_wait_positions_and_timeout():
+    async def main():
+        ctl = controller(max_wait=0.3)
+        ctl.enqueue("a"), ctl.enqueue("b")
+        queued = ctl.enqueue("c")
+        events = []
+        try:
+            async for status in ctl.wait(queued):
+                events.append(status)
+        except AdmissionRejected as e:
+            assert e.reason == "queue_timeout"
+        else:
+            raise AssertionError("expected timeout")
+        assert events[0]["position"] == 1 and queued.state == "done" and not ctl.waiters
+    asyncio.run(main())
+
+
+def test_wait_until_admitted():
+    async def main():
+        ctl = controller()
+        first = ctl.enqueue("a")
+        ctl.enqueue("b")
+        queued = ctl.enqueue("c")
+        asyncio.get_running_loop().call_later(0.1, ctl.release, first)
+        events = [s async for s in ctl.wait(queued)]
+        assert queued.state == "active" and events and events[0]["position"] == 1
+    asyncio.run(main())
+
+
+def test_precheck_does_not_reserve():
+    async def main():
+        ctl = controller()
+        for _ in range(5):
+            ctl.precheck("alice")
+        assert ctl.active == 0 and not ctl.waiters
+        ctl.enqueue("a"), ctl.enqueue("b")
+        ctl.max_queue = 0
+        try:
+            ctl.precheck("c")
+        except AdmissionRejected as e:
+            assert e.reason == "queue_full"
+        else:
+            raise AssertionError("expected 429")
+        ctl.max_queue, ctl.avg_service, ctl.max_wait = 4, 30.0, 10.0
+        try:
+            ctl.precheck("c")
+        except AdmissionRejected as e:
+            assert e.reason == "wait_too_long"
+        else:
+            raise AssertionError("expected 429")
+        # 自己还有名额、全局也没满时放行
+        ctl.max_active = 3
+        ctl.precheck("c")
+    asyncio.run(main())
+
+
+class FakeRequest:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.client = type("Client", (), {"host": "10.0.0.1"})()
+
+    async def is_disconnected(self):
+        return False
+
+
+class BlockingEngine:
+    """拿到名额后一直占着，直到流被关闭"""
+
+    def __init__(self):
+        self.users = []
+
+    async def run(self, history, **kwargs):
+        self.users.append(kwargs.get("user"))
+        yield {"type": "thought", "content": "running"}
+        await asyncio.Event().wait()
+
+
+def test_stream_acquires_ticket_and_no_ip_fallback():
+    os.environ.setdefault("LLM_API_KEY", "sk-admission-check")
+    import main as app_main
+
+    async def run():
+        ctl = controller(per_user=1, max_active=8)
+        saved, app_main.engine = app_main.engine, BlockingEngine()
+        try:
+            chat = app_main.ChatRequest(messages=[{"role": "user", "content": "hi"}])
+            responses = [await app_main.api_chat(chat, FakeRequest()) for _ in range(3)]
+            # 响应体还没开始发：不占名额、不排队 (客户端这时断开也不会漏 Ticket)
+            assert ctl.active == 0 and not ctl.waiters
+            bodies = [r.body_iterator for r in responses]
+            for body in bodies:
+                await body.__anext__()          # ping
+                await body.__anext__()          # 拿到名额后的第一个事件
+            # 同一个 IP、没有用户标识：不按 IP 归并，per_user=1 也不会互相排队
+            assert ctl.active == 3 and not ctl.waiters
+            for body in bodies:
+                await body.aclose()
+            assert ctl.active == 0
+
+            # 显式的用户标识照常按用户限并发
+            bob = [await app_main.api_chat(chat, FakeRequest({"X-User-Id": "bob"})) for _ in range(2)]
+            bodies = [r.body_iterator for r in bob]
+            await bodies[0].__anext__(), await bodies[0].__anext__()
+            await bodies[1].__anext__()
+            assert b'"queue"' in await bodies[1].__anext__() and len(ctl.waiters) == 1
+            for body in bodies:
+                await body.aclose()
+            assert ctl.active == 0 and not ctl.waiters
+            # 会话表按明确的用户标识隔离：匿名请求不带 user，不跨请求复用
+            assert app_main.engine.users == [None, None, None, "bob"]
+        finally:
+            app_main.engine = saved
+    asyncio.run(run())
+
+def test_tenant_gauges_are_bounded():
+    async def main():
+        ctl = controller(max_active=10, per_user=10, tenant_labels=2)
+        for n, tenant in enumerate(["a", "a", "a", "b", "b", "c", "d"]):
+            ctl.enqueue(f"u{n}", tenant)
+        active = {s[2]["tenant"]: s[3] for s in ctl.gauges() if s[0] == "admission_tenant_active"}
+        assert active == {"a": 3, "b": 2, "other": 2}
+    asyncio.run(main())
+
+
+def test_invalid_tenant_is_rejected():
+    os.environ.setdefault("LLM_API_KEY", "sk-admission-check")
+    import main as app_main
+    from fastapi import HTTPException
+
+    async def run():
+        controller()
+        chat = app_main.ChatRequest(messages=[{"role": "user", "content": "hi"}])
+        for tenant in ('acme"} 1\nfake_metric{x="', "t" * 65):
+            try:
+                await app_main.api_chat(chat, FakeRequest({"X-Tenant-Id": tenant}))
+            except HTTPException as e:
+                assert e.status_code == 400
+            else:
+                raise AssertionError("expected 400")
+    asyncio.run(run())
+
+
+def test_trusted_headers_ignore_body_identity():
+    os.environ.setdefault("LLM_API_KEY", "sk-admission-check")
+    import main as app_main
+
+    async def run():
+        ctl = controller(per_user=1, max_active=8)
+        saved = app_main.engine, app_main.TRUSTED_IDENTITY_HEADERS
+        app_main.engine, app_main.TRUSTED_IDENTITY_HEADERS = BlockingEngine(), True
+        try:
+            # 请求体里自报的身份不算数：每次换 user_id 也绕不过按用户的限额
+            bodies = []
+            for n in range(2):
+                chat = app_main.ChatRequest(messages=[{"role": "user", "content": "hi"}],
+                                            user_id=f"spoof{n}", tenant_id="other")
+                bodies.append((await app_main.api_chat(chat, FakeRequest({"X-User-Id": "bob"}))).body_iterator)
+            anonymous = app_main.ChatRequest(messages=[{"role": "user", "content": "hi"}])
+            for _ in range(2):
+                bodies.append((await app_main.api_chat(anonymous, FakeRequest())).body_iterator)
+            for body in bodies:
+                await body.__anext__()
+            first = [await body.__anext__() for body in bodies]
+            # bob 和 anonymous 各自只放行一个，另一个排队
+            assert ctl.active == 2 and len(ctl.waiters) == 2
+            assert [b'"queue"' in e for e in first] == [False, True, False, True]
+            assert dict(ctl.active_by_tenant) == {"default": 2}
+            # 状态只在事件循环里读：两个观测接口都是 async，不会被放进线程池
+            assert asyncio.iscoroutinefunction(app_main.metrics)
+            snapshot = await app_main.api_admission()
+            assert snapshot["active"] == 2 and snapshot["queued_by_tenant"] == {"default": 2}
+            for body in bodies:
+                await body.aclose()
+            assert ctl.active == 0 and not ctl.waiters
+            assert app_main.engine.users == ["bob", None]
+        finally:
+            app_main.engine, app_main.TRUSTED_IDENTITY_HEADERS = saved
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "准入控制检查通过")
@@ -0,0 +1,120 @@
+"""
+批量问答检查：缺 question、不是合法 JSON 的条目各自输出一条 status=invalid 的记录，其它问题照常跑完；
+带 principal 时每个问题都过准入控制 (不超过用户 / 全局名额，被拒绝就退避重试)，批量结果不登记、不收录 SQL。
+AgentEngine / 向量库用替身，不需要数据库和 LLM。
+
+用法 (在 backend 目录下)：
+    python test/test_batch.py
+    python -m pytest test/test_batch.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.admission import AdmissionController
+from app.batch import BatchRunner, load_questions
+
+
+class StubVectorStore:
+    def __init__(self):
+        self.queries = []
+
+    def retrieve_batch(self, queries, top_k=8, databases=None):
+        self.queries += queries
+        return [{"ddl": [], "doc": [], "sql": []} for _ in queries]
+
+
+class StubEngine:
+    def __init__(self):
+        self.vector_store = StubVectorStore()
+        self.calls = []
+
+    async def run(self, history, **kwargs):
+        self.calls.append(kwargs)
+        yield {"type": "text", "content": f"answer: {history[0]['content']}"}
+
+
+class SlowEngine(StubEngine):
+    """记录同时在跑的问题数和当时准入控制的占用"""
+
+    def __init__(self):
+        super().__init__()
+        self.running = self.peak = self.peak_active = 0
+
+    async def run(self, history, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.peak_active = max(self.peak_active, AdmissionController().active)
+        try:
+            await asyncio.sleep(0.01)
+            yield {"type": "text", "content": "ok"}
+        finally:
+            self.running -= 1
+
+
+def run(items) -> dict:
+    engine = StubEngine()
+
+    async def collect():
+        return [r async for r in BatchRunner(engine).run(items)]
+
+    return {r["id"]: r for r in asyncio.run(collect())}, engine
+
+
+def test_invalid_items_do_not_abort_the_batch():
+    records, engine = run([{"id": "a", "question": "各车型销量"}, {"id": "b", "q": "typo"},
+                           {"id": "c", "question": 42}, {"id": "d", "question": "   "}])
+    assert records["a"]["status"] == "no_sql" and records["a"]["answer"] == "answer: 各车型销量"
+    for rid in ("b", "c", "d"):
+        assert records[rid]["status"] == "invalid" and "question" in records[rid]["error"]
+    # 坏条目不进批量检索
+    assert engine.vector_store.queries == ["各车型销量"]
+
+
+def test_load_questions_keeps_bad_lines_as_invalid():
+    path = os.path.join(tempfile.mkdtemp(prefix="batch_test_"), "questions.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"question": "上个月订单数"}\nnot json\n[1, 2]\n\n{"id": "q9", "question": "退款率"}\n')
+    records, _ = run(load_questions(path))
+    assert records[0]["status"] == records["q9"]["status"] == "no_sql"
+    assert records[1]["status"] == "invalid" and "invalid JSON on line 2" in records[1]["error"]
+    assert records[2]["status"] == "invalid" and "not a JSON object" in records[2]["error"]
+
+
+def test_batch_runs_without_recording_results():
+    records, engine = run([{"id": "a", "question": "各车型销量"}])
+    assert records["a"]["status"] == "no_sql"
+    assert engine.calls and all(call.get("record") is False for call in engine.calls)
+
+
+def test_batch_goes_through_admission():
+    AdmissionController._instance = None
+    ctl = AdmissionController()
+    ctl.max_active, ctl.max_queue, ctl.max_wait = 3, 2, 0.05
+    ctl.per_user, ctl.per_user_queued, ctl.per_tenant = 2, 4, 8
+    ctl.avg_service, ctl.update_interval = 0.01, 0.01
+    engine = SlowEngine()
+    items = [{"id": n, "question": f"q{n}"} for n in range(12)]
+
+    async def main():
+        # 别人已占着 2 个全局名额：批量最多只能再用 1 个，排不上的退避重试而不是失败
+        others = [ctl.enqueue("bob"), ctl.enqueue("carol")]
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, lambda: [ctl.release(t) for t in others])
+        runner = BatchRunner(engine, concurrency=8, principal=("alice", "default"))
+        return [r async for r in runner.run(items)]
+
+    records = asyncio.run(main())
+    assert len(records) == 12 and all(r["status"] == "no_sql" for r in records)
+    # 不超过 alice 的 per_user 和全局 max_active；跑完名额全部归还
+    assert engine.peak <= ctl.per_user and engine.peak_active <= ctl.max_active
+    assert ctl.active == 0 and not ctl.waiters and not ctl.active_by_user
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "批量问答检查通过")
@@ -0,0 +1,209 @@
+"""
+请求取消检查：CancelScope 的登记 / 触发语义，客户端断开后 LLM 流被关闭、SQL 收到 KILL QUERY、
+沙箱线程被打断，对应的 agent_cancelled_work_total 计数增加。
+不需要数据库和 LLM (用替身对象)。
+
+用法 (在 backend 目录下)：
+    python test/test_cancel.py
+    python -m pytest test/test_cancel.py
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.cancel import CancelScope, ClientDisconnected, CANCELLED_WORK, bind_scope, unbind_scope, guard_stream
+from app.sandbox import PythonSandbox
+from app.tools import ToolManager
+
+
+def cancelled_count(kind: str) -> float:
+    return CANCELLED_WORK._series.get((("kind", kind),), 0)
+
+
+def test_scope_register_and_cancel():
+    scope, fired = CancelScope(), []
+    a = scope.register("sql", lambda: fired.append("a"))
+    b = scope.register("sql", lambda: fired.append("b"))
+    assert scope.unregister(b) is True
+    assert scope.cancel() is True and scope.cancel() is False
+    assert fired == ["a"]
+    # 已经触发过的回调不能再注销，取消之后不再接受登记
+    assert scope.unregister(a) is False
+    assert scope.register("sql", lambda: fired.append("c")) is None
+    try:
+        scope.check()
+        assert False, "check() should raise after cancel"
+    except ClientDisconnected:
+        pass
+
+
+class FakeStream:
+    """模拟 openai AsyncStream：每 20 ms 吐一块，close() 之后读循环结束并报错"""
+
+    def __init__(self):
+        self.closed = 0
+        self.sent = 0
+
+    async def close(self):
+        self.closed += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.02)
+        if self.closed:
+            raise RuntimeError("stream closed")
+        self.sent += 1
+        return self.sent
+
+
+def test_guard_stream_closes_upstream_on_disconnect():
+    async def main():
+        before = cancelled_count("llm_stream")
+        scope, stream = CancelScope(), FakeStream()
+        token = bind_scope(scope)
+        asyncio.get_running_loop().call_later(0.07, scope.cancel)
+        try:
+            async with guard_stream(stream) as sc:
+                async for _ in stream:
+                    sc.check()
+            assert False, "should be cancelled"
+        except ClientDisconnected:
+            pass
+        finally:
+            unbind_scope(token)
+        await asyncio.sleep(0)
+        assert stream.closed == 1 and stream.sent < 5
+        assert cancelled_count("llm_stream") == before + 1
+    asyncio.run(main())
+
+
+def test_guard_stream_closes_upstream_when_consumer_is_cancelled():
+    async def main():
+        stream = FakeStream()
+
+        async def consume():
+            async with guard_stream(stream):
+                async for _ in stream:
+                    pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        assert stream.closed == 1
+    asyncio.run(main())
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql):
+        # 阻塞到被 KILL 为止，和 MySQL 打断查询时一样报错
+        if not self.conn.killed.wait(5):
+            raise AssertionError("query was never killed")
+        raise RuntimeError("(1317, 'Query execution was interrupted')")
+
+
+class FakeConn:
+    host, port = "db-1", 3306
+
+    def __init__(self):
+        self.killed = threading.Event()
+        self.closed_after_kill = None
+
+    def thread_id(self):
+        return 42
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed_after_kill = self.killed.is_set()
+
+
+class FakeDB:
+    def __init__(self):
+        self.conn = FakeConn()
+        self.kills = []
+
+    def get_connection(self, db_name, readonly=False):
+        return self.conn
+
+    def kill_query(self, conn, thread_id):
+        time.sleep(0.05)
+        self.kills.append((conn.host, thread_id))
+        conn.killed.set()
+
+
+def test_sql_is_killed_on_disconnect():
+    async def main():
+        before = cancelled_count("sql")
+        tm = ToolManager.__new__(ToolManager)
+        tm.db = FakeDB()
+        scope = CancelScope()
+        token = bind_scope(scope)
+        try:
+            job = asyncio.create_task(asyncio.to_thread(tm.execute, "execute_sql", {"query": "SELECT * FROM sales.orders"}))
+            # 等查询真正开始 (KILL 已登记) 再断开，不靠固定的 sleep (GC 停顿时线程可能晚启动)
+            for _ in range(200):
+                if scope._callbacks:
+                    break
+                await asyncio.sleep(0.01)
+            scope.cancel()
+            res = await job
+        finally:
+            unbind_scope(token)
+        assert res["status"] == "error" and "interrupted" in res["message"]
+        assert tm.db.kills == [("db-1", 42)]
+        # 连接在 KILL 发完之后才归还
+        assert tm.db.conn.closed_after_kill is True
+        assert cancelled_count("sql") == before + 1
+    asyncio.run(main())
+
+
+def test_sandbox_is_interrupted_on_disconnect():
+    async def main():
+        before = cancelled_count("sandbox")
+        scope = CancelScope()
+        token = bind_scope(scope)
+        try:
+            code = "n = 0\nwhile True:\n    try:\n        n += 1\n    except Exception:\n        pass\n"
+            job = asyncio.create_task(asyncio.to_thread(PythonSandbox().execute, code, data_context=[{"a": 1}]))
+            await asyncio.sleep(0.2)
+            start = time.perf_counter()
+            scope.cancel()
+            res = await asyncio.wait_for(job, timeout=5)
+        finally:
+            unbind_scope(token)
+        assert res["success"] is False and "Cancelled" in res["error"]
+        assert time.perf_counter() - start < 1
+        assert cancelled_count("sandbox") == before + 1
+    asyncio.run(main())
+
+
+def test_sandbox_captures_print_without_redirecting_stdout():
+    res = PythonSandbox().execute("def show(x):\n    print('rows', x)\nshow(len(df))", data_context=[{"a": 1}, {"a": 2}])
+    assert res["success"] and res["stdout"] == "rows 2"
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "请求取消检查通过")
@@ -0,0 +1,114 @@
+"""
+EXPLAIN 成本闸门检查：用固定的 EXPLAIN FORMAT=JSON 结果验证 nested_loop 行数累乘、
+扫描行数阈值、无索引全表扫描、单表查询按 LIMIT 折算扫描行数；EXPLAIN 失败时放行并计入 agent_cost_gate_total{result="fail_open"}。
+不需要数据库。
+
+用法 (在 backend 目录下)：
+    python test/test_cost_gate.py
+    python -m pytest test/test_cost_gate.py
+"""
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.agent import AgentEngine, COST_GATE
+from app.db_guard import SQLGuard
+
+
+def table(name, access, per_scan, produced, key=None, possible=None):
+    return {"table": {"table_name": name, "access_type": access, "key": key, "possible_keys": possible,
+                      "rows_examined_per_scan": per_scan, "rows_produced_per_join": produced}}
+
+
+def join_plan(outer_rows: int, inner_rows: int) -> dict:
+    return {"query_block": {"select_id": 1, "nested_loop": [
+        table("orders", "range", outer_rows, outer_rows, key="idx_created"),
+        table("items", "ref", inner_rows, outer_rows * inner_rows, key="idx_order"),
+    ]}}
+
+
+def gate_count(result: str) -> float:
+    return COST_GATE._series.get((("result", result),), 0)
+
+
+def test_nested_loop_multiplies_rows():
+    tables = []
+    SQLGuard._collect_tables(join_plan(2000, 50), tables)
+    assert [(t["table"], t["rows_examined"]) for t in tables] == [("orders", 2000), ("items", 100000)]
+
+    # 每张表单独看都不大，累乘后超过阈值
+    ok, reason = SQLGuard.check_cost(join_plan(20000, 300))
+    assert not ok and "rows examined" in reason and "QUERY TOO EXPENSIVE" in reason
+
+
+def test_threshold_boundary():
+    saved = SQLGuard.MAX_EXAMINED_ROWS
+    SQLGuard.MAX_EXAMINED_ROWS = 102000
+    try:
+        assert SQLGuard.check_cost(join_plan(2000, 50)) == (True, "")   # 2000 + 100000
+        assert not SQLGuard.check_cost(join_plan(2000, 51))[0]           # 2000 + 102000
+    finally:
+        SQLGuard.MAX_EXAMINED_ROWS = saved
+
+
+def test_full_scan_without_index():
+    plan = {"query_block": {"table": {"table_name": "logs", "access_type": "ALL", "key": None,
+                                      "possible_keys": ["idx_ts"], "rows_examined_per_scan": 3_000_000}}}
+    ok, reason = SQLGuard.check_cost(plan)
+    assert not ok and "full table scan on `logs`" in reason and "idx_ts" in reason
+    # 同样的行数走了索引就放行
+    plan["query_block"]["table"].update(access_type="range", key="idx_ts")
+    assert SQLGuard.check_cost(plan)[0]
+    assert SQLGuard.check_cost({}) == (True, "")
+
+
+def test_limit_caps_single_table_scan():
+    plan = {"query_block": {"table": {"table_name": "logs", "access_type": "ALL", "key": None,
+                                      "rows_examined_per_scan": 3_000_000, "filtered": "100.00"}}}
+    # validate 自己加的 LIMIT 100：读够 100 行就停，不算全表扫描
+    sql = SQLGuard.validate("SELECT * FROM logs")
+    assert SQLGuard.row_limit(sql) == 100 and SQLGuard.check_cost(plan, SQLGuard.row_limit(sql)) == (True, "")
+    # WHERE 只留下十万分之一：凑够 100 行要读约 1000 万行，照样拒绝
+    plan["query_block"]["table"]["filtered"] = "0.001"
+    assert not SQLGuard.check_cost(plan, 100)[0]
+    # 要先读完全部行的 (排序、分组、聚合、去重) 不按 LIMIT 折算
+    for q in ("SELECT * FROM logs ORDER BY ts LIMIT 100", "SELECT level, COUNT(*) FROM logs GROUP BY level LIMIT 5",
+              "SELECT MAX(ts) FROM logs LIMIT 1", "SELECT DISTINCT level FROM logs LIMIT 5",
+              "SELECT * FROM a UNION SELECT * FROM b LIMIT 3"):
+        assert SQLGuard.row_limit(q) is None, q
+    assert SQLGuard.row_limit("SELECT * FROM logs LIMIT 10 OFFSET 20") == 30
+    # 多表连接不折算
+    assert not SQLGuard.check_cost(join_plan(20000, 300), 10)[0]
+
+
+def test_explain_failure_fails_open_with_metric():
+    class Tools:
+        def explain(self, sql):
+            return None
+
+    engine = object.__new__(AgentEngine)
+    engine.tools = Tools()
+    saved = os.environ.get("SQL_COST_GATE")
+    os.environ["SQL_COST_GATE"] = "1"
+    try:
+        before = gate_count("fail_open")
+        assert asyncio.run(engine._check_cost("SELECT 1")) is None
+        assert gate_count("fail_open") == before + 1
+
+        Tools.explain = lambda self, sql: join_plan(20000, 300)
+        before = gate_count("rejected")
+        assert "QUERY TOO EXPENSIVE" in asyncio.run(engine._check_cost("SELECT 1"))
+        assert gate_count("rejected") == before + 1
+    finally:
+        if saved is None:
+            os.environ.pop("SQL_COST_GATE", None)
+        else:
+            os.environ["SQL_COST_GATE"] = saved
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "成本闸门检查通过")
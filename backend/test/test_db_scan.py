@@ -0,0 +1,78 @@
+"""
+Schema 全量扫描检查：空库、扫描中途出错的库都把连接还回去 (PoolStats.in_use 归零)，
+不依赖 GC 调 TrackedConnection.__del__。连接和游标用替身，不需要数据库。
+
+用法 (在 backend 目录下)：
+    python test/test_db_scan.py
+    python -m pytest test/test_db_scan.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.db import DBManager, PoolStats, TrackedConnection
+
+TABLES = {"empty": [], "sales": ["orders"], "broken": None}
+
+
+class FakeCursor:
+    def __init__(self, db_name):
+        self.db_name, self.result = db_name, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        if sql == "SHOW TABLES":
+            if TABLES[self.db_name] is None:
+                raise RuntimeError("Lost connection")
+            self.result = [{"Tables_in": t} for t in TABLES[self.db_name]]
+        elif sql.startswith("SHOW CREATE TABLE"):
+            self.result = [{"Table": "orders", "Create Table": "CREATE TABLE `orders` (`id` bigint)"}]
+        elif sql.startswith("DESCRIBE"):
+            self.result = [{"Field": "id"}]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConn:
+    def __init__(self, db_name):
+        self.db_name = db_name
+
+    def cursor(self):
+        return FakeCursor(self.db_name)
+
+    def close(self):
+        pass
+
+
+def test_scan_releases_every_connection():
+    stats = PoolStats("primary", "*", 10)
+    held = []
+
+    def get_connection(db_name, readonly=False):
+        stats.acquired(0.0)
+        conn = TrackedConnection(FakeConn(db_name), stats)
+        held.append(conn)  # 留着引用，不让 __del__ 替它归还
+        return conn
+
+    db = object.__new__(DBManager)
+    db._fetch_all_dbs = lambda: list(TABLES)
+    db.get_connection = get_connection
+    results = db.get_all_tables_metadata()
+    assert [(r["database"], r["table"]) for r in results] == [("sales", "orders")]
+    assert len(held) == 3 and stats.in_use == 0
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "Schema 扫描检查通过")
@@ -0,0 +1,68 @@
+"""
+ONNX 后端与 torch 后端的一致性检查：同一批文本两边编码，逐条算余弦相似度。
+fp32 ONNX 应该与 torch 几乎完全一致，int8 量化允许少量误差。
+
+用法 (在 backend 目录下，需要本地模型 + torch + onnxruntime)：
+    python test/test_encoder_parity.py
+    python -m pytest test/test_encoder_parity.py
+"""
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from app.encoder import MODEL_PATH, load_encoder
+
+# 不在导入时 chdir (会影响同一进程里的其它测试)，模型和数据都按 backend 目录拼绝对路径
+MODEL_DIR = os.path.normpath(os.path.join(BACKEND_DIR, MODEL_PATH))
+
+# 每个后端允许的最小余弦相似度
+THRESHOLDS = {"onnx": 0.999, "onnx-int8": 0.98}
+
+
+def sample_texts(limit=64):
+    texts = ["查询上个月每天的订单数", "各车型销量排名前十", "hello, how many users signed up today?"]
+    path = os.path.join(BACKEND_DIR, "data", "index_ddl.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            texts += [item.get("emb_text", "") for item in json.load(f)[:limit]]
+    return texts
+
+
+def cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def check_parity(backend):
+    texts = sample_texts()
+    ref = load_encoder(MODEL_DIR, "torch").encode(texts)
+    emb = load_encoder(MODEL_DIR, backend).encode(texts)
+    assert emb.shape == ref.shape, f"{backend}: shape {emb.shape} != {ref.shape}"
+    sims = cosine(ref, emb)
+    print(f"🔍 {backend}: min cos={sims.min():.5f}, mean cos={sims.mean():.5f} ({len(texts)} texts)")
+    assert sims.min() >= THRESHOLDS[backend], f"{backend}: min cosine {sims.min():.5f} < {THRESHOLDS[backend]}"
+
+
+def test_onnx_parity():
+    if not os.path.exists(MODEL_DIR):
+        import pytest
+        pytest.skip(f"model not found: {MODEL_DIR}")
+    check_parity("onnx")
+
+
+def test_onnx_int8_parity():
+    if not os.path.exists(MODEL_DIR):
+        import pytest
+        pytest.skip(f"model not found: {MODEL_DIR}")
+    check_parity("onnx-int8")
+
+
+if __name__ == "__main__":
+    for name in THRESHOLDS:
+        check_parity(name)
+    print("✅ 一致性检查通过")
@@ -0,0 +1,107 @@
+"""
+SQL 自动收录检查：超出每小时配额的条目不登记指纹 (下个窗口还能收录)、写入失败不登记；
+按 SQL 指纹查重只针对自动收录，手工训练同一条 SQL 的新问法照常写入，完全重复的返回 duplicate。
+向量库用哈希 Embedding (test/bench_stubs.py)，不需要下载模型和数据库。
+
+用法 (在 backend 目录下)：
+    python test/test_harvester.py
+    python -m pytest test/test_harvester.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "test"))
+os.environ.pop("VECTOR_SERVICE_SOCKET", None)
+
+from bench_stubs import register_hash_encoder
+from app import training
+from app.harvester import SQLHarvester
+from app.vector_store import VectorStore
+
+
+def fresh_store() -> VectorStore:
+    register_hash_encoder()
+    os.environ["EMBEDDING_BACKEND"] = "hash"
+    VectorStore._instance = None
+    VectorStore.DATA_DIR = tempfile.mkdtemp(prefix="harvester_test_")
+    VectorStore.PAYLOAD_MMAP, VectorStore.INDEX_TYPE = False, "flat"
+    return VectorStore()
+
+
+def fresh_harvester(max_per_hour: int) -> SQLHarvester:
+    SQLHarvester._instance = None
+    h = SQLHarvester()
+    h.max_per_hour = max_per_hour
+    return h
+
+
+def pair(n: int) -> dict:
+    return {"question": f"第 {n} 个问题", "sql": f"SELECT * FROM db.t{n}"}
+
+
+def test_over_quota_items_are_not_marked_seen():
+    store = fresh_store()
+    try:
+        h = fresh_harvester(max_per_hour=2)
+        h.flush([pair(1), pair(2), pair(3), pair(1)])
+        assert len(store.data_store["sql"]) == 2
+        assert h.stats["over_quota"] == 1 and h.stats["duplicates"] == 1
+        # 新窗口：上次超配额的 t3 还能收录，已写入的 t1 仍然算重复
+        h._window_start -= 3600
+        h.flush([pair(3), pair(1)])
+        assert [x["sql"] for x in store.data_store["sql"]][-1] == "SELECT * FROM db.t3"
+        assert len(store.data_store["sql"]) == 3
+    finally:
+        VectorStore._instance = None
+        shutil.rmtree(VectorStore.DATA_DIR, ignore_errors=True)
+
+
+def test_failed_write_is_not_marked_seen():
+    store = fresh_store()
+    try:
+        h = fresh_harvester(max_per_hour=10)
+        original = VectorStore.add_training_batch
+        VectorStore.add_training_batch = lambda self, dtype, contents: (_ for _ in ()).throw(OSError("disk full"))
+        try:
+            h.flush([pair(1)])
+            raise AssertionError("flush should propagate the write error")
+        except OSError:
+            pass
+        finally:
+            VectorStore.add_training_batch = original
+        h.flush([pair(1)])
+        assert len(store.data_store["sql"]) == 1
+    finally:
+        VectorStore._instance = None
+        shutil.rmtree(VectorStore.DATA_DIR, ignore_errors=True)
+
+
+def test_manual_training_keeps_new_phrasings():
+    store = fresh_store()
+    try:
+        req = training.TrainRequest(training_type="sql", content={"question": "各城市订单数",
+                                                                  "sql": "SELECT city, COUNT(*) FROM db.o GROUP BY city"})
+        assert training.train(req)["status"] == "success"
+        # 同一条 SQL 换个问法：手工训练照常写入
+        req2 = training.TrainRequest(training_type="sql", content={"question": "每个城市有多少单",
+                                                                   "sql": "select city , count(*) from db.o group by city"})
+        assert training.train(req2)["status"] == "success"
+        # 完全相同的问题：明确返回 duplicate
+        req3 = training.TrainRequest(training_type="sql", content=dict(req.content))
+        assert training.train(req3)["status"] == "duplicate"
+        # 自动收录仍按 SQL 指纹查重
+        assert store.add_training_batch("sql", [{"question": "城市订单分布", "sql": req.content["sql"],
+                                                 "source": "harvest"}]) == 0
+        assert len(store.data_store["sql"]) == 2
+    finally:
+        VectorStore._instance = None
+        shutil.rmtree(VectorStore.DATA_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "SQL 自动收录检查通过")
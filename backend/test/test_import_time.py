@@ -0,0 +1,52 @@
+"""
+启动耗时预算检查：python -X importtime 导入 main，统计累计耗时，
+并确认 torch / sentence-transformers / faiss / pandas 没有在导入阶段被拉进来。
+
+用法 (在 backend 目录下)：
+    python test/test_import_time.py
+    python -m pytest test/test_import_time.py
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 导入 main 的预算 (毫秒)，CI 机器偏慢可以用环境变量放宽
+BUDGET_MS = int(os.getenv("IMPORT_TIME_BUDGET_MS", 2500))
+HEAVY_MODULES = {"torch", "sentence_transformers", "faiss", "pandas", "transformers"}
+
+
+def profile_import(module="main"):
+    env = dict(os.environ, LLM_API_KEY=os.getenv("LLM_API_KEY", "sk-import-time-check"))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum) / 1000
+    return cumulative
+
+
+def test_import_time_budget():
+    cumulative = profile_import()
+    total = cumulative["main"]
+    print(f"⏱️ import main: {total:.0f} ms (budget {BUDGET_MS} ms)")
+    assert total <= BUDGET_MS, f"import main took {total:.0f} ms > {BUDGET_MS} ms"
+
+
+def test_heavy_modules_are_lazy():
+    loaded = {name.split(".")[0] for name in profile_import()}
+    leaked = HEAVY_MODULES & loaded
+    assert not leaked, f"heavy modules imported at startup: {sorted(leaked)}"
+
+
+if __name__ == "__main__":
+    test_import_time_budget()
+    test_heavy_modules_are_lazy()
+    print("✅ 启动导入检查通过")
@@ -0,0 +1,96 @@
+"""
+意图路由检查：留出问法 (不在种子样本里) 的分类准确率、无历史数据时不会判成 ANALYSIS、
+分类耗时 < 1 ms、编码失败时退回关键词规则。
+有本地模型时用真实 Embedding 后端 (EMBEDDING_BACKEND)，否则用离线哈希编码器 (只看字面，准确率门槛放低)。
+
+用法 (在 backend 目录下)：
+    python test/test_intent_router.py
+    python -m pytest test/test_intent_router.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "test"))
+
+import numpy as np
+from app.encoder import MODEL_PATH, load_encoder
+from app.intent import IntentRouter, SEED_EXAMPLES, ANALYSIS, CHAT, QUERY
+from bench_stubs import HashEncoder
+
+# 模型目录按 backend 目录拼绝对路径，不依赖当前工作目录
+MODEL_DIR = os.path.normpath(os.path.join(BACKEND_DIR, MODEL_PATH))
+
+
+class Store:
+    """只实现路由用到的接口 (model.encode / encode_query)"""
+
+    def __init__(self, encoder):
+        self.model = encoder
+
+    def encode_query(self, text):
+        emb = np.asarray(self.model.encode([text]), dtype="float32")
+        return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def make_store():
+    if os.path.isdir(MODEL_DIR):
+        return Store(load_encoder(MODEL_DIR))
+    return Store(HashEncoder())
+
+
+STORE = make_store()
+
+
+# 留出集：和种子样本同类但换了说法，质心没见过，准确率才有意义
+HELD_OUT = {
+    CHAT: ["早上好", "你叫什么名字", "辛苦了，多谢", "你会写代码吗", "明天会下雨吗", "再讲一个笑话吧",
+           "收到，没问题", "这个工具要怎么上手", "推荐几本统计学入门的书", "good morning", "who are you"],
+    QUERY: ["查询昨天的订单总数", "上周每天新注册了多少人", "统计各门店的销售额", "C16 本月的交付量是多少",
+            "退货率最高的五个车型", "列出库存为零的商品", "今年每个季度的营收", "各城市的经销商数量",
+            "那前天呢", "改成按月统计", "list the top 10 customers by revenue", "how many orders were refunded last month"],
+    ANALYSIS: ["分析一下上面的结果", "把这个结果画成折线图", "为什么五月份涨了这么多", "这些数字说明了什么",
+               "用饼图展示各类占比", "总结一下刚才查到的数据", "画个柱状图对比一下", "算一下同比增长",
+               "结果里有没有异常值", "chart the result as bars", "explain the trend above"],
+}
+# 哈希编码器只看字面 n-gram，门槛只用来发现流程问题；真实模型按 0.85 要求
+MIN_ACCURACY = 0.85 if os.path.isdir(MODEL_DIR) else 0.75
+
+
+def test_held_out_accuracy():
+    router = IntentRouter()
+    seen = {t for texts in router.examples().values() for t in texts}
+    assert not seen & {t for texts in HELD_OUT.values() for t in texts}
+    total = correct = 0
+    for label, texts in HELD_OUT.items():
+        for text in texts:
+            total += 1
+            correct += router.route(text, STORE, has_data=True)["intent"] == label
+    assert correct / total >= MIN_ACCURACY, f"{correct}/{total}"
+
+
+def test_no_analysis_without_data():
+    router = IntentRouter()
+    for text in SEED_EXAMPLES[ANALYSIS] + HELD_OUT[ANALYSIS]:
+        assert router.route(text, STORE, has_data=False)["intent"] in (CHAT, QUERY)
+
+
+def test_classify_under_1ms():
+    router = IntentRouter()
+    costs = [router.route("查一下上个月各车型的销量", STORE)["classify_ms"] for _ in range(50)]
+    assert sorted(costs)[len(costs) // 2] < 1.0, costs
+
+
+def test_keyword_fallback():
+    class Broken(Store):
+        def encode_query(self, text):
+            raise RuntimeError("encoder down")
+
+    decision = IntentRouter().route("多少用户", Broken(STORE.model))
+    assert decision["method"] == "keyword" and decision["intent"] == QUERY and decision["embedding"] is None
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), f"意图路由检查通过 (encoder={getattr(STORE.model, 'name', '?')})")
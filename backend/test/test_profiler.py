@@ -0,0 +1,145 @@
+"""
+列画像检查：单列画像 (低基数取值、日期范围、格式、NULL 比例)、渲染长度上限、
+并发画像 (假数据库，出错的表跳过)、按预算进 Prompt、未开启时 Prompt 不变。
+不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_profiler.py
+    python -m pytest test/test_profiler.py
+"""
+import datetime
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.profiler import SchemaProfiler, _shape
+from app.prompt import PromptBuilder
+from app.token_budget import PromptBudgeter
+
+DDL_A = "/* Database: sales */\nCREATE TABLE `orders` (id bigint PK, city varchar)"
+DDL_B = "/* Database: sales */\nCREATE TABLE `cars` (vin varchar)"
+
+
+class FakeCursor:
+    def __init__(self, db, table):
+        self.db, self.table, self.result = db, table, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        if self.table == "broken" and sql.startswith("DESCRIBE"):
+            raise RuntimeError("Lost connection")
+        if "information_schema" in sql:
+            self.result = [{"TABLE_ROWS": 5000}]
+        elif sql.startswith("DESCRIBE"):
+            self.result = [{"Field": "id", "Type": "bigint(20)", "Key": "PRI"},
+                           {"Field": "city", "Type": "varchar(32)", "Key": ""},
+                           {"Field": "created_at", "Type": "datetime", "Key": "MUL"},
+                           {"Field": "memo", "Type": "text", "Key": ""}]
+        elif "MIN(" in sql:
+            self.result = [{"lo": datetime.date(2020, 1, 1), "hi": datetime.date(2024, 12, 31)}]
+        else:
+            self.result = [{"id": i, "city": ["杭州", "上海"][i % 2],
+                            "created_at": datetime.date(2024, 1, 1 + i % 28)} for i in range(100)]
+        self.db.statements.append(sql)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConn:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+
+    def cursor(self):
+        return FakeCursor(self.db, self.table)
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    """库名写成 "sales:orders"，让每个连接知道自己在画哪张表"""
+    def __init__(self):
+        self.statements = []
+
+    def get_connection(self, db_name, readonly=False):
+        assert readonly
+        return FakeConn(self, db_name.split(":")[-1])
+
+
+def test_profile_column():
+    p = SchemaProfiler(FakeDB())
+    col = p.profile_column("status", "tinyint", [1, 2, 2, 3, None, None, 2, 1])
+    assert col["distinct"] == 3 and col["top"][0] == 2 and col["null_ratio"] == 0.25
+
+    col = p.profile_column("vin", "varchar", [f"LSV{i:05d}" for i in range(100)])
+    assert "top" not in col and col["format"] == "AAA99999"
+
+    col = p.profile_column("d", "date", [datetime.date(2024, 3, 1), datetime.date(2023, 1, 5)])
+    assert col["range"] == (datetime.date(2023, 1, 5), datetime.date(2024, 3, 1))
+
+    # 高基数、没有统一格式的字符串：什么都不给 (不把具体值发给 LLM)
+    col = p.profile_column("name", "varchar", [f"user{i}" * (i % 3 + 1) for i in range(100)])
+    assert "top" not in col and "format" not in col
+    assert p.profile_column("x", "int", [None, None])["null_ratio"] == 1.0
+    assert _shape("浙A12345") == "字A99999"
+
+
+def test_render_is_compact_and_capped():
+    p = SchemaProfiler(FakeDB())
+    stats = [p.profile_column("city", "varchar", ["杭州", "上海", "北京"] * 10),
+             p.profile_column("note", "varchar", [None] * 9 + ["x"])]
+    text = p.render(5000, stats)
+    assert text.startswith("rows≈5000 | city: 3 values [杭州, 上海, 北京]") and "note: 90% NULL" in text
+    p.max_chars = 30
+    assert len(p.render(5000, stats * 10)) <= 36
+    assert p.render(None, []) is None
+
+
+def test_profile_all_with_bounded_failures():
+    db = FakeDB()
+    p = SchemaProfiler(db)
+    tables = [{"database": "sales:orders", "table": "orders"}, {"database": "sales:broken", "table": "broken"}]
+    assert p.profile_all(tables) == 1
+    profile = tables[0]["profile"]
+    assert "rows≈5000" in profile and "city: 2 values [杭州, 上海]" in profile
+    # 带索引的日期列用 MIN/MAX 全表范围；text 列不抽样
+    assert "created_at: 2020-01-01 ~ 2024-12-31" in profile
+    assert "profile" not in tables[1]
+    # 超时是语句级 hint，不改连接的会话变量 (连接会还回池里)
+    scans = [s for s in db.statements if s.startswith("SELECT /*+ MAX_EXECUTION_TIME(")]
+    assert len(scans) == 2 and not any(s.startswith("SET") for s in db.statements)
+    assert not any("memo" in s for s in scans)
+
+
+def test_profiles_enter_prompt_under_budget():
+    b = PromptBudgeter(budget=6000)
+    profiles = {"sales.orders": "rows≈5000 | city: 2 values [杭州, 上海]", "sales.cars": "vin: format AAA99999"}
+    text = b.fit_profiles(profiles, [DDL_A, DDL_B], available=1000)
+    assert text.splitlines() == ["- sales.orders: rows≈5000 | city: 2 values [杭州, 上海]",
+                                 "- sales.cars: vin: format AAA99999"]
+    # 预算不够时按 DDL 顺序保留前面的表
+    assert b.fit_profiles(profiles, [DDL_A, DDL_B], available=25).splitlines() == text.splitlines()[:1]
+    assert b.fit_profiles(profiles, [DDL_B], available=1000) == "- sales.cars: vin: format AAA99999"
+
+    rag = {"ddl": [DDL_A, DDL_B], "doc": [], "sql": []}
+    prompt = PromptBuilder.build_system_prompt(rag, profiles=text)
+    assert "Column value hints" in prompt and prompt.index("CREATE TABLE `orders`") < prompt.index("- sales.orders:")
+    # 没有画像时与原来的 Prompt 完全一致
+    assert PromptBuilder.build_system_prompt(rag, profiles=b.fit_profiles({}, [DDL_A], 1000)) == \
+        PromptBuilder.build_system_prompt(rag)
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "列画像检查通过")
@@ -0,0 +1,70 @@
+"""
+Prompt 前缀复用检查：DDL 按 database.table 稳定排序、同一会话后续轮次沿用旧顺序只在末尾追加、
+累积的表超过 max_tables 或超预算 (fits) 时退回本轮排序、会话数超过 max_sessions 时淘汰最久没用的。
+不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_prompt.py
+    python -m pytest test/test_prompt.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.prompt import PrefixCache, PromptBuilder
+
+
+def ddl(db: str, table: str) -> str:
+    return f"/* Database: {db} */\nCREATE TABLE `{table}` (`id` bigint)"
+
+
+A, B, C, D = ddl("sales", "orders"), ddl("sales", "refunds"), ddl("hr", "staff"), ddl("ops", "tickets")
+
+
+def test_system_prompt_is_order_independent():
+    first = PromptBuilder.build_system_prompt({"ddl": [B, A, C], "doc": ["d2", "d1"], "sql": []})
+    second = PromptBuilder.build_system_prompt({"ddl": [C, A, B], "doc": ["d1", "d2"], "sql": []})
+    assert first == second and first.startswith(PromptBuilder.STATIC_PREFIX)
+    assert first.index("`staff`") < first.index("`orders`") < first.index("`refunds`")
+
+
+def test_session_keeps_previous_order_as_prefix():
+    cache = PrefixCache()
+    first = cache.order("u:s1", [B, A])
+    assert first == [A, B]
+    # 新检索到的表排在旧顺序之后：上一轮的 Prompt 仍是这一轮的前缀
+    second = cache.order("u:s1", [C, A])
+    assert second == [A, B, C]
+    prompt1 = PromptBuilder.build_system_prompt({"ddl": []}, first).split("### 2.")[0].rstrip()
+    prompt2 = PromptBuilder.build_system_prompt({"ddl": []}, second)
+    assert prompt2.startswith(prompt1)
+    # 没有会话键：每轮只按本轮结果排序，不跨请求复用
+    assert cache.order(None, [C, A]) == [C, A]
+    assert cache.order("u:s2", [C, A]) == [C, A]
+
+
+def test_too_many_tables_or_over_budget_falls_back():
+    cache = PrefixCache(max_tables=3)
+    cache.order("s", [A, B, C])
+    assert cache.order("s", [D]) == [D]
+    # 退回之后以本轮顺序为新的前缀
+    assert cache.order("s", [A]) == [D, A]
+    assert cache.order("s", [B], fits=lambda ddls: len(ddls) <= 2) == [B]
+
+
+def test_least_recently_used_session_is_evicted():
+    cache = PrefixCache(max_sessions=2)
+    cache.order("s1", [A])
+    cache.order("s2", [B])
+    cache.order("s1", [C])
+    cache.order("s3", [D])
+    assert list(cache._sessions) == ["s1", "s3"]
+    # s2 被淘汰：重新开始，不再带着 B
+    assert cache.order("s2", [C]) == [C]
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "Prompt 前缀复用检查通过")
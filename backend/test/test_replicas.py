@@ -0,0 +1,55 @@
+"""
+只读副本健康检查：DBManager 初始化不等副本探测 (连不上的副本不能卡住导入)，
+首次检查完成前副本按不健康处理、只读查询走主库，检查通过后再切到副本。
+不需要数据库。
+
+用法 (在 backend 目录下)：
+    python test/test_replicas.py
+    python -m pytest test/test_replicas.py
+"""
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.db import DBManager
+
+
+def test_replica_check_runs_in_background():
+    release = threading.Event()
+
+    def slow_status(self, replica):
+        release.wait(5)  # 模拟连不上的副本：卡在 connect_timeout 上
+        return 0.0
+
+    saved = (DBManager._instance, DBManager._replica_status, os.environ.get("DB_REPLICA_HOSTS"))
+    DBManager._instance = None
+    DBManager._replica_status = slow_status
+    os.environ["DB_REPLICA_HOSTS"] = "10.0.0.2:3307"
+    try:
+        start = time.perf_counter()
+        db = DBManager()
+        assert time.perf_counter() - start < 1
+        replica = db.replicas[0]
+        assert not replica["healthy"] and replica["lag"] is None
+        assert db._pick_host("sales", readonly=True) == (db.conn_params["host"], db.conn_params["port"])
+
+        release.set()
+        deadline = time.time() + 2
+        while not replica["healthy"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert db._pick_host("sales", readonly=True) == ("10.0.0.2", 3307)
+    finally:
+        DBManager._instance, DBManager._replica_status, hosts = saved
+        if hosts is None:
+            os.environ.pop("DB_REPLICA_HOSTS", None)
+        else:
+            os.environ["DB_REPLICA_HOSTS"] = hosts
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "副本健康检查通过")
@@ -0,0 +1,173 @@
+"""
+查询结果接口检查：登记后分页 / 选列、大结果落盘后照常分页、NDJSON / CSV / Arrow 流式导出、过期清理
+(get 也检查 TTL；扫盘不删仍在用的结果文件)。
+只挂 results 的路由，不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_results.py
+    python -m pytest test/test_results.py
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.results import ResultRegistry, router
+
+ROWS = [{"id": i, "city": ["杭州", "上海", "北京"][i % 3], "amount": i * 1.5} for i in range(2500)]
+
+
+def registry(**settings) -> ResultRegistry:
+    ResultRegistry._instance = None
+    reg = ResultRegistry()
+    reg.spill_dir = tempfile.mkdtemp(prefix="results_test_")
+    reg.spill_rows, reg.stride, reg.chunk_rows = 1000, 100, 250
+    for k, v in settings.items():
+        setattr(reg, k, v)
+    return reg
+
+
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def wait_spilled(reg: ResultRegistry, rid: str):
+    reg._spiller.submit(lambda: None).result(timeout=10)
+    assert reg.entries[rid].path is not None and reg.entries[rid].rows is None
+
+
+def test_pagination_and_projection():
+    reg = registry()
+    try:
+        rid = reg.register(ROWS[:300], "SELECT ...")
+        body = client().get(f"/api/results/{rid}", params={"offset": 120, "limit": 50, "columns": "id,city"}).json()
+        assert body["rows"] == 300 and body["columns"] == ["id", "city"]
+        assert body["data"][0] == {"id": 120, "city": "杭州"} and len(body["data"]) == 50
+        assert body["next_offset"] == 170
+        last = client().get(f"/api/results/{rid}", params={"offset": 280}).json()
+        assert len(last["data"]) == 20 and last["next_offset"] is None
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_errors():
+    reg = registry()
+    try:
+        rid = reg.register(ROWS[:10])
+        c = client()
+        assert c.get("/api/results/" + "0" * 32).status_code == 404
+        assert c.get("/api/results/../etc").status_code == 404
+        assert c.get(f"/api/results/{rid}", params={"columns": "nope"}).status_code == 400
+        assert c.get(f"/api/results/{rid}", params={"format": "xlsx"}).status_code == 400
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_large_result_is_spilled_and_paged_from_disk():
+    reg = registry()
+    try:
+        rid = reg.register(list(ROWS), "SELECT big")
+        wait_spilled(reg, rid)
+        body = client().get(f"/api/results/{rid}", params={"offset": 1234, "limit": 3}).json()
+        assert [r["id"] for r in body["data"]] == [1234, 1235, 1236] and body["spilled"]
+
+        # 其他 worker (空的注册表) 通过 .meta.json 也能读到
+        reg.entries.clear()
+        body = client().get(f"/api/results/{rid}", params={"offset": 2499}).json()
+        assert body["data"] == [ROWS[2499]]
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_streaming_exports():
+    reg = registry()
+    try:
+        rid = reg.register(list(ROWS))
+        wait_spilled(reg, rid)
+        c = client()
+        resp = c.get(f"/api/results/{rid}", params={"format": "ndjson", "columns": "id"})
+        lines = resp.text.splitlines()
+        assert resp.headers["x-total-rows"] == "2500"
+        assert len(lines) == 2500 and json.loads(lines[-1]) == {"id": 2499}
+
+        resp = c.get(f"/api/results/{rid}", params={"format": "csv", "offset": 10, "limit": 5})
+        rows = list(csv.reader(io.StringIO(resp.content.decode("utf-8-sig"))))
+        assert rows[0] == ["id", "city", "amount"] and rows[1] == ["10", "上海", "15.0"] and len(rows) == 6
+
+        resp = c.get(f"/api/results/{rid}", params={"format": "arrow"})
+        try:
+            import pyarrow as pa
+        except ImportError:
+            assert resp.status_code == 501
+            return
+        table = pa.ipc.open_stream(resp.content).read_all()
+        assert table.num_rows == 2500 and table.column_names == ["id", "city", "amount"]
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_expired_results_are_removed():
+    reg = registry(ttl=0.05)
+    try:
+        rid = reg.register(list(ROWS))
+        wait_spilled(reg, rid)
+        path = reg.entries[rid].path
+        time.sleep(0.1)
+        reg.register(ROWS[:1])
+        assert rid not in reg.entries and not os.path.exists(path)
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_get_enforces_ttl():
+    reg = registry(ttl=0.05)
+    try:
+        rid = reg.register(list(ROWS))
+        wait_spilled(reg, rid)
+        path = reg.entries[rid].path
+        time.sleep(0.1)
+        # 还没有新的 register 触发 _evict，get 也不能再返回过期结果
+        assert reg.get(rid) is None and rid not in reg.entries and not os.path.exists(path)
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+def test_sweep_keeps_files_of_live_entries():
+    reg = registry()
+    try:
+        rid = reg.register(list(ROWS))
+        wait_spilled(reg, rid)
+        path = reg.entries[rid].path
+        # 文件很久没改过，但本 worker 还登记着、刚访问过：扫盘不能删
+        old = time.time() - 2 * reg.ttl
+        for suffix in ("", ".meta.json"):
+            os.utime(path + suffix, (old, old))
+        reg._last_sweep = 0.0
+        reg.register(ROWS[:1])
+        assert os.path.exists(path) and os.path.exists(path + ".meta.json")
+        assert client().get(f"/api/results/{rid}", params={"offset": 2000, "limit": 1}).json()["data"] == [ROWS[2000]]
+
+        # get 刷新了 mtime：别的 worker (空的注册表) 扫盘时也不会删
+        assert os.path.getmtime(path) > old + reg.ttl
+        reg.entries.clear()
+        reg._last_sweep = 0.0
+        reg._evict()
+        assert os.path.exists(path)
+    finally:
+        shutil.rmtree(reg.spill_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "查询结果接口检查通过")
@@ -0,0 +1,55 @@
+"""
+沙箱输出捕获检查：print、直接写 sys.stdout (df.info()) 都进本次执行的 stdout，
+并发执行时互不串台，也不写到服务日志里。
+
+用法 (在 backend 目录下)：
+    python test/test_sandbox.py
+    python -m pytest test/test_sandbox.py
+"""
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.sandbox import PythonSandbox
+
+ROWS = [{"city": "杭州", "qty": 3}, {"city": "宁波", "qty": 5}]
+
+
+def test_direct_stdout_writes_are_captured():
+    res = PythonSandbox().execute("import sys\nsys.stdout.write('raw line\\n')\ndf.info()\nprint(df.qty.sum())", ROWS)
+    assert res["success"], res
+    out = res["stdout"]
+    assert out.startswith("raw line") and "RangeIndex: 2 entries" in out and out.endswith("8")
+
+
+def test_concurrent_runs_do_not_mix_and_service_log_is_clean():
+    sandbox = PythonSandbox()
+    barrier = threading.Barrier(4)
+
+    def run(n):
+        barrier.wait()
+        code = f"import sys\nfor i in range(200):\n    print('job{n}', i)\n    sys.stdout.write('w{n}\\n')"
+        return n, sandbox.execute(code)
+
+    saved, log = sys.stdout, io.StringIO()
+    sys.stdout = log
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(run, range(4)))
+        print("service log line")
+    finally:
+        sys.stdout = saved
+    for n, res in results:
+        lines = res["stdout"].splitlines()
+        assert len(lines) == 400 and all(l.startswith((f"job{n} ", f"w{n}")) for l in lines)
+    assert log.getvalue() == "service log line\n"
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "沙箱输出捕获检查通过")
@@ -0,0 +1,95 @@
+"""
+序列化层检查：数据库类型 (Decimal / datetime / bytes / TIME)、NumPy / pandas 类型、
+RawJSON 拼接结果与整体序列化一致、不认识的类型、超过 64 位的整数、没装 orjson 时的标准库后备。
+不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_serialize.py
+    python -m pytest test/test_serialize.py
+"""
+import datetime
+import decimal
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+import pandas as pd
+from app import serialize
+from app.serialize import RawJSON, dumps, dumps_str, prepare, to_jsonable
+
+DB_ROW = {
+    "id": 1, "amount": decimal.Decimal("12.50"), "name": "杭州",
+    "created_at": datetime.datetime(2024, 3, 1, 8, 30, 5), "day": datetime.date(2024, 3, 1),
+    "duration": datetime.timedelta(hours=1, minutes=2), "blob": b"abc", "missing": None,
+}
+DB_EXPECTED = {
+    "id": 1, "amount": 12.5, "name": "杭州", "created_at": "2024-03-01T08:30:05", "day": "2024-03-01",
+    "duration": "1:02:00", "blob": "abc", "missing": None,
+}
+
+
+def check_types():
+    assert to_jsonable([DB_ROW]) == [DB_EXPECTED]
+
+    chart = {"x": np.array(["C10", "C11"], dtype=object), "y": np.array([1.5, np.nan]),
+             "total": np.int64(7), "ratio": np.float32(0.5), "ok": np.bool_(True),
+             "ts": pd.Timestamp("2024-01-01 10:00"), "nat": pd.NaT,
+             "series": pd.Series([1, 2]), "frame": pd.DataFrame({"a": [1, 2]})}
+    assert to_jsonable(chart) == {
+        "x": ["C10", "C11"], "y": [1.5, None], "total": 7, "ratio": 0.5, "ok": True,
+        "ts": "2024-01-01T10:00:00", "nat": None, "series": [1, 2], "frame": [{"a": 1}, {"a": 2}]}
+
+    class Custom:
+        def __str__(self):
+            return "custom"
+    try:
+        dumps({"v": Custom()})
+        raise AssertionError("unknown types must not be serialized silently")
+    except TypeError:
+        pass
+    assert to_jsonable({"v": Custom()}, lenient=True) == {"v": "custom"}
+
+
+def check_raw_json_splice():
+    data, raw = prepare([DB_ROW] * 3)
+    spliced = dumps({"status": "success", "message": "Query returned 3 rows.", "data": RawJSON(raw)})
+    assert spliced == dumps({"status": "success", "message": "Query returned 3 rows.", "data": data})
+    assert json.loads(dumps_str({"data": RawJSON(raw)}))["data"][0] == DB_EXPECTED
+
+
+def test_with_orjson():
+    check_types()
+    check_raw_json_splice()
+
+
+def test_big_integers():
+    big = {"n": 2 ** 70, "d": decimal.Decimal("1.5"), "day": datetime.date(2024, 3, 1)}
+    # 宽松模式 (SSE、导出) 退回标准库，大整数原样输出
+    assert dumps(big, lenient=True) == b'{"n":1180591620717411303424,"d":1.5,"day":"2024-03-01"}'
+    assert json.loads(dumps({"data": RawJSON(b"[]"), "rows": [big]}, lenient=True))["rows"][0]["n"] == 2 ** 70
+    if serialize.orjson is not None:
+        try:
+            dumps(big)
+            raise AssertionError("strict dumps should reject integers orjson cannot encode")
+        except TypeError:
+            pass
+
+
+def test_stdlib_fallback():
+    saved = serialize.orjson
+    serialize.orjson = None
+    try:
+        check_raw_json_splice()
+        assert to_jsonable([DB_ROW]) == [DB_EXPECTED]
+        assert to_jsonable({"n": np.int64(3), "a": np.arange(2)}) == {"n": 3, "a": [0, 1]}
+    finally:
+        serialize.orjson = saved
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), f"序列化检查通过 (orjson={'yes' if serialize.orjson else 'no'})")
@@ -0,0 +1,138 @@
+"""
+会话本地分析检查：结果集登记成 t1/t2 表、追问 SQL 在本地执行 (分组、Top-N、CTE)、
+只读且只能查本会话的表 (会话按 用户 + session_id 隔离)、表数上限、落盘结果也能装载、Prompt 段落。
+没装 duckdb 时走 sqlite 后备引擎，不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_session_data.py
+    python -m pytest test/test_session_data.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.prompt import PromptBuilder
+from app.results import ResultRegistry
+from app.session_data import SessionData
+
+ORDERS = [{"id": i, "model": ["C10", "C11", "C16"][i % 3], "month": f"2024-{i % 12 + 1:02d}", "qty": i % 5 + 1}
+          for i in range(600)]
+
+
+def fresh(**settings) -> SessionData:
+    ResultRegistry._instance = None
+    reg = ResultRegistry()
+    reg.spill_dir = tempfile.mkdtemp(prefix="session_data_test_")
+    reg.spill_rows, reg.stride = 500, 100
+    SessionData._instance = None
+    sd = SessionData()
+    for k, v in settings.items():
+        setattr(sd, k, v)
+    return sd
+
+
+def cleanup():
+    shutil.rmtree(ResultRegistry().spill_dir, ignore_errors=True)
+
+
+def test_follow_up_queries_run_locally():
+    sd = fresh()
+    try:
+        name = sd.add("s1", ResultRegistry().register(ORDERS[:300], "SELECT * FROM sales.orders"))
+        assert name == "t1"
+        res = sd.query("s1", "SELECT month, SUM(qty) AS qty FROM t1 GROUP BY month ORDER BY month")
+        assert res["status"] == "success" and len(res["data"]) == 12 and res["columns"] == ["month", "qty"]
+        assert sum(r["qty"] for r in res["data"]) == sum(r["qty"] for r in ORDERS[:300])
+
+        top = sd.query("s1", "WITH m AS (SELECT model, SUM(qty) q FROM t1 GROUP BY model) "
+                             "SELECT * FROM m ORDER BY q DESC LIMIT 2")
+        assert top["status"] == "success" and len(top["data"]) == 2
+
+        # 后登记的表，已经建过连接的会话也能查到
+        sd.add("s1", ResultRegistry().register(ORDERS[:10]))
+        joined = sd.query("s1", "SELECT COUNT(*) AS n FROM t1 JOIN t2 ON t1.id = t2.id")
+        assert joined["data"] == [{"n": 10}]
+    finally:
+        cleanup()
+
+
+def test_only_readonly_queries_over_session_tables():
+    sd = fresh()
+    try:
+        sd.add("s1", ResultRegistry().register(ORDERS[:5]))
+        sd.add("s2", ResultRegistry().register(ORDERS[:5]))
+        for sql in ("DELETE FROM t1", "SELECT * FROM sales.orders", "SELECT * FROM t2; SELECT 1",
+                    "SELECT * FROM sqlite_master", "DROP TABLE t1"):
+            assert sd.query("s1", sql)["status"] == "error", sql
+        # 每个会话只看得到自己的表 (s2 的 t1 是另一张)
+        assert sd.query("s3", "SELECT * FROM t1")["status"] == "error"
+        assert sd.query("s2", "SELECT COUNT(*) AS n FROM t1")["data"] == [{"n": 5}]
+    finally:
+        cleanup()
+
+
+def test_table_cap_and_row_cap():
+    sd = fresh(max_tables=2, max_rows=50)
+    try:
+        for _ in range(3):
+            sd.add("s1", ResultRegistry().register(ORDERS[:100]))
+        assert [t["name"] for t in sd.tables("s1")] == ["t2", "t3"]
+        assert sd.query("s1", "SELECT * FROM t1")["status"] == "error"
+        res = sd.query("s1", "SELECT * FROM t3")
+        assert len(res["data"]) == 50 and res["truncated"]
+    finally:
+        cleanup()
+
+
+def test_spilled_results_are_loaded_from_disk():
+    sd = fresh()
+    try:
+        reg = ResultRegistry()
+        rid = reg.register(list(ORDERS))
+        reg._spiller.submit(lambda: None).result(timeout=10)
+        assert reg.get(rid).rows is None
+        sd.add("s1", rid)
+        res = sd.query("s1", "SELECT COUNT(*) AS n, MAX(id) AS m FROM t1")
+        assert res["data"] == [{"n": 600, "m": 599}]
+        assert len(sd.latest_rows("s1")) == 600
+    finally:
+        cleanup()
+
+
+def test_prompt_section_lists_tables():
+    sd = fresh()
+    try:
+        sd.add("s1", ResultRegistry().register(ORDERS[:3], "SELECT id, model, month, qty\nFROM sales.orders"))
+        text = PromptBuilder.build_session_tables(sd.tables("s1"), sd.engine)
+        assert "- t1 (3 rows): id, model, month, qty -- from: SELECT id, model, month, qty FROM sales.orders" in text
+        assert "query_session_data" in text
+        assert PromptBuilder.build_session_tables([], sd.engine) == ""
+    finally:
+        cleanup()
+
+
+def test_session_key_is_user_scoped():
+    from app.agent import AgentEngine
+    # 没有 session_id 或没有明确的用户标识：不登记、不复用
+    assert AgentEngine._session_key(None, "alice") is None
+    assert AgentEngine._session_key("s1", None) is None
+    alice, bob = AgentEngine._session_key("s1", "alice"), AgentEngine._session_key("s1", "bob")
+    assert alice != bob
+    sd = fresh()
+    try:
+        assert sd.add(None, ResultRegistry().register(ORDERS[:5])) is None
+        sd.add(alice, ResultRegistry().register(ORDERS[:5]))
+        # 同一个 session_id，别的用户看不到 alice 的表
+        assert sd.tables(bob) == [] and sd.query(bob, "SELECT * FROM t1")["status"] == "error"
+        assert [t["name"] for t in sd.tables(alice)] == ["t1"]
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "会话本地分析检查通过")
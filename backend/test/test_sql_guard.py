@@ -0,0 +1,48 @@
+"""
+SQLGuard.validate 检查：只读校验、智能 LIMIT，以及返回的 SQL 不被改写
+(行注释不能吞掉后面的语句、字符串常量里的空白保持原样)。
+
+用法 (在 backend 目录下)：
+    python test/test_sql_guard.py
+    python -m pytest test/test_sql_guard.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.db_guard import SQLGuard
+
+
+def test_comment_is_not_folded_into_query():
+    sql = "SELECT a -- note\nFROM db.t WHERE x=1 LIMIT 5"
+    assert SQLGuard.validate(sql + ";  ") == sql
+    # 没有 LIMIT 时由语法树重新生成，注释变成块注释，语句完整
+    out = SQLGuard.validate("SELECT a -- note\nFROM db.t WHERE x=1")
+    assert out.endswith("FROM db.t WHERE x = 1 LIMIT 100") and "*/ FROM" in out
+
+
+def test_literal_whitespace_is_preserved():
+    sql = "SELECT * FROM db.t WHERE name = 'a  b' LIMIT 5"
+    assert SQLGuard.validate(sql) == sql
+    assert "'a  b'" in SQLGuard.validate("SELECT * FROM db.t WHERE name = 'a  b'")
+    # 只差字符串里空白的两条 SQL 不能共用缓存的语法树
+    SQLGuard.validate("SELECT * FROM db.t WHERE name = 'x y'")
+    assert "'x   y'" in SQLGuard.validate("SELECT * FROM db.t WHERE name = 'x   y'")
+
+
+def test_limit_and_readonly():
+    assert SQLGuard.validate("SELECT COUNT(*) FROM db.t") == "SELECT COUNT(*) FROM db.t"
+    assert SQLGuard.validate("SELECT city, COUNT(*) FROM db.t GROUP BY city").endswith("LIMIT 100")
+    for sql in ("DELETE FROM db.t", "SELECT 1; DROP TABLE db.t", "INSERT INTO db.t SELECT * FROM db.s"):
+        try:
+            SQLGuard.validate(sql)
+            raise AssertionError(sql)
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "SQL 校验检查通过")
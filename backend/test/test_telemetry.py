@@ -0,0 +1,104 @@
+"""
+链路追踪检查：span 嵌套 (含 create_task / to_thread 子任务)、TRACE_FILE 落盘、/metrics 文本格式。
+label 值按 Prometheus 格式转义。不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_telemetry.py
+    python -m pytest test/test_telemetry.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app import telemetry
+from app.telemetry import span, start_span
+
+
+def read_spans(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {s["name"]: s for s in map(json.loads, f)}
+
+
+def run_span_tree():
+    path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+    os.environ["TRACE_FILE"] = path
+
+    def blocking():
+        with span("child.thread"):
+            pass
+
+    async def child():
+        with span("child.task"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        with span("root", request="r1") as root:
+            manual = start_span("manual")
+            await asyncio.create_task(child())
+            await asyncio.to_thread(blocking)
+            manual.end()
+            root.set(rows=3)
+
+    try:
+        asyncio.run(main())
+    finally:
+        os.environ.pop("TRACE_FILE")
+
+    spans = read_spans(path)
+    root = spans["root"]
+    assert root["parent_id"] is None and root["attrs"] == {"request": "r1", "rows": 3}
+    for name in ("manual", "child.task", "child.thread"):
+        assert spans[name]["parent_id"] == root["span_id"], name
+        assert spans[name]["trace_id"] == root["trace_id"], name
+    assert spans["child.task"]["duration_ms"] >= 10
+    return spans
+
+
+def test_span_tree():
+    run_span_tree()
+
+
+def test_error_status():
+    try:
+        with span("boom"):
+            raise RuntimeError("bad")
+    except RuntimeError:
+        pass
+    text = telemetry.render_metrics()
+    assert 'agent_stage_seconds_count{stage="boom",status="error"} 1' in text
+
+
+def test_metrics_text():
+    with span("render"):
+        pass
+    telemetry.LLM_TOKENS.inc(120, kind="prompt")
+    collector = telemetry.register_collector(lambda: [("db_pool_in_use", "in use", {"host": "h"}, 2)])
+    try:
+        text = telemetry.render_metrics()
+    finally:
+        telemetry.unregister_collector(collector)
+    assert "db_pool_in_use" not in telemetry.render_metrics()
+    assert "# TYPE agent_stage_seconds histogram" in text
+    assert 'agent_stage_seconds_bucket{stage="render",status="ok",le="+Inf"}' in text
+    assert 'agent_llm_tokens_total{kind="prompt"}' in text
+    assert 'db_pool_in_use{host="h"} 2' in text
+
+
+def test_label_values_are_escaped():
+    telemetry.LLM_TOKENS.inc(1, kind='a\\b"c\nd')
+    assert 'agent_llm_tokens_total{kind="a\\\\b\\"c\\nd"} 1' in telemetry.render_metrics()
+
+
+if __name__ == "__main__":
+    spans = run_span_tree()
+    for s in spans.values():
+        print(f"  {s['name']:<14} {s['duration_ms']:>8.2f} ms  parent={s['parent_id']}")
+    test_error_status()
+    test_metrics_text()
+    test_label_values_are_escaped()
+    print("✅ telemetry 检查通过")
@@ -0,0 +1,116 @@
+"""
+Token 预算检查：DDL 压缩 (保留 PK、注释和 enum / set 的取值)、超预算时按 SQL 示例 -> 文档 -> 表的顺序从尾部裁剪、
+列画像按 DDL 顺序放到预算为止、历史对话从最新往前取且旧轮次压成摘要。
+Token 计数用字符估算 (不加载 tokenizer.json)，不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_token_budget.py
+    python -m pytest test/test_token_budget.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.token_budget import PromptBudgeter, TokenCounter
+
+ORDERS_DDL = """/* Database: sales */
+CREATE TABLE `orders` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `status` enum('paid','refunded','it''s (odd)') NOT NULL DEFAULT 'paid' COMMENT '订单状态',
+  `tags` set('vip','new') DEFAULT NULL,
+  `amount` decimal(10,2) DEFAULT NULL COMMENT '金额',
+  PRIMARY KEY (`id`),
+  KEY `idx_status` (`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='订单表'"""
+
+
+def budgeter(**kwargs) -> PromptBudgeter:
+    counter = TokenCounter()
+    counter._tokenizer, counter._loaded = None, True
+    return PromptBudgeter(**kwargs)
+
+
+def test_token_counter_estimate():
+    counter = budgeter().counter
+    assert counter.count("") == 0
+    assert counter.count("订单数") == 3 and counter.count("abcdefgh") == 2
+    assert counter.count_messages([{"role": "user", "content": "订单数"}]) == 7
+
+
+def test_compress_ddl_keeps_enum_values():
+    compact = PromptBudgeter.compress_ddl(ORDERS_DDL)
+    assert compact == ("/* Database: sales */\n"
+                       "CREATE TABLE `orders` (id bigint PK, status enum('paid','refunded','it''s (odd)') '订单状态', "
+                       "tags set('vip','new'), amount decimal '金额') COMMENT='订单表'")
+    assert PromptBudgeter.compress_ddl("not a ddl") == "not a ddl"
+
+
+def test_compress_ddl_truncates_long_value_lists():
+    values = ",".join(f"'v{i}'" for i in range(PromptBudgeter.ENUM_MAX_VALUES + 5))
+    compact = PromptBudgeter.compress_ddl(f"CREATE TABLE `t` (\n  `kind` enum({values}) NOT NULL\n)")
+    kept = ",".join(f"'v{i}'" for i in range(PromptBudgeter.ENUM_MAX_VALUES))
+    assert compact == f"CREATE TABLE `t` (kind enum({kept},...))"
+
+
+def test_fit_context_trims_from_the_tail():
+    b = budgeter(budget=10 ** 6)
+    rag = {"ddl": [ORDERS_DDL, "CREATE TABLE `a` (\n  `x` int\n)", "CREATE TABLE `b` (\n  `y` int\n)"],
+           "doc": ["doc one " * 10, "doc two " * 10], "sql": ["sql one " * 10, "sql two " * 10]}
+    full = b.fit_context(rag, reserved=0)
+    assert len(full["ddl"]) == 3 and full["ddl"][0] == PromptBudgeter.compress_ddl(ORDERS_DDL)
+
+    # 只够放下一部分：先丢 SQL 示例，再丢文档 (都至少留 1 条)，最后丢排名靠后的表
+    no_sql_tail = b.context_tokens(dict(full, sql=full["sql"][:1]))
+    trimmed = b.fit_context(rag, reserved=b.budget - no_sql_tail)
+    assert trimmed["sql"] == full["sql"][:1] and trimmed["doc"] == full["doc"] and len(trimmed["ddl"]) == 3
+
+    minimal = b.fit_context(rag, reserved=b.budget - 1)
+    assert minimal == {"ddl": full["ddl"][:1], "doc": full["doc"][:1], "sql": full["sql"][:1]}
+    assert b.fits(full, full["ddl"], reserved=0) and not b.fits(full, full["ddl"], reserved=b.budget)
+
+
+def test_fit_profiles_follows_ddl_order_within_budget():
+    b = budgeter()
+    ddls = ["/* Database: sales */ CREATE TABLE `orders` (id int)", "/* Database: hr */ CREATE TABLE `staff` (id int)"]
+    profiles = {"sales.orders": "status: 2 values [paid, refunded]", "hr.staff": "rows≈10", "ops.x": "unused"}
+    text = b.fit_profiles(profiles, ddls, available=10 ** 6)
+    assert text.splitlines() == ["- sales.orders: status: 2 values [paid, refunded]", "- hr.staff: rows≈10"]
+    first = b.counter.count(text.splitlines()[0]) + 1
+    assert b.fit_profiles(profiles, ddls, available=first) == text.splitlines()[0]
+    assert b.fit_profiles({}, ddls, available=100) == ""
+
+
+def test_fit_history_keeps_latest_turns_and_summarizes_older():
+    b = budgeter(history_budget=40)
+    history = [
+        {"role": "user", "content": "第一个问题 " + "很长的描述" * 10},
+        {"role": "assistant", "content": "第一个回答"},
+        {"role": "user", "content": "第二个问题"},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "c1"}]},
+        {"role": "tool", "content": "[{\"n\": 1}]"},
+        {"role": "assistant", "content": "第二个回答"},
+        {"role": "user", "content": "第三个问题"},
+    ]
+    window = b.fit_history(history)
+    assert window[0]["role"] == "system" and window[0]["content"].startswith("Earlier conversation")
+    kept = window[1:]
+    # 保留的是末尾连续的几条，顺序不变
+    assert kept == history[len(history) - len(kept):] and kept[-1]["content"] == "第三个问题"
+    assert "- User asked: 第一个问题" in window[0]["content"]
+
+    # 窗口不能从 tool 消息开始 (对应的 tool_calls 已被裁掉)
+    b.history_budget = b.counter.count_messages(history[4:])
+    window = b.fit_history(history)
+    assert window[1] is history[5]
+
+    # 最后一条用户消息再长也保留
+    b.history_budget = 1
+    long_question = [{"role": "user", "content": "超长问题" * 500}]
+    assert b.fit_history(long_question) == long_question
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "Token 预算检查通过")
@@ -0,0 +1,133 @@
+"""
+同一轮工具调用的依赖调度检查：多条 SQL 并发执行；图表 / Python 等排在它前面的 SQL 跑完，
+用其中最后一个成功的结果；前面没有 SQL 时用上一轮的数据。
+ToolManager / 沙箱用替身，不需要数据库和 LLM。
+
+用法 (在 backend 目录下)：
+    python test/test_tool_schedule.py
+    python -m pytest test/test_tool_schedule.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["SQL_COST_GATE"] = "0"
+
+from app.agent import AgentEngine
+
+# 表名 -> (耗时秒, 返回的行 / None 表示报错)
+TABLES = {
+    "slow": (0.3, [{"src": "slow"}]),
+    "fast": (0.05, [{"src": "fast"}]),
+    "broken": (0.05, None),
+}
+
+
+class StubTools:
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_args(text):
+        return json.loads(text)
+
+    def explain(self, sql):
+        return None
+
+    def execute(self, tool_name, args):
+        table = next(t for t in TABLES if f"db.{t}" in args["query"])
+        delay, rows = TABLES[table]
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(delay)
+        with self.lock:
+            self.running -= 1
+        if rows is None:
+            return {"status": "error", "message": f"SQL Error: {table}"}
+        return {"status": "success", "data": list(rows)}
+
+
+class StubSandbox:
+    def __init__(self):
+        self.seen = []
+
+    def execute(self, code, data_context=None):
+        self.seen.append(data_context)
+        return {"success": True, "stdout": "ok", "chart_config": None, "result": None}
+
+
+class StubLLM:
+    async def chat_completion(self, *args, **kwargs):
+        raise RuntimeError("auto-fix disabled in this test")
+
+
+def engine() -> AgentEngine:
+    e = object.__new__(AgentEngine)
+    e.tools, e._sandbox, e._vector_store, e.llm = StubTools(), StubSandbox(), None, StubLLM()
+    return e
+
+
+def call(name: str, **args) -> dict:
+    return {"id": f"call_{name}", "function": {"name": name, "arguments": json.dumps(args)}}
+
+
+def sql(table: str) -> dict:
+    return call("execute_sql", query=f"SELECT * FROM db.{table}")
+
+
+async def run(e: AgentEngine, calls: list, base_data=None) -> dict:
+    tasks = e._schedule_tools(calls, base_data)
+    results = {}
+    for fut in asyncio.as_completed(list(tasks.values())):
+        idx, events, tool_result, data = await fut
+        results[idx] = (events, tool_result)
+    return results
+
+
+def test_chart_and_python_wait_for_earlier_sql():
+    e = engine()
+    calls = [sql("slow"), call("execute_python", code="print(df)"),
+             call("generate_chart", chart_type="bar", x_key="src", y_key="src")]
+    results = asyncio.run(run(e, calls))
+    # Python 等到慢 SQL 返回后拿到它的数据，而不是空的 base_data
+    assert e.sandbox.seen == [[{"src": "slow"}]]
+    chart = results[2][0][0]
+    assert chart["type"] == "chart" and chart["data"] == [{"src": "slow"}]
+
+
+def test_uses_last_successful_result():
+    e = engine()
+    # 后面那条 SQL 先跑完，但按调用顺序它才是"最后一个"；报错的 SQL 不覆盖数据
+    calls = [sql("slow"), sql("fast"), sql("broken"), call("generate_chart", x_key="src", y_key="src")]
+    start = time.perf_counter()
+    results = asyncio.run(run(e, calls))
+    assert results[3][0][0]["data"] == [{"src": "fast"}]
+    assert results[2][1]["status"] == "error"
+    # SQL 之间并发执行
+    assert e.tools.peak == 3 and time.perf_counter() - start < 0.6
+
+    e = engine()
+    results = asyncio.run(run(e, [sql("fast"), sql("slow"), call("generate_chart", x_key="src", y_key="src")]))
+    assert results[2][0][0]["data"] == [{"src": "slow"}]
+
+
+def test_falls_back_to_previous_data():
+    e = engine()
+    previous = [{"src": "previous"}]
+    results = asyncio.run(run(e, [sql("broken"), call("execute_python", code="print(df)")], previous))
+    assert e.sandbox.seen == [previous]
+    results = asyncio.run(run(e, [call("generate_chart", x_key="src", y_key="src")]))
+    assert results[0][1] == {"status": "error", "message": "No data available."}
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "工具依赖调度检查通过")
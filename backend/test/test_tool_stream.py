@@ -0,0 +1,78 @@
+"""
+流式工具调用拼接检查：字符串里的括号、转义引号、参数被切成任意碎片、多个工具下标交替，
+参数闭合的那一刻才报告，流结束时补报没闭合的工具。
+
+用法 (在 backend 目录下)：
+    python test/test_tool_stream.py
+    python -m pytest test/test_tool_stream.py
+"""
+import json
+import os
+import sys
+from types import SimpleNamespace as NS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.tool_stream import JsonClosureScanner, ToolCallAssembler
+
+TRICKY = json.dumps({"query": "SELECT '{' AS a, \"}\" AS b, 'x\\\\' AS c FROM t WHERE n = '[1]'",
+                     "nested": {"list": [1, {"k": "}]"}]}})
+
+
+def delta(index, arguments=None, name=None, call_id=None):
+    return NS(index=index, id=call_id, function=NS(name=name, arguments=arguments))
+
+
+def test_scanner_ignores_braces_and_escaped_quotes_in_strings():
+    s = JsonClosureScanner()
+    assert not s.feed(TRICKY[:-1])
+    assert s.feed(TRICKY[-1])
+    # 转义引号不能结束字符串：里面的 } 不算闭合
+    s = JsonClosureScanner()
+    assert not s.feed('{"a": "say \\"}\\" ok')
+    assert s.feed('"}')
+    # 闭合之后的内容忽略
+    assert s.feed("}}}") and s.depth == 0
+
+
+def test_scanner_handles_any_split():
+    for size in (1, 2, 3, 7):
+        s = JsonClosureScanner()
+        pieces = [TRICKY[i:i + size] for i in range(0, len(TRICKY), size)]
+        closed = [s.feed(p) for p in pieces]
+        assert closed[-1] and not any(closed[:-1]), size
+    # 反斜杠刚好在碎片末尾
+    s = JsonClosureScanner()
+    assert not s.feed('{"a": "x\\')
+    assert not s.feed('"}')
+    assert s.feed('"}')
+
+
+def test_assembler_reports_each_call_when_its_arguments_close():
+    asm = ToolCallAssembler()
+    args0 = json.dumps({"query": "SELECT '}' FROM a"})
+    args1 = json.dumps({"chart_type": "bar", "x_key": "m"})
+    assert asm.feed([delta(0, "", name="execute_sql", call_id="c0")]) == []
+    assert asm.feed([delta(0, args0[:10])]) == []
+    assert asm.feed([delta(0, args0[10:])]) == [0]
+    # 同一个 chunk 里可能带多个下标的碎片
+    assert asm.feed([delta(1, args1[:5], name="generate_chart", call_id="c1"), delta(1, args1[5:])]) == [1]
+    assert asm.finish() == []
+    assert [c["function"]["arguments"] for c in asm.calls] == [args0, args1]
+    assert [c["id"] for c in asm.calls] == ["c0", "c1"]
+
+
+def test_assembler_closes_unterminated_calls():
+    asm = ToolCallAssembler()
+    asm.feed([delta(0, '{"query": "SELECT 1"', name="execute_sql", call_id="c0")])
+    # 下一个工具开始：前一个即使没闭合也视为完整
+    assert asm.feed([delta(1, "{", name="execute_sql", call_id="c1")]) == [0]
+    assert asm.feed([delta(1, '"query": "SELECT 2"')]) == []
+    assert asm.finish() == [1]
+    assert asm.finish() == []
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "流式工具调用拼接检查通过")
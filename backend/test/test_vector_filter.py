@@ -0,0 +1,131 @@
+"""
+按库过滤检索检查：只返回允许的库里的表、合并后的 top-k 与全局检索结果一致、
+大库走子索引、不带 database 的文档不受过滤、写入后分区同步更新
+(分区按加载 / 追加时记下的 database 重建，不逐条解析负载；分区重建后过期的子索引不进缓存)。
+用哈希 Embedding (test/bench_stubs.py)，不需要下载模型。
+
+用法 (在 backend 目录下)：
+    python test/test_vector_filter.py
+    python -m pytest test/test_vector_filter.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "test"))
+
+from bench_stubs import register_hash_encoder
+from app.vector_store import PayloadStore, VectorStore
+
+DATABASES = ["sales", "hr", "finance", "ops"]
+
+
+def ddl(db: str, table: str) -> dict:
+    cols = f"id,{table}_name,{table}_date,amount"
+    return {"database": db, "table": table, "columns": cols,
+            "ddl_str": f"CREATE TABLE `{table}` (`id` bigint, `{table}_name` varchar(32))"}
+
+
+def build_store(mmap: bool = False, **settings) -> VectorStore:
+    register_hash_encoder()
+    os.environ["EMBEDDING_BACKEND"] = "hash"
+    VectorStore._instance = None
+    VectorStore.DATA_DIR = tempfile.mkdtemp(prefix="vector_filter_test_")
+    VectorStore.PAYLOAD_MMAP, VectorStore.INDEX_TYPE = mmap, "flat"
+    store = VectorStore()
+    for k, v in settings.items():
+        setattr(store, k, v)
+    tables = [ddl(db, f"{db}_t{i}") for db in DATABASES for i in range(30)]
+    store.add_training_batch("ddl", tables)
+    store.add_training_batch("doc", [{"doc": "金额单位为元，日期为下单日期"}])
+    return store
+
+
+def dbs(res) -> set:
+    return {d.split("*/")[0].split("Database:")[1].strip() for d in res["ddl"]}
+
+
+def test_only_allowed_databases_are_returned():
+    store = build_store()
+    try:
+        res = store.retrieve("hr_t3 name amount", top_k=8, databases=["HR", "finance"])
+        assert len(res["ddl"]) == 8 and dbs(res) <= {"hr", "finance"}
+        # 文档不带 database，不受过滤
+        assert res["doc"] == ["金额单位为元，日期为下单日期"]
+        assert store.retrieve("hr_t3", databases=["nope"])["ddl"] == []
+        assert len(store.retrieve("hr_t3", top_k=8)["ddl"]) == 8
+    finally:
+        shutil.rmtree(store.DATA_DIR, ignore_errors=True)
+
+
+def test_merged_top_k_matches_global_search():
+    store = build_store()
+    try:
+        q = store.encode_query("sales_t7 sales_t7_name")
+        full = store.retrieve_by_embedding(q, top_k=3)
+        # 允许全部库时，分区合并的结果与全局索引一致 (哈希向量同分较多，只比前 3)
+        assert store.retrieve_by_embedding(q, top_k=3, databases=DATABASES)["ddl"] == full["ddl"]
+        assert "CREATE TABLE `sales_t7`" in store.retrieve_by_embedding(q, top_k=1, databases=["sales"])["ddl"][0]
+    finally:
+        shutil.rmtree(store.DATA_DIR, ignore_errors=True)
+
+
+def test_large_databases_use_sub_indices():
+    store = build_store(SUBINDEX_MIN_ROWS=20, INDEX_TYPE="fp16")
+    try:
+        q = store.encode_query("finance_t11 finance_t11_name")
+        res = store.retrieve_by_embedding(q, top_k=3, databases=["finance"])
+        assert ("ddl", "finance") in store.sub_indices and len(store.sub_indices) == 1
+        assert "CREATE TABLE `finance_t11`" in res["ddl"][0] and dbs(res) == {"finance"}
+
+        # 新写入的表进入分区，旧的子索引作废
+        store.add_training_batch("ddl", [ddl("finance", "finance_new")])
+        assert len(store.partitions["ddl"]["finance"]) == 31 and not store.sub_indices
+        res = store.retrieve("finance_new finance_new_name", top_k=1, databases=["finance"])
+        assert "CREATE TABLE `finance_new`" in res["ddl"][0]
+    finally:
+        shutil.rmtree(store.DATA_DIR, ignore_errors=True)
+
+
+def test_partitions_do_not_parse_payloads():
+    store = build_store(mmap=True)
+    original, parsed = PayloadStore.__getitem__, []
+
+    def counting(self, i):
+        parsed.append(i)
+        return original(self, i)
+
+    PayloadStore.__getitem__ = counting
+    try:
+        store.add_training_batch("ddl", [ddl("hr", "hr_new")])
+        # 只解析新增的那一条 (编码)，分区不再逐条读负载
+        assert parsed == [120] and len(store.partitions["ddl"]["hr"]) == 31
+        res = store.retrieve("hr_new hr_new_name", top_k=1, databases=["hr"])
+        assert "CREATE TABLE `hr_new`" in res["ddl"][0]
+    finally:
+        PayloadStore.__getitem__ = original
+        VectorStore.PAYLOAD_MMAP = False
+        shutil.rmtree(store.DATA_DIR, ignore_errors=True)
+
+
+def test_stale_sub_index_is_not_cached():
+    store = build_store(SUBINDEX_MIN_ROWS=20)
+    try:
+        stale = store.partitions["ddl"]["finance"]
+        # 检索线程拿到旧分区后，写入线程重建了分区：旧 id 上建的子索引只给这次检索用
+        store.add_training_batch("ddl", [ddl("finance", "finance_new")])
+        sub = store._sub_index("ddl", "finance", stale)
+        assert sub.ntotal == 30 and not store.sub_indices
+        fresh = store.partitions["ddl"]["finance"]
+        assert store._sub_index("ddl", "finance", fresh).ntotal == 31
+        assert store.sub_indices[("ddl", "finance")][0] is fresh
+    finally:
+        shutil.rmtree(store.DATA_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "按库过滤检索检查通过")
@@ -0,0 +1,205 @@
+"""
+VectorStore 检查：并发的首次调用只加载一份实例，且拿到的都是初始化完成的实例；
+Sidecar 的检索之间并发、写入时独占 (不与检索交错)；
+磁盘向量缓存校验通过才复用 (负载被改写 / 换模型时重新编码)，追加只编码新增条目、增量加入索引；
+mmap 负载追加时检索线程照常读取。
+用哈希 Embedding (test/bench_stubs.py)，不需要下载模型。
+
+用法 (在 backend 目录下)：
+    python test/test_vector_store.py
+    python -m pytest test/test_vector_store.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "test"))
+
+from bench_stubs import register_hash_encoder
+from app.vector_service import ReadWriteLock, VectorService
+from app.vector_store import PayloadStore, VectorStore
+
+
+def fresh_store_dir() -> str:
+    register_hash_encoder()
+    os.environ["EMBEDDING_BACKEND"] = "hash"
+    VectorStore._instance = None
+    VectorStore.DATA_DIR = tempfile.mkdtemp(prefix="vector_store_test_")
+    VectorStore.PAYLOAD_MMAP, VectorStore.INDEX_TYPE = False, "flat"
+    return VectorStore.DATA_DIR
+
+
+def test_concurrent_first_use_loads_once():
+    data_dir = fresh_store_dir()
+    original = VectorStore._init_store
+    loads = []
+
+    def slow_init(self):
+        loads.append(self)
+        time.sleep(0.2)  # 模拟加载模型 + 索引
+        original(self)
+
+    VectorStore._init_store = slow_init
+    try:
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(VectorStore())) for _ in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(loads) == 1
+        assert all(s is seen[0] for s in seen) and all(hasattr(s, "indices") for s in seen)
+    finally:
+        VectorStore._init_store = original
+        VectorStore._instance = None
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+class CountingEncoder:
+    """包一层哈希 Embedding，记录编码过的文本"""
+
+    def __init__(self, inner, model_id=None):
+        self.inner, self.name = inner, inner.name
+        self.model_id = model_id or inner.model_id
+        self.seen = []
+
+    def encode(self, texts, batch_size: int = 32):
+        self.seen += list(texts)
+        return self.inner.encode(texts, batch_size=batch_size)
+
+
+def reopen(data_dir: str, model_id=None) -> VectorStore:
+    """模拟进程重启：同一个 DATA_DIR 重新加载，换上计数的编码器"""
+    from app import vector_store
+    from app.encoder import load_encoder
+    original = vector_store.load_encoder
+    encoder = CountingEncoder(load_encoder(backend="hash"), model_id)
+    vector_store.load_encoder = lambda: encoder
+    try:
+        VectorStore._instance = None
+        VectorStore.DATA_DIR = data_dir
+        return VectorStore()
+    finally:
+        vector_store.load_encoder = original
+
+
+def docs(*names) -> list:
+    return [{"doc": f"文档 {n}"} for n in names]
+
+
+def test_vector_cache_reuse_and_invalidation():
+    data_dir = fresh_store_dir()
+    try:
+        store = reopen(data_dir)
+        store.add_training_batch("doc", docs(1, 2, 3))
+        assert store.model.seen == ["文档 1", "文档 2", "文档 3"]
+
+        # 追加只编码新增的条目，索引增量加入，检索能找到
+        old_index = store.indices["doc"]
+        store.add_training_batch("doc", docs(4))
+        assert store.model.seen[-1:] == ["文档 4"] and len(store.model.seen) == 4
+        assert store.indices["doc"] is not old_index and store.indices["doc"].ntotal == 4
+        assert store.retrieve("文档 4", top_k=1)["doc"][0] == "文档 4"
+
+        # 重启：缓存校验通过，一条都不重新编码
+        store = reopen(data_dir)
+        assert store.model.seen == [] and store.indices["doc"].ntotal == 4
+
+        # 负载被改写 (条数不变，内容变了)：摘要对不上，全部重新编码
+        path = os.path.join(data_dir, "index_doc.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([dict(d, emb_text=d["doc"]) for d in docs(1, 2, 5, 4)], f, ensure_ascii=False)
+        store = reopen(data_dir)
+        assert store.model.seen == ["文档 1", "文档 2", "文档 5", "文档 4"]
+
+        # 同一个后端换了模型：model 对不上，全部重新编码
+        store = reopen(data_dir, model_id="hash:another-model")
+        assert len(store.model.seen) == 4
+        assert store.retrieve("文档 5", top_k=1)["doc"][0] == "文档 5"
+    finally:
+        VectorStore._instance = None
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def test_payload_reads_during_appends():
+    data_dir = tempfile.mkdtemp(prefix="payload_store_test_")
+    try:
+        store = PayloadStore(os.path.join(data_dir, "index_doc.jsonl"))
+        for i in range(50):
+            store.append({"doc": f"文档 {i}"})
+        stop, errors = threading.Event(), []
+
+        def read():
+            # 模拟检索线程：一直按 id 读负载，同时写入线程在追加
+            while not stop.is_set():
+                try:
+                    for i in range(0, len(store), 7):
+                        assert store[i] == {"doc": f"文档 {i}"}
+                    assert store[-1]["doc"].startswith("文档 ")
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for t in readers: t.start()
+        for i in range(50, 550):
+            store.append({"doc": f"文档 {i}"})
+        stop.set()
+        for t in readers: t.join()
+        assert not errors, errors[:3]
+        assert len(store) == 550 and store[549] == {"doc": "文档 549"}
+        # 重新打开：偏移量和追加时记下的一致
+        assert PayloadStore(store.path)[300] == {"doc": "文档 300"}
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+class RecordingStore:
+    """记录检索和写入是否交错"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reading = self.peak_reading = 0
+        self.overlaps = 0
+        self.writing = False
+
+    def retrieve(self, query, top_k=8, databases=None):
+        with self.lock:
+            self.overlaps += self.writing
+            self.reading += 1
+            self.peak_reading = max(self.peak_reading, self.reading)
+        time.sleep(0.05)
+        with self.lock:
+            self.reading -= 1
+        return {}
+
+    def add_training_data(self, dtype, content):
+        with self.lock:
+            self.overlaps += bool(self.reading)
+            self.writing = True
+        time.sleep(0.05)
+        with self.lock:
+            self.writing = False
+        return True
+
+
+def test_sidecar_writes_exclude_reads():
+    service = object.__new__(VectorService)
+    service.store = RecordingStore()
+    service._lock = ReadWriteLock()
+    reqs = [{"op": "retrieve", "query": "q"}] * 12
+    reqs[4] = reqs[8] = {"op": "add", "dtype": "doc", "content": {"doc": "x"}}
+    threads = [threading.Thread(target=service._dispatch, args=(r,)) for r in reqs]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert service.store.overlaps == 0
+    assert service.store.peak_reading > 1
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "VectorStore 检查通过")
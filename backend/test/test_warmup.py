@@ -0,0 +1,59 @@
+"""
+启动预热检查：必需阶段 (向量索引、LLM 客户端) 失败时不标记 ready，
+其余阶段 (数据库连接池等) 失败只记录到 errors、不影响 ready。
+各阶段用替身，不需要数据库和模型。
+
+用法 (在 backend 目录下)：
+    python test/test_warmup.py
+    python -m pytest test/test_warmup.py
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app import warmup
+from app.warmup import Readiness
+
+PHASES = ("get_vector_store", "_warm_llm_client", "_warm_encoder", "_warm_intent_router", "_warm_db_pools")
+
+
+def ok():
+    return None
+
+
+def broken():
+    raise RuntimeError("boom")
+
+
+def run_with(**overrides) -> bool:
+    saved = {name: getattr(warmup, name) for name in PHASES}
+    try:
+        for name in PHASES:
+            setattr(warmup, name, overrides.get(name, ok))
+        Readiness.ready, Readiness.phases, Readiness.errors = False, {}, {}
+        warmup.warm_up()
+        return Readiness.ready
+    finally:
+        for name, fn in saved.items():
+            setattr(warmup, name, fn)
+
+
+def test_optional_phase_failure_is_degraded_but_ready():
+    assert run_with(_warm_db_pools=broken, _warm_intent_router=broken)
+    assert set(Readiness.errors) == {"db_pools", "intent_router"}
+    assert {"vector_store", "llm_client", "db_pools", "total"} <= set(Readiness.phases)
+
+
+def test_required_phase_failure_is_not_ready():
+    assert not run_with(get_vector_store=broken)
+    assert Readiness.errors == {"vector_store": "boom"}
+    assert not run_with(_warm_llm_client=broken)
+    assert Readiness.errors == {"llm_client": "boom"}
+    assert run_with()
+
+
+if __name__ == "__main__":
+    from runner import run_tests
+    run_tests(globals(), "启动预热检查通过")
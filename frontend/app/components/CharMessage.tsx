@@ -135,6 +135,13 @@ export default function ChatMessage({ msg }: ChatMessageProps) {
                             </div>
                         ) : (
                             <>
+                                {/* 0. 排队提示 */}
+                                {msg.queueStatus && (
+                                    <div className='mb-2 text-xs text-amber-600 animate-pulse'>
+                                        ⏳ {msg.queueStatus}
+                                    </div>
+                                )}
+
                                 {/* 1. Markdown 文本 */}
                                 {msg.content ? (
                                     <div className='prose prose-sm max-w-none prose-p:my-1 prose-headings:my-2'>
@@ -4,10 +4,30 @@ import React, { useState, useRef, useEffect } from 'react'
 import { Message } from './types'
 import ChatMessage from './components/CharMessage'
 
+// http 页面不是安全上下文，没有 crypto.randomUUID，退回 getRandomValues
+function randomId(): string {
+    if (typeof crypto.randomUUID === 'function') return crypto.randomUUID()
+    const bytes = crypto.getRandomValues(new Uint8Array(16))
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('')
+}
+
+// 同一个浏览器固定一个用户标识 (存 localStorage)：后端按 用户 + session_id 隔离会话结果表和 Prompt 前缀
+function browserUserId(): string {
+    const key = 'rag_user_id'
+    let id = localStorage.getItem(key)
+    if (!id) {
+        id = randomId()
+        localStorage.setItem(key, id)
+    }
+    return id
+}
+
 export default function App() {
     const [input, setInput] = useState('')
     const [messages, setMessages] = useState<Message[]>([])
     const [isLoading, setIsLoading] = useState(false)
+    // 一个页面一个会话：多轮请求带同一个 session_id (刷新页面即新会话)
+    const sessionIdRef = useRef('')
 
     const bottomRef = useRef<HTMLDivElement>(null)
 
@@ -36,6 +56,8 @@ export default function App() {
             }
             setMessages(prev => [...prev, aiMsgPlaceholder])
 
+            if (!sessionIdRef.current) sessionIdRef.current = randomId()
+
             const historyToSend = [...messages, userMsg].map(m => ({
                 role: m.role,
                 content: m.content,
@@ -46,11 +68,28 @@ export default function App() {
                 {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ messages: historyToSend }),
+                    body: JSON.stringify({
+                        messages: historyToSend,
+                        session_id: sessionIdRef.current,
+                        user_id: browserUserId(),
+                    }),
                 }
             )
 
-            if (!response.ok) throw new Error(response.statusText)
+            if (response.status === 429) {
+                // 准入控制：开流前就排不上 (队列满 / 预计等待太久)，按 Retry-After 提示稍后重试
+                const retryAfter = response.headers.get('Retry-After')
+                const body = await response.json().catch(() => ({}))
+                throw new Error(
+                    `服务繁忙 (${body.reason || 'busy'})，请${
+                        retryAfter ? ` ${retryAfter} 秒后` : '稍后'
+                    }重试`
+                )
+            }
+            if (!response.ok) {
+                const detail = await response.text().catch(() => '')
+                throw new Error(detail || response.statusText)
+            }
             if (!response.body) throw new Error('No response body')
 
             const reader = response.body.getReader()
@@ -79,6 +118,17 @@ export default function App() {
                             const newMsgs = [...prev]
                             const lastMsg = {...newMsgs[newMsgs.length - 1]}
 
+                            // 0. 排队位置：只更新提示，拿到名额后的第一个事件会清掉它
+                            if (data.type === 'queue') {
+                                lastMsg.queueStatus = `排队中：第 ${
+                                    data.position
+                                } 位，预计等待 ${Math.ceil(
+                                    (data.estimated_wait_ms || 0) / 1000
+                                )} 秒`
+                                return [...newMsgs.slice(0, -1), lastMsg]
+                            }
+                            if (data.type !== 'ping') lastMsg.queueStatus = undefined
+
                             // A. 文本追加 (保持不变)
                             if (data.type === 'text') {
                                 lastMsg.content += data.content
@@ -137,6 +187,17 @@ export default function App() {
                                     }
                                 }
                             }
+                            // F. 服务端错误：code=429 是没排上 / 排队超时，其余是执行出错
+                            else if (data.type === 'error') {
+                                lastMsg.content +=
+                                    data.code === 429
+                                        ? `\n\n⏳ 服务繁忙 (${data.reason})，请${
+                                              data.retry_after
+                                                  ? ` ${data.retry_after} 秒后`
+                                                  : '稍后'
+                                          }重试`
+                                        : `\n\n❌ Error: ${data.content}`
+                            }
 
                             return [...newMsgs.slice(0, -1), lastMsg]
                         })
@@ -31,4 +31,6 @@ export interface Document {
     chartData?: any[];
     chartConfig?: ChartConfig;
     retrievedDocs?: Document[];
+    // 排队中的提示 (准入控制推送的 queue 事件)，开始执行后清空
+    queueStatus?: string;
   }
\ No newline at end of file